@@ -0,0 +1,241 @@
+"""
+Benchmark suite
+
+Times every transformer, as well as `read_stdin` and `read_files`, on
+synthetic inputs (see `benchmarks.synthetic`). Each run of a benchmark happens
+in a fresh interpreter so that its peak memory is its own. Results are written
+as JSON along with the commit they were measured on, and two result files can
+be compared with `--compare`.
+
+Common usage:
+  python -m benchmarks.run --scale small
+  python -m benchmarks.run --scale large --only cut vcf_a --repeat 3
+  python -m benchmarks.run --compare before.json after.json
+"""
+
+import argparse
+import fileinput
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Sizes of the synthetic inputs at each scale
+SCALES = {
+  'tiny': { 'lines': 20, 'traits': 3, 'loyrs': 4, 'individuals': 10, 'snps': 200, 'chromosomes': 3 },
+  'small': { 'lines': 500, 'traits': 10, 'loyrs': 40, 'individuals': 100, 'snps': 50000, 'chromosomes': 9 },
+  'medium': { 'lines': 2000, 'traits': 25, 'loyrs': 80, 'individuals': 500, 'snps': 500000, 'chromosomes': 9 },
+  'large': { 'lines': 5000, 'traits': 50, 'loyrs': 120, 'individuals': 1000, 'snps': 4000000, 'chromosomes': 9 },
+}
+
+
+def generate(datadir, scale, seed = 0):
+  """Write the synthetic inputs of a scale, unless they already exist
+
+  Args:
+    datadir (String): directory to write the inputs to
+    scale (dict): sizes of the inputs (see `SCALES`)
+    seed (Int): random seed
+
+  Returns (dict):
+    Name of each input -> path
+  """
+  os.makedirs(datadir, exist_ok = True)
+  paths = {
+    'csv': os.path.join(datadir, 'long_format.csv'),
+    'csv_a': os.path.join(datadir, 'loyr_rows.csv'),
+    'genotypes': os.path.join(datadir, 'panel.012'),
+  }
+  paths['positions'] = f"{paths['genotypes']}.pos"
+  paths['individuals'] = f"{paths['genotypes']}.indv"
+  stamp = os.path.join(datadir, 'scale.json')
+  expected = dict(scale, seed = seed)
+  if os.path.exists(stamp):
+    with open(stamp) as ifp:
+      if json.load(ifp) == expected:
+        return paths
+
+  synthetic.long_format_csv(paths['csv'], scale['lines'], scale['traits'], scale['loyrs'], seed = seed)
+  synthetic.loyr_rows_csv(paths['csv_a'], scale['lines'], scale['traits'], scale['loyrs'], seed = seed)
+  synthetic.panel_012(paths['genotypes'], scale['individuals'], scale['snps'], scale['chromosomes'], seed = seed)
+  with open(stamp, 'w') as ofp:
+    json.dump(expected, ofp)
+  return paths
+
+
+def _main_args(argv):
+  sys.path.insert(0, ROOT)
+  from main import parseOptions
+  return parseOptions(argv)
+
+def _bench_read_stdin(paths, workdir):
+  from modules.helpers import read_stdin
+  with open(paths['csv'], 'r') as fp:
+    read_stdin(fp, ',')
+
+def _bench_read_files(paths, workdir):
+  from modules.helpers import read_files
+  fp = fileinput.FileInput([paths['csv']])
+  try:
+    read_files(fp, ',')
+  finally:
+    fp.close()
+
+def _bench_main(name):
+  def bench(paths, workdir):
+    from main import process
+    process(_main_args(['-t', name, '-o', os.path.join(workdir, name), paths[name]]))
+  return bench
+
+def _bench_cut(paths, workdir):
+  from modules.transformer import cut
+  cut.process(cut.parseOptions(['-g', paths['genotypes'], '-p', paths['positions'], '-i', paths['individuals'],
+                                '-o', os.path.join(workdir, 'cut'), '-n', 'bench']))
+
+def _bench_vcf_a(paths, workdir):
+  from modules.transformer import vcf_a
+  # vcf_a writes its temporary file to the working directory
+  os.chdir(workdir)
+  args = argparse.Namespace(files = [paths['positions']], vcf_input = paths['genotypes'])
+  vcf_a.process(args)
+
+BENCHMARKS = {
+  'read_stdin': _bench_read_stdin,
+  'read_files': _bench_read_files,
+  'csv': _bench_main('csv'),
+  'csv_a': _bench_main('csv_a'),
+  'cut': _bench_cut,
+  'vcf_a': _bench_vcf_a,
+}
+
+
+def _run_one(name, paths, workdir):
+  """Run a single benchmark. Called in a fresh interpreter."""
+  sys.path.insert(0, ROOT)
+  import contextlib
+  import io
+  from modules import profiling
+  # Loading pandas is not part of what is measured
+  import pandas
+  baseline = profiling.peak_rss()
+  profiler = profiling.enable()
+  start = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    BENCHMARKS[name](paths, workdir)
+  seconds = time.perf_counter() - start
+  peak = profiling.peak_rss()
+  return {
+    'seconds': seconds,
+    'peak_rss': peak,
+    'peak_rss_increase': None if peak is None else peak - baseline,
+    'stages': profiler.report()['stages'],
+  }
+
+def run(names, paths, repeat = 1):
+  """Run benchmarks, each `repeat` times in a fresh interpreter
+
+  Returns (dict):
+    Name -> best time, largest peak memory and the stages of the fastest run
+  """
+  context = multiprocessing.get_context('spawn')
+  results = {}
+  for name in names:
+    runs = []
+    for _ in range(repeat):
+      with tempfile.TemporaryDirectory() as workdir, context.Pool(1) as pool:
+        runs.append(pool.apply(_run_one, (name, paths, workdir)))
+    fastest = min(runs, key = lambda r: r['seconds'])
+    results[name] = {
+      'seconds': fastest['seconds'],
+      'all_seconds': [ r['seconds'] for r in runs ],
+      'peak_rss': max((r['peak_rss'] or 0) for r in runs),
+      'peak_rss_increase': max((r['peak_rss_increase'] or 0) for r in runs),
+      'stages': fastest['stages'],
+    }
+    print(f"{name:>12}: {fastest['seconds']:9.3f}s  peak RSS +{results[name]['peak_rss_increase'] / 2**20:,.1f} MiB")
+  return results
+
+def commit():
+  """Commit the benchmarks were run on, or None outside of a git checkout"""
+  try:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = ROOT, capture_output = True, text = True)
+    return result.stdout.strip() or None
+  except OSError:
+    return None
+
+def compare(before, after):
+  """Print the change in time and memory of every benchmark between two result
+  files"""
+  with open(before) as ifp:
+    a = json.load(ifp)
+  with open(after) as ifp:
+    b = json.load(ifp)
+  print(f"{'benchmark':>12}  {a.get('commit')!s:>10} -> {b.get('commit')!s:<10}  time     memory")
+  for name in a['results']:
+    if name not in b['results']:
+      continue
+    x, y = a['results'][name], b['results'][name]
+    time_ratio = y['seconds'] / x['seconds'] if x['seconds'] else float('nan')
+    memory_ratio = y['peak_rss_increase'] / x['peak_rss_increase'] if x['peak_rss_increase'] else float('nan')
+    print(f"{name:>12}  {x['seconds']:9.3f}s -> {y['seconds']:9.3f}s  {time_ratio:6.2f}x  {memory_ratio:6.2f}x")
+
+def parseOptions(argv = None):
+  """
+  Function to parse user-provided options from terminal
+
+  Args:
+    argv (List): arguments to parse, defaults to those given on the terminal
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--scale", default = "small", choices = list(SCALES),
+                      help = "Size of the synthetic inputs")
+  parser.add_argument("--only", nargs = "+", default = None, choices = list(BENCHMARKS),
+                      help = "Benchmarks to run. All of them by default")
+  parser.add_argument("--repeat", default = 1, type = int,
+                      help = "Number of times each benchmark is run; the fastest run is reported")
+  parser.add_argument("--seed", default = 0, type = int, help = "Random seed of the synthetic inputs")
+  parser.add_argument("--data-dir", default = None,
+                      help = "Directory in which the synthetic inputs are kept between runs")
+  parser.add_argument("-o", "--output", default = None,
+                      help = "Path of the JSON results. Defaults to benchmarks/results/COMMIT-SCALE.json")
+  parser.add_argument("--compare", nargs = 2, default = None, metavar = ("BEFORE", "AFTER"),
+                      help = "Compare two result files instead of running benchmarks")
+  return parser.parse_args(argv)
+
+def main(argv = None):
+  args = parseOptions(argv)
+  if args.compare is not None:
+    compare(*args.compare)
+    return None
+
+  scale = SCALES[args.scale]
+  datadir = args.data_dir or os.path.join(tempfile.gettempdir(), f'crusty_thyme_benchmarks_{args.scale}_{args.seed}')
+  print(f"Generating {args.scale} inputs in {datadir}")
+  paths = generate(datadir, scale, args.seed)
+  names = args.only or list(BENCHMARKS)
+  report = {
+    'commit': commit(),
+    'scale': args.scale,
+    'sizes': scale,
+    'seed': args.seed,
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'results': run(names, paths, args.repeat),
+  }
+  output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"{report['commit'] or 'unknown'}-{args.scale}.json")
+  os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+  with open(output, 'w') as ofp:
+    json.dump(report, ofp, indent = 2)
+  print(f"Results written to {output}")
+  return report
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,127 @@
+"""
+Synthetic input generators
+
+Every generator is deterministic for a given seed, so that benchmark results
+can be compared across commits. The shapes follow the real inputs of each
+transformer:
+
+  long_format_csv   `csv`:   Pedigree, trait_LOYR, trait_LOYR, ...
+  loyr_rows_csv     `csv_a`: Pedigree, loc, trait, trait, ...
+  panel_012         `cut` and `vcf_a`: .012, .012.pos and .012.indv
+"""
+
+import numpy as np
+
+LOCATIONS = ['FL', 'PU', 'MO', 'WR', 'NY', 'IA', 'NE', 'KS', 'IL', 'IN', 'OH', 'MI']
+
+
+def location_years(count):
+  """Build `count` distinct location-year (LOYR) codes
+
+  Example cases:
+    >>> location_years(3)
+    ['FL06', 'PU06', 'MO06']
+  """
+  loyrs = []
+  for i in range(count):
+    location = LOCATIONS[i % len(LOCATIONS)]
+    year = (6 + i // len(LOCATIONS)) % 100
+    loyrs.append(f'{location}{year:02d}')
+  return loyrs
+
+def _lines(count):
+  return [ f'LINE_{i:07d}' for i in range(count) ]
+
+def _format_row(values):
+  return ','.join('NA' if np.isnan(v) else repr(float(v)) for v in values)
+
+def long_format_csv(path, lines, traits, loyrs, grown = 0.25, missing = 0.05, seed = 0):
+  """Write a long-format table for the `csv` transformer
+
+  Args:
+    path (String): path of the file to write
+    lines (Int): number of lines (rows)
+    traits (Int): number of traits
+    loyrs (Int): number of location-years; there are `traits * loyrs` columns
+    grown (Float): fraction of location-years each line was grown in
+    missing (Float): fraction of measurements missing within a grow-out
+    seed (Int): random seed
+  """
+  rng = np.random.default_rng(seed)
+  codes = location_years(loyrs)
+  header = ['Pedigree'] + [ f'trait{t}_{code}' for code in codes for t in range(traits) ]
+  with open(path, 'w') as ofp:
+    ofp.write(','.join(header) + '\n')
+    for line in _lines(lines):
+      values = rng.normal(size = traits * loyrs).round(6)
+      # Lines that were not grown in a location-year have no values at all
+      not_grown = np.repeat(rng.random(loyrs) >= grown, traits)
+      values[not_grown | (rng.random(values.size) < missing)] = np.nan
+      ofp.write(f'{line},{_format_row(values)}\n')
+
+def loyr_rows_csv(path, lines, traits, loyrs, grown = 0.5, missing = 0.05, seed = 0):
+  """Write a table with one row per line and location-year for the `csv_a`
+  transformer
+
+  Args:
+    path (String): path of the file to write
+    lines (Int): number of distinct lines
+    traits (Int): number of traits (columns)
+    loyrs (Int): number of location-years
+    grown (Float): fraction of location-years each line was grown in
+    missing (Float): fraction of measurements missing
+    seed (Int): random seed
+  """
+  rng = np.random.default_rng(seed)
+  codes = location_years(loyrs)
+  header = ['Pedigree', 'loc'] + [ f'trait{t}' for t in range(traits) ]
+  with open(path, 'w') as ofp:
+    ofp.write(','.join(header) + '\n')
+    for code in codes:
+      for line in _lines(lines):
+        if rng.random() >= grown:
+          continue
+        values = rng.normal(size = traits).round(6)
+        values[rng.random(traits) < missing] = np.nan
+        ofp.write(f'{line},{code},{_format_row(values)}\n')
+
+def panel_012(prefix, individuals, snps, chromosomes, missing = 0.01, seed = 0, block = 65536):
+  """Write a genotype panel in the format of `vcftools --012`
+
+  Args:
+    prefix (String): path of the .012 file; `.pos` and `.indv` are appended
+                     for the other two files
+    individuals (Int): number of individuals (rows)
+    snps (Int): number of SNPs (columns)
+    chromosomes (Int): number of chromosomes the SNPs are spread over
+    missing (Float): fraction of missing calls (-1)
+    seed (Int): random seed
+    block (Int): number of SNPs generated at a time
+  """
+  rng = np.random.default_rng(seed)
+
+  with open(f'{prefix}.indv', 'w') as ofp:
+    for line in _lines(individuals):
+      ofp.write(f'{line}\n')
+
+  # Chromosomes get near-equal shares of the SNPs, in increasing position
+  bounds = np.linspace(0, snps, chromosomes + 1).astype(int)
+  with open(f'{prefix}.pos', 'w') as ofp:
+    for c in range(chromosomes):
+      count = bounds[c + 1] - bounds[c]
+      positions = np.cumsum(rng.integers(1, 500, size = count))
+      name = f'Chr_{c + 1:02d}'
+      ofp.writelines(f'{name}\t{p}\n' for p in positions)
+
+  # Each SNP has its own allele frequency, so columns differ from each other
+  frequencies = rng.uniform(0.05, 0.95, size = snps)
+  lookup = np.array(['0', '1', '2', '-1'])
+  with open(prefix, 'w') as ofp:
+    for row in range(individuals):
+      cells = []
+      for start in range(0, snps, block):
+        p = frequencies[start:start + block]
+        calls = (rng.random(p.size) < p).astype(np.int8) + (rng.random(p.size) < p).astype(np.int8)
+        calls[rng.random(p.size) < missing] = 3
+        cells.append('\t'.join(lookup[calls].tolist()))
+      ofp.write(f'{row}\t' + '\t'.join(cells) + '\n')
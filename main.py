@@ -21,29 +21,106 @@ Background:
 
 import argparse
 import datetime
-import importlib
+import json
 import os
+import sys
 from pprint import pprint
 
+from modules import parallel
+from modules import pipeline
+from modules import profiling
+from modules.memory import parse_size
+from modules import transformer as transformers
+from modules import writers
+from modules.manifest import Manifest, frame_digest, run_options
+
+
+def write_output(args, filename, data, manifest = None):
+  """Write a single output of a transformer
+
+  Args:
+    args (Namespace): arguments supplied by user
+    filename (String): name of the output (e.g., 'FL_2006.csv')
+    data (DataFrame): content of the output
+    manifest (Manifest): manifest of an incremental run, or None
+
+  Returns (String):
+    Path of the file that was written, or None if it was left untouched
+  """
+  if (args.verbose):
+    pprint({ 'filename': filename, 'data': data })
+  if manifest is not None:
+    # Leave outputs whose content did not change untouched
+    output = writers.output_filename(filename, args.format)
+    digest = frame_digest(data)
+    manifest.record(output, digest)
+    if manifest.is_current(output, digest):
+      return None
+  with profiling.stage('write') as stage:
+    path = writers.write(data, args.outdir, filename, args.format)
+    stage.rows, stage.columns = data.shape
+    stage.bytes = os.path.getsize(path)
+  return path
 
 def process(args):
-  try:
-    # Determine the type of transformer to use
-    directory = './modules/transformer'
-    transformers = set([ f[:-3] for f in os.listdir(directory) if not f.startswith('_') and f.endswith('.py') ])
-    modulepath = directory.replace('.', '').replace('/', '', 1).replace('/', '.')
+  """Run a transformer and write its output
+
+  Args:
+    args (Namespace): arguments supplied by user
 
+  Returns (List):
+    Paths of the files that were written
+  """
+  written = []
+  try:
     # Import the user-specified transformer if it exists
-    if args.transformer not in transformers:
-      if args.transformer is None:
-        raise Exception("No transformer was supplied. Cannot process data. Aborting.")
-      else:
-        raise Exception("Unknown transformer. Aborting.")
-    else:
-      transformer = importlib.import_module(f'{modulepath}.{args.transformer}')
+    transformer = transformers.load(args.transformer)
+
+    # Fail before any data is processed if the output format cannot be written
+    writers.check_format(args.format)
+
+    # Describe the input, reading as little of it as possible
+    if args.inspect:
+      if not hasattr(transformer, 'inspect'):
+        raise Exception(f"The `{args.transformer}` transformer cannot inspect its input. Aborting.")
+      print(json.dumps(transformer.inspect(args), indent = 2))
+      return written
+
+    # Check the outputs of a previous run against the input, rather than
+    # writing them
+    if args.verify:
+      if not hasattr(transformer, 'verify'):
+        raise Exception(f"The `{args.transformer}` transformer cannot verify its outputs. Aborting.")
+      report = transformer.verify(args)
+      report.check()
+      print(report.summary())
+      return written
+
+    # When rerunning into the same output directory, skip the run altogether
+    # if neither the inputs nor the options changed. Transformers with their
+    # own command line (e.g., cut) keep their own manifest.
+    manifest = None
+    if args.incremental and not hasattr(transformer, 'parseOptions'):
+      manifest = Manifest(args.outdir, args.transformer, run_options(args), args.files)
+      if manifest.unchanged():
+        pprint(f"Outputs in {args.outdir} are up to date")
+        return written
 
-    # Pass args to the chosen transformer and get back resultant data
-    dfs = transformer.process(args)
+    # Outputs are split and written on worker processes, which share the
+    # memory of the input, when the transformer supports it
+    shared = None
+    if args.split_workers > 1 and args.debug is False and hasattr(transformer, 'split_tasks'):
+      shared = transformer.split_tasks(args)
+
+    outputs = None
+    if shared is None:
+      # Outputs are built one at a time (when the transformer supports it), and
+      # each is dropped once written
+      outputs = transformers.outputs(transformer, args)
+      # Transformers that write their own output (e.g., cut) do not hand any
+      # data back
+      if outputs is None:
+        return written
 
     # Output the files
     if args.debug is False:
@@ -52,23 +129,45 @@ def process(args):
           os.makedirs(args.outdir)
       except:
         raise
-      for df in dfs.keys():
-        if (args.verbose):
-          pprint(dfs[df])
-        dfs[df]['data'].to_csv(os.path.join(str(args.outdir), dfs[df]['filename']))
-      pprint(f"Created {len(dfs.keys())} files in {args.outdir}")
+      if shared is not None:
+        paths = []
+        for filename, digest, path in parallel.split(shared, args.outdir, args.format, args.split_workers, manifest):
+          if manifest is not None:
+            manifest.record(filename, digest)
+          paths.append(path)
+        del shared
+      elif args.pipeline:
+        paths = pipeline.run(outputs, lambda output: write_output(args, *output, manifest), args.writers, args.queue_size)
+      else:
+        paths = []
+        for filename, data in outputs:
+          paths.append(write_output(args, filename, data, manifest))
+          del data
+      written = [ path for path in paths if path is not None ]
+      skipped = len(paths) - len(written)
+      if manifest is not None:
+        manifest.remove_stale()
+        manifest.save()
+      pprint(f"Created {len(written)} files in {args.outdir}" + (f" ({skipped} unchanged)" if skipped else ""))
     else:
-      for df in dfs.keys():
+      count = 0
+      for filename, data in outputs:
+        count += 1
         if (args.verbose):
-          pprint(dfs[df])
-      pprint(f"Output {len(dfs.keys())} datasets")
+          pprint({ 'filename': filename, 'data': data })
+      pprint(f"Output {count} datasets")
 
   except:
     raise 
 
-def parseOptions():
+  return written
+
+def parseOptions(argv = None):
   """
   Function to parse user-provided options from terminal
+
+  Args:
+    argv (List): arguments to parse, defaults to those given on the terminal
   """
   parser = argparse.ArgumentParser()
   parser.add_argument('files', metavar='FILE', nargs='*',
@@ -77,13 +176,49 @@ def parseOptions():
                       help="Increase output verbosity")
   parser.add_argument("-o", "--outdir", default = f"output_{datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}",
                       help="Path of output directory")
-  directory = './lib/transformer'
-  transformers = list(set([ f[:-3] for f in os.listdir(directory) if not f.startswith('_') and f.endswith('.py') ]))
-  parser.add_argument("-t", "--transformer", default = None, help = f"Name of the format transformer to use. List of available transformers: {transformers}")
+  parser.add_argument("-t", "--transformer", default = None, help = f"Name of the format transformer to use. List of available transformers: {transformers.available()}")
   parser.add_argument("--vcf_input", default = None, help = f"Path to the VCF file that contains genotype data for all chromosomes. Required for vcf_* transformers")
+  parser.add_argument("-f", "--format", default = writers.DEFAULT_FORMAT, choices = list(writers.FORMATS),
+                      help = "Output file format. Parquet and Feather require pyarrow, csv.zst requires zstandard")
+  parser.add_argument("--inverse", nargs = "?", const = "long_format", default = None, metavar = "NAME",
+                      help = "csv transformer only: rebuild a long-format table from per-location-year files (or directories of them), written as NAME.csv (default: long_format)")
+  parser.add_argument("--sparse", action = "store_true",
+                      help = "csv transformer only: hold the traits as sparse columns while splitting, so that memory use follows the number of values present rather than lines x traits")
+  parser.add_argument("--max-memory", default = None, type = parse_size, metavar = "SIZE",
+                      help = "Memory budget (e.g., 4G). Inputs that do not fit are read in chunks and spilled to disk")
+  parser.add_argument("--spill-dir", default = None,
+                      help = "Directory for data spilled to disk under --max-memory. Defaults to the temporary directory")
+  parser.add_argument("--pipeline", action = "store_true",
+                      help = "Read the input in chunks on another thread while the previous chunk is split, and write outputs on other threads while the next ones are assembled")
+  parser.add_argument("--writers", default = 2, type = int,
+                      help = "Number of threads writing outputs with --pipeline")
+  parser.add_argument("--queue-size", default = 2, type = int,
+                      help = "Number of built outputs that may wait to be written with --pipeline. Bounds memory use")
+  parser.add_argument("--split-workers", default = 1, type = int,
+                      help = "Number of processes splitting and writing outputs. The input is shared between them rather than copied")
+  parser.add_argument("--inspect", action = "store_true",
+                      help = "Print the shape and metadata of the input (as JSON), reading as little of it as possible, instead of running the transformer")
+  parser.add_argument("--verify", action = "store_true",
+                      help = "Check the outputs in OUTDIR against the input instead of writing them, and fail if any value differs")
+  parser.add_argument("--incremental", action = "store_true",
+                      help = "Skip the run if neither the inputs nor the options changed since the last one into OUTDIR. Otherwise the whole input is split again, and only the outputs whose content changed are rewritten")
+  parser.add_argument("--batch", default = None, metavar = "MANIFEST",
+                      help = "Run every job listed in a JSON manifest in this process")
+  parser.add_argument("--workers", default = 1, type = int,
+                      help = "Number of batch jobs to run concurrently")
+  parser.add_argument("--summary", default = None,
+                      help = "Path of the batch result summary. Defaults to MANIFEST.results.json")
+  parser.add_argument("--serve", default = None, metavar = "SOCKET",
+                      help = "Run as a service that accepts jobs over a Unix socket at this path")
+  parser.add_argument("--cache-size", default = 8, type = int,
+                      help = "Number of parsed inputs kept in memory by --batch and --serve")
+  parser.add_argument("--profile", nargs = "?", const = "profile.json", default = None, metavar = "REPORT",
+                      help = "Write a JSON report of the time, throughput and memory of each stage (default: profile.json)")
+  parser.add_argument("--profile-cprofile", default = None, metavar = "PATH",
+                      help = "With --profile, also dump cProfile statistics of the slowest stage to PATH")
   parser.add_argument("--index", default = None, help = "NOT IMPLEMENTED. Name of the column for input")
   parser.add_argument("--debug", action = "store_true", help = "Enables --verbose and disables writes to disk")
-  args = parser.parse_args()
+  args = parser.parse_args(argv)
   if args.debug is True:
     args.verbose = True
   
@@ -91,4 +226,21 @@ def parseOptions():
 
 if __name__=="__main__":
   args = parseOptions()
-  process(args)
+  profiler = None
+  if args.profile is not None:
+    profiler = profiling.enable(cprofile = args.profile_cprofile is not None)
+  if args.serve is not None:
+    from modules import daemon, helpers
+    helpers.enable_input_cache(args.cache_size)
+    daemon.serve(args.serve, process, parseOptions)
+  elif args.batch is not None:
+    from modules import batch, helpers
+    helpers.enable_input_cache(args.cache_size)
+    report = batch.run(args.batch, process, parseOptions, args.workers, args.summary)
+    pprint(f"Ran {len(report['jobs'])} jobs ({report['failed']} failed) in {report['seconds']:.2f}s")
+    if report['failed'] > 0:
+      sys.exit(1)
+  else:
+    process(args)
+  if profiler is not None:
+    profiler.save(args.profile, args.profile_cprofile)
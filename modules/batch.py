@@ -0,0 +1,154 @@
+"""
+Batch mode
+
+Runs many transformer jobs in a single process, so that the interpreter,
+pandas and each transformer are only loaded once, and so that parsed inputs
+and the location table are shared between jobs.
+
+A manifest is a JSON file with a list of jobs, either at its top level or
+under a `jobs` key. Each job names its transformer, its input files, its output
+directory and any further options, given by their long option names.
+
+  {
+    "jobs": [
+      { "transformer": "csv", "inputs": ["site1.csv"], "outdir": "out/site1",
+        "options": { "format": "parquet" } },
+      { "transformer": "cut", "outdir": "out/setaria",
+        "options": { "genotypes": "a.012", "positions": "a.012.pos",
+                     "individuals": "a.012.indv", "name": "setaria" } }
+    ]
+  }
+
+Transformers that have their own command line (e.g., cut) are given their
+inputs through their options instead of `inputs`.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import time
+import traceback
+
+from . import helpers
+from . import transformer as transformers
+
+
+def load_manifest(path):
+  """Read the list of jobs from a manifest file
+
+  Args:
+    path (String): path of the manifest (JSON)
+
+  Returns (List):
+    List of jobs (dicts)
+  """
+  with open(path, 'r') as ifp:
+    manifest = json.load(ifp)
+  jobs = manifest['jobs'] if isinstance(manifest, dict) else manifest
+  for index, job in enumerate(jobs):
+    if 'transformer' not in job:
+      raise Exception(f"Job {index} in `{path}` does not name a transformer. Aborting.")
+  return jobs
+
+def options_to_argv(options):
+  """Convert a dictionary of options into command line arguments
+
+  Args:
+    options (dict): option names (without leading dashes) and their values
+
+  Returns (List):
+    List of arguments
+
+  Example cases:
+    >>> options_to_argv({ 'format': 'parquet', 'verbose': True, 'debug': False })
+    ['--format', 'parquet', '--verbose']
+  """
+  argv = []
+  for key, value in options.items():
+    flag = f'--{key}'
+    if value is True:
+      argv.append(flag)
+    elif value is False or value is None:
+      continue
+    elif isinstance(value, (list, tuple)):
+      argv.append(flag)
+      argv.extend([ str(v) for v in value ])
+    else:
+      argv.extend([flag, str(value)])
+  return argv
+
+def job_args(job, parse):
+  """Build the arguments of a single job as if they were given on the terminal
+
+  Args:
+    job (dict): job from the manifest
+    parse (function): parser for the main command line
+
+  Returns (Namespace):
+    Arguments for the job
+  """
+  name = job['transformer']
+  options = options_to_argv(job.get('options', {}))
+  outdir = ['-o', job['outdir']] if job.get('outdir') else []
+  transformer = transformers.load(name)
+  if hasattr(transformer, 'parseOptions'):
+    # The transformer has its own command line; fill in anything it does not
+    # define from the defaults of the main one
+    args = vars(parse([]))
+    args.update(vars(transformer.parseOptions(outdir + options)))
+    args = argparse.Namespace(**args)
+  else:
+    args = parse(list(job.get('inputs', [])) + outdir + options)
+  args.transformer = name
+  return args
+
+def run(path, process, parse, workers = 1, summary = None):
+  """Run every job of a manifest
+
+  Args:
+    path (String): path of the manifest
+    process (function): runs a single job given its arguments
+    parse (function): parser for the main command line
+    workers (Int): number of jobs to run concurrently
+    summary (String): path of the result summary, defaults to the manifest
+                      path with `.results.json` appended
+
+  Returns (dict):
+    Result summary, with the status, timing and error (if any) of each job
+  """
+  jobs = load_manifest(path)
+  if helpers.input_cache is None:
+    helpers.enable_input_cache()
+
+  def run_job(index, job):
+    result = { 'index': index, 'transformer': job['transformer'], 'outdir': job.get('outdir') }
+    start = time.perf_counter()
+    try:
+      result['files'] = process(job_args(job, parse))
+      result['status'] = 'ok'
+    except (Exception, SystemExit) as e:
+      # SystemExit is raised by argparse for bad options, which should fail
+      # the job, not the whole batch
+      result['status'] = 'failed'
+      result['error'] = f'{type(e).__name__}: {e}'
+      result['traceback'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+  start = time.perf_counter()
+  with concurrent.futures.ThreadPoolExecutor(max_workers = max(1, workers)) as executor:
+    results = list(executor.map(run_job, range(len(jobs)), jobs))
+
+  report = {
+    'manifest': path,
+    'workers': workers,
+    'seconds': time.perf_counter() - start,
+    'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+    'failed': sum(1 for r in results if r['status'] != 'ok'),
+    'jobs': results,
+  }
+  if summary is None:
+    summary = f'{path}.results.json'
+  with open(summary, 'w') as ofp:
+    json.dump(report, ofp, indent = 2)
+  return report
@@ -0,0 +1,123 @@
+"""
+Service mode
+
+Keeps a single process running that accepts transform jobs over a Unix socket,
+so that each job skips interpreter and pandas start-up, and so that the
+location table and recently parsed inputs stay in memory between jobs.
+
+Each connection sends one request as a line of JSON and receives one line of
+JSON back. A request is either the command line arguments of `main.py`,
+
+  { "argv": ["-t", "csv", "-o", "out/site1", "site1.csv"] }
+
+or a job as written in a batch manifest (see `modules.batch`),
+
+  { "job": { "transformer": "csv", "inputs": ["site1.csv"], "outdir": "out/site1" } }
+
+The response reports the status of the job, the files it wrote and how long it
+took. The commands `{ "command": "ping" }` and `{ "command": "shutdown" }`
+are also understood.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import traceback
+
+from . import batch
+from . import helpers
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    try:
+      request = json.loads(self.rfile.readline())
+      response = self.server.dispatch(request)
+    except (Exception, SystemExit) as e:
+      response = { 'status': 'failed', 'error': f'{type(e).__name__}: {e}' }
+    self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """Unix socket server that runs each request on its own thread"""
+
+  daemon_threads = True
+
+  def __init__(self, path, process, parse):
+    self.process = process
+    self.parse = parse
+    super().__init__(path, _Handler)
+
+  def dispatch(self, request):
+    """Run a single request
+
+    Args:
+      request (dict): decoded request
+
+    Returns (dict):
+      Response to send back to the client
+    """
+    command = request.get('command')
+    if command == 'ping':
+      cache = helpers.input_cache
+      return { 'status': 'ok', 'cached_inputs': 0 if cache is None else len(cache) }
+    if command == 'shutdown':
+      # shutdown() blocks until serve_forever() returns, so it cannot be called
+      # from the thread handling this request
+      threading.Thread(target = self.shutdown).start()
+      return { 'status': 'ok' }
+    if command is not None:
+      raise Exception(f"Unknown command `{command}`.")
+
+    start = time.perf_counter()
+    try:
+      if 'job' in request:
+        args = batch.job_args(request['job'], self.parse)
+      else:
+        args = self.parse(list(request['argv']))
+      files = self.process(args)
+      response = { 'status': 'ok', 'outdir': args.outdir, 'files': files }
+    except (Exception, SystemExit) as e:
+      response = { 'status': 'failed', 'error': f'{type(e).__name__}: {e}', 'traceback': traceback.format_exc() }
+    response['seconds'] = time.perf_counter() - start
+    return response
+
+
+def serve(path, process, parse):
+  """Serve requests on a Unix socket until a shutdown command is received
+
+  Args:
+    path (String): path of the Unix socket
+    process (function): runs a single job given its arguments
+    parse (function): parser for the main command line
+  """
+  if os.path.exists(path):
+    os.remove(path)
+  with Server(path, process, parse) as server:
+    try:
+      print(f"Listening on {path}")
+      server.serve_forever()
+    finally:
+      os.remove(path)
+
+def submit(path, request, timeout = None):
+  """Send a single request to a running service and wait for its response
+
+  Args:
+    path (String): path of the Unix socket
+    request (dict): request to send (see module documentation)
+    timeout (Float): seconds to wait for a response, or None to wait forever
+
+  Returns (dict):
+    Response from the service
+  """
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+    client.settimeout(timeout)
+    client.connect(path)
+    client.sendall(json.dumps(request).encode() + b'\n')
+    with client.makefile('rb') as ifp:
+      return json.loads(ifp.readline())
@@ -0,0 +1,488 @@
+"""
+Helper Functions for genotype (.012) data
+
+A .012 dataset, as written by `vcftools --012`, is made up of three files:
+
+  .012        one row per individual; the first column is the row index and
+              every other column is the call for one SNP (0, 1, 2 or -1 when
+              missing), all separated by tabs
+  .012.pos    one line per SNP: chromosome and position, separated by a tab
+  .012.indv   one line per individual: its name
+
+The SNP on line N (1-based) of the .pos file is found in column N (0-based) of
+the .012 file, right after the row index.
+"""
+
+import collections
+import itertools
+import os
+import re
+
+import numpy as np
+
+
+def chromosome_alias(chromosome):
+  """Shorten a chromosome name for use in filenames
+
+  Args:
+    chromosome (String): chromosome (or scaffold) name as found in .pos files
+
+  Returns (String):
+    Short name of the chromosome
+
+  Example cases:
+    >>> chromosome_alias('Chr_01')
+    'chr1'
+    >>> chromosome_alias('scaffold_36')
+    'sca36'
+  """
+  return f'{chromosome[:3].lower()}{str(int(chromosome[-2:]))}'
+
+def chromosome_number(chromosome):
+  """Numeric identifier of a chromosome, as written in the output .pos files
+
+  Example cases:
+    >>> chromosome_number('Chr_01')
+    '1'
+  """
+  return str(int(chromosome[-2:]))
+
+def output_name(chromosome, name):
+  """Name of the .012 file of a chromosome. The .pos and .indv files of the
+  chromosome share it as a prefix.
+
+  Args:
+    chromosome (String): chromosome name as found in .pos files
+    name (String): name of the species
+
+  Returns (String):
+    Filename of the chromosome's genotypes
+
+  Example cases:
+    >>> output_name('Chr_01', 'setaria')
+    'chr1_setaria.012'
+  """
+  return f'{chromosome_alias(chromosome)}_{name}.012'
+
+def read_positions(path):
+  """Find the columns of the .012 file that belong to each chromosome. The
+  .pos file must be sorted by chromosome.
+
+  Args:
+    path (String): path of the .012.pos file
+
+  Returns (OrderedDict):
+    Chromosome name -> { 'min': first column, 'max': last column }, where the
+    columns are indices into a split .012 row (the row index being column 0)
+  """
+  chromosomes = collections.OrderedDict()
+  current_chromosome = None
+  lineno = 0
+  with open(path, 'r') as posfp:
+    for line in posfp:
+      lineno += 1
+      chromosome = line.split('\t', 1)[0].strip()
+      if chromosome != current_chromosome:
+        if chromosome in chromosomes:
+          raise Exception(f"`{path}` is not sorted by chromosome: `{chromosome}` appears again on line {lineno}. Aborting.")
+        current_chromosome = chromosome
+        chromosomes[chromosome] = { 'min': lineno }
+      chromosomes[chromosome]['max'] = lineno
+  return chromosomes
+
+def iter_positions(path):
+  """Iterate over the SNPs of a .012.pos file
+
+  Yields (String, String):
+    Chromosome and position of each SNP
+  """
+  with open(path, 'r') as posfp:
+    for line in posfp:
+      chromosome, snp = [ x.strip() for x in line.split('\t') ]
+      yield chromosome, snp
+
+def _count_runs(block, counts, pattern):
+  """Count the SNPs of every chromosome in a block of whole lines of a .012.pos
+  file. The SNPs of a chromosome are usually listed together, so each run of
+  them is counted by finding its last line and checking that every line up to
+  it names the same chromosome; the rest of a block where that does not hold
+  is parsed a line at a time instead.
+  """
+  start = 0
+  while start < len(block):
+    end = block.find(b'\n', start)
+    tab = block.find(b'\t', start, end)
+    if tab < 0:
+      break
+    run = b'\n' + block[start:tab] + b'\t'
+    last = block.rfind(run, start)
+    stop = end + 1 if last < 0 else block.find(b'\n', last + 1) + 1
+    lines = block.count(b'\n', start, stop)
+    if block.count(run, start, stop) + 1 != lines:
+      break
+    name = block[start:tab].decode().strip()
+    counts[name] = counts.get(name, 0) + lines
+    start = stop
+  for name, names in itertools.groupby(pattern.findall(block, start)):
+    name = name.decode().strip()
+    counts[name] = counts.get(name, 0) + sum(1 for _ in names)
+
+def count_positions(path, blocksize = 1 << 24):
+  """Count the SNPs of every chromosome of a .012.pos file without decoding
+  every line
+
+  Args:
+    path (String): path of the .012.pos file
+    blocksize (Int): number of bytes read at a time
+
+  Returns (OrderedDict):
+    Chromosome name -> number of SNPs, in the order the chromosomes appear
+  """
+  counts = collections.OrderedDict()
+  pattern = re.compile(rb'^([^\t\n]*)\t', re.MULTILINE)
+  rest = b''
+  with open(path, 'rb') as ifp:
+    while True:
+      block = ifp.read(blocksize)
+      if not block:
+        break
+      # Lines that run over the end of the block are counted with the next
+      block, _, rest = (rest + block).rpartition(b'\n')
+      _count_runs(block + b'\n', counts, pattern)
+  if rest:
+    _count_runs(rest + b'\n', counts, pattern)
+  return counts
+
+def count_lines(path, blocksize = 1 << 24):
+  """Count the lines of a file without decoding it
+
+  Args:
+    path (String): path of the file
+    blocksize (Int): number of bytes read at a time
+
+  Returns (Int):
+    Number of lines
+  """
+  count = 0
+  last = b'\n'
+  with open(path, 'rb') as ifp:
+    while True:
+      block = ifp.read(blocksize)
+      if not block:
+        break
+      count += block.count(b'\n')
+      last = block[-1:]
+  # Count a last line that has no trailing newline
+  if last != b'\n':
+    count += 1
+  return count
+
+# Row offsets of the last file indexed by this process, with the size and
+# modification time it had then
+_row_offsets = {}
+
+def row_offsets(path, cache_dir = None, blocksize = 1 << 24):
+  """Find the byte offset at which every row of a file starts, so that rows can
+  be read directly. The offsets are reused for as long as the file is
+  unchanged: within the process, and across runs when they are kept in
+  `cache_dir` (as `.{filename}.rowidx.npy`). Nothing is written next to the
+  file itself.
+
+  Args:
+    path (String): path of the file
+    cache_dir (String): directory to keep the offsets in (e.g., the output
+                        directory), or None to not keep them on disk
+    blocksize (Int): number of bytes read at a time
+
+  Returns (ndarray):
+    Offset of every row
+  """
+  stat = os.stat(path)
+  key = np.array([stat.st_size, stat.st_mtime_ns], dtype = np.int64)
+  memo = _row_offsets.get(os.path.abspath(path))
+  if memo is not None and (memo[0] == key).all():
+    return memo[1]
+  index = os.path.join(cache_dir, f'.{os.path.basename(path)}.rowidx.npy') if cache_dir is not None else None
+  if index is not None:
+    try:
+      saved = np.load(index)
+      if saved.size >= 2 and (saved[:2] == key).all():
+        _row_offsets.clear()
+        _row_offsets[os.path.abspath(path)] = (key, saved[2:])
+        return saved[2:]
+    except (OSError, ValueError):
+      pass
+
+  offsets = [np.zeros(1, dtype = np.int64)]
+  position = 0
+  with open(path, 'rb') as ifp:
+    while True:
+      block = ifp.read(blocksize)
+      if not block:
+        break
+      # Every row but the first starts right after a newline
+      offsets.append(np.flatnonzero(np.frombuffer(block, dtype = np.uint8) == 10).astype(np.int64) + position + 1)
+      position += len(block)
+  offsets = np.concatenate(offsets)
+  # A newline at the very end does not start another row
+  if offsets.size and offsets[-1] >= stat.st_size:
+    offsets = offsets[:-1]
+  _row_offsets.clear()
+  _row_offsets[os.path.abspath(path)] = (key, offsets)
+  if index is not None:
+    try:
+      np.save(index, np.concatenate([key, offsets]))
+    except OSError:
+      pass
+  return offsets
+
+def parse_calls(line, snps):
+  """Convert a row of a .012 file to an array of calls
+
+  Args:
+    line (String): row of the .012 file, including its row index
+    snps (Int): number of SNPs in the row
+
+  Returns (ndarray):
+    Calls (0, 1, 2 or -1 when missing) as 8-bit integers
+
+  Example cases:
+    >>> parse_calls('3 0 2 -1', 3)
+    array([ 0,  2, -1], dtype=int8)
+  """
+  return np.array(line.split(), dtype = np.int8)[1:snps + 1]
+
+
+class Dosages:
+  """
+  Compact storage of imputed dosages: .012 rows whose calls are fractional
+  (0.0 to 2.0, or -1 when missing) rather than 0, 1 or 2. Dosages are held
+  either as 16-bit floats (NaN when missing), or as 8-bit integers counting
+  hundredths of an allele (255 when missing), and are written back as text
+  with a fixed number of decimals.
+
+  Args:
+    storage (String): 'float16' or 'uint8'
+    precision (Int): number of decimals of the dosages written as text
+  """
+
+  STORAGE = ['float16', 'uint8']
+  # Dosages stored as 8-bit integers are in hundredths, and this marks those
+  # that are missing
+  SCALE = 100
+  MISSING = 255
+
+  def __init__(self, storage, precision = 2):
+    if storage not in self.STORAGE:
+      raise Exception(f"Unknown dosage storage `{storage}`. Available storage: {self.STORAGE}. Aborting.")
+    self.storage = storage
+    self.precision = precision
+    self.dtype = np.dtype(storage)
+    # Every value that can be stored is formatted once, and looked up after
+    if storage == 'uint8':
+      values = np.arange(256) / self.SCALE
+      values[self.MISSING] = np.nan
+    else:
+      values = np.arange(1 << 16, dtype = np.uint16).view(np.float16).astype(np.float64)
+    self._text = np.array([ b'NA' if x != x else f'{x:.{precision}f}'.encode() for x in values.tolist() ], dtype = object)
+
+  def parse(self, line, snps):
+    """Convert a row of a .012 file of dosages to an array of compact dosages
+
+    Args:
+      line (String): row of the .012 file, including its row index
+      snps (Int): number of SNPs in the row
+
+    Example cases:
+      >>> Dosages('uint8').parse('3 0.25 2 -1 1.999', 4)
+      array([ 25, 200, 255, 200], dtype=uint8)
+    """
+    values = np.array(line.split()[1:snps + 1], dtype = np.float32)
+    if values.size and values.max() > 2:
+      raise Exception(f"Found a dosage of {values.max()}, above 2. Aborting.")
+    missing = values < 0
+    if self.storage == 'uint8':
+      return np.where(missing, self.MISSING, np.rint(values * self.SCALE)).astype(np.uint8)
+    return np.where(missing, np.nan, values).astype(np.float16)
+
+  def decode(self, values):
+    """Convert compact dosages to 32-bit floats, NaN when missing"""
+    if self.storage == 'uint8':
+      return np.where(values == self.MISSING, np.nan, values / np.float32(self.SCALE)).astype(np.float32)
+    return values.astype(np.float32)
+
+  def format(self, values):
+    """Write compact dosages as a tab-separated line of text
+
+    Example cases:
+      >>> Dosages('uint8', 1).format(np.array([25, 200, 255], dtype = np.uint8))
+      b'0.2\\t2.0\\tNA\\n'
+    """
+    codes = values if self.storage == 'uint8' else values.view(np.uint16)
+    return b'\t'.join(self._text[codes]) + b'\n'
+
+
+class ColumnHashes:
+  """
+  Running hashes of every column (SNP) of a .012 dataset, updated a row at a
+  time while it is being read, so that SNPs with identical calls can be found
+  without holding their columns. Two independent 64-bit hashes are kept per
+  column. SNPs are grouped by their hashes alone, so their calls still have to
+  be compared (as `cut` does while writing) to rule out a collision.
+
+  Args:
+    snps (Int): number of SNPs
+  """
+
+  # FNV-1a, and a polynomial hash with a multiplier of the golden ratio
+  _FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+  _FNV_PRIME = np.uint64(0x100000001b3)
+  _MULTIPLIER = np.uint64(0x9e3779b97f4a7c15)
+  # Stands in for the calls of a row that is too short
+  _ABSENT = np.uint64(1 << 32)
+
+  def __init__(self, snps):
+    self.snps = snps
+    self.first = np.full(snps, self._FNV_OFFSET, dtype = np.uint64)
+    self.second = np.zeros(snps, dtype = np.uint64)
+
+  def add_calls(self, calls):
+    """Add a row of calls, as returned by `parse_calls` (or `Dosages.parse`)"""
+    codes = np.full(self.snps, self._ABSENT, dtype = np.uint64)
+    calls = np.ascontiguousarray(calls[:self.snps])
+    codes[:calls.size] = calls.view(f'u{calls.dtype.itemsize}')
+    self.first ^= codes
+    self.first *= self._FNV_PRIME
+    self.second *= self._MULTIPLIER
+    self.second += codes + np.uint64(1)
+
+  def representatives(self, ranges, mask = None):
+    """Group the SNPs of every chromosome by their calls
+
+    Args:
+      ranges (List): first and last SNP + 1 (0-based) of every chromosome
+      mask (ndarray): SNPs to consider, or None for all of them
+
+    Returns (ndarray):
+      For every SNP whose calls are identical to those of an earlier SNP of
+      the same chromosome, the first such SNP; -1 for all others
+
+    Example cases:
+      >>> hashes = ColumnHashes(4)
+      >>> hashes.add_calls(np.array([0, 1, 0, 0], dtype = np.int8))
+      >>> hashes.add_calls(np.array([2, -1, 2, 2], dtype = np.int8))
+      >>> hashes.representatives([(0, 3), (3, 4)])
+      array([-1, -1,  0, -1])
+    """
+    representatives = np.full(self.snps, -1, dtype = np.int64)
+    for lower, upper in ranges:
+      snps = np.arange(lower, upper) if mask is None else lower + np.flatnonzero(mask[lower:upper])
+      if snps.size < 2:
+        continue
+      # Sort by hash, and by position among identical hashes, so that the
+      # first SNP of every group is its representative
+      order = snps[np.lexsort((snps, self.second[snps], self.first[snps]))]
+      first, second = self.first[order], self.second[order]
+      starts = np.ones(order.size, dtype = bool)
+      starts[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+      group = np.maximum.accumulate(np.where(starts, np.arange(order.size), 0))
+      representatives[order[~starts]] = order[group[~starts]]
+    return representatives
+
+
+class GenotypeStats:
+  """
+  Quality control statistics of a .012 dataset, accumulated a row (individual)
+  at a time while it is being read: the number of calls and alternate alleles
+  of every SNP, and the number of calls of every individual within each
+  chromosome. Rows are buffered and added up in blocks.
+
+  Args:
+    chromosomes (OrderedDict): column range of every chromosome (see
+                               `read_positions`)
+    block (Int): number of rows added up at a time, by default as many as fit
+                 in 64 MiB
+    dosages (Dosages): storage of the calls when they are dosages, or None
+                       for 0, 1 and 2 calls
+  """
+
+  def __init__(self, chromosomes, block = None, dosages = None):
+    self.chromosomes = list(chromosomes)
+    self.ranges = { c: (r['min'] - 1, r['max']) for c, r in chromosomes.items() }
+    self.snps = max([ r['max'] for r in chromosomes.values() ] + [0])
+    self.rows = 0
+    self.dosages = dosages
+    self.called = np.zeros(self.snps, dtype = np.int64)
+    self.alleles = np.zeros(self.snps, dtype = np.int64 if dosages is None else np.float64)
+    itemsize = 1 if dosages is None else dosages.dtype.itemsize
+    self.block = block or max(1, min(1024, (64 << 20) // max(1, itemsize * self.snps)))
+    self.row_ids = []
+    self._buffer = []
+    self._individuals = []
+
+  def add(self, line, row = None):
+    """Add a row of the .012 file, as read, along with its row number"""
+    if self.dosages is not None:
+      self.add_calls(self.dosages.parse(line, self.snps), row)
+    else:
+      self.add_calls(parse_calls(line, self.snps), row)
+
+  def add_calls(self, calls, row = None):
+    """Add a row of calls, as returned by `parse_calls` (or `Dosages.parse`),
+    along with its row number"""
+    self.row_ids.append(self.rows + len(self._buffer) if row is None else row)
+    self._buffer.append(calls)
+    if len(self._buffer) >= self.block:
+      self._flush()
+
+  def _flush(self):
+    if not self._buffer:
+      return
+    block = np.vstack(self._buffer)
+    self._buffer = []
+    if self.dosages is not None:
+      # Dosages are only expanded a block at a time
+      block = self.dosages.decode(block)
+      called = ~np.isnan(block)
+    else:
+      called = block >= 0
+    self.rows += block.shape[0]
+    self.called += called.sum(axis = 0)
+    self.alleles += np.where(called, block, 0).sum(axis = 0, dtype = self.alleles.dtype)
+    starts = [ self.ranges[c][0] for c in self.chromosomes ]
+    self._individuals.append(np.add.reduceat(called, starts, axis = 1) if starts else np.zeros((block.shape[0], 0)))
+
+  def snp_stats(self, chromosome = None):
+    """Statistics of the SNPs of a chromosome, or of all SNPs if None
+
+    Returns (ndarray, ndarray, ndarray):
+      Number of calls, fraction of missing calls and minor allele frequency
+      (NaN for SNPs without any calls) of every SNP
+    """
+    self._flush()
+    lower, upper = self.ranges[chromosome] if chromosome is not None else (0, self.snps)
+    called = self.called[lower:upper]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+      frequency = self.alleles[lower:upper] / (2 * called)
+      missing = 1 - called / self.rows if self.rows else np.full(called.shape, np.nan)
+    return called, missing, np.minimum(frequency, 1 - frequency)
+
+  def individual_stats(self, chromosome):
+    """Statistics of the individuals within a chromosome
+
+    Returns (ndarray, ndarray):
+      Number of calls and fraction of missing calls of every individual
+    """
+    self._flush()
+    lower, upper = self.ranges[chromosome]
+    i = self.chromosomes.index(chromosome)
+    called = np.concatenate([ block[:, i] for block in self._individuals ]) if self._individuals else np.zeros(0, dtype = np.int64)
+    return called, 1 - called / (upper - lower)
+
+  def individual_missing(self):
+    """Fraction of missing calls of every individual, over all SNPs"""
+    self._flush()
+    if not self._individuals:
+      return np.zeros(0)
+    called = np.concatenate(self._individuals).sum(axis = 1)
+    return 1 - called / max(1, self.snps)
@@ -2,11 +2,24 @@
 Helper Functions for data transformation script
 """
 
+import collections
 import datetime
+import functools
 import pandas as pd
 import fileinput
+import os
 import re
 import math
+import threading
+
+from . import pipeline
+from . import profiling
+
+@functools.lru_cache(maxsize = None)
+def _locations():
+  """Load the location dictionary once per process"""
+  location_fp = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locations.csv')
+  return pd.read_csv(location_fp, index_col = 0)
 
 class Convert:
   """
@@ -34,8 +47,7 @@ class Convert:
       'Purdue'
 
     """
-    location_fp = 'locations.csv'
-    locations = pd.read_csv(location_fp, index_col = 0)
+    locations = _locations()
     if code.upper() in locations.index:
       return locations.loc[code.upper()]['Name']
     else:
@@ -332,6 +344,148 @@ def read_files(fp, delimiter):
     fp.nextfile()
   return df
 
+def read_files_concurrently(files, delimiter, workers = 2):
+  """
+  Reads the contents of several CSV files on worker threads, and creates a
+  single dataframe of them
+
+  Args:
+    files (List): list of filenames
+    delimiter (String): value to split data
+    workers (Int): number of files parsed at the same time
+
+  Returns:
+    Pandas dataframe
+  """
+  def read(f):
+    # Float precision helps to avoid rounding errors, but it does hurt performance
+    return pd.read_table(f, float_precision='round_trip', delimiter = delimiter)
+  frames = list(pipeline.ordered_map(read, files, workers, ahead = workers))
+  return pd.concat(frames, axis = 0, ignore_index = True, sort = False)
+
+def read_chunks(files, delimiter, chunk_rows):
+  """
+  Reads the contents of CSV files a few rows at a time
+
+  Args:
+    files (List): list of filenames
+    delimiter (String): value to split data
+    chunk_rows (Int): number of rows per chunk
+
+  Yields:
+    Pandas dataframe of at most `chunk_rows` rows
+  """
+  for f in files:
+    reader = pd.read_table(f, float_precision='round_trip', delimiter = delimiter, chunksize = chunk_rows)
+    with reader:
+      while True:
+        with profiling.stage('read') as stage:
+          try:
+            chunk = next(reader)
+          except StopIteration:
+            break
+          stage.rows, stage.columns = chunk.shape
+        yield chunk
+
+def reads_ahead(args):
+  """Whether the input is read a chunk at a time on its own thread, and split
+  as it is read (--pipeline), rather than parsed whole first. Only files can be
+  read that way, and inputs that may already be cached (in batch and service
+  modes) are parsed whole so that they can be cached.
+
+  Args:
+    args (Namespace): arguments supplied by user
+  """
+  return getattr(args, 'pipeline', False) and len(args.files) > 0 and input_cache is None
+
+class InputCache:
+  """
+  Bounded cache of parsed input files, so that several jobs run by the same
+  process (e.g., in batch mode) only parse a given input once. The least
+  recently used entries are evicted first once either limit is exceeded.
+
+  Entries are keyed on the path, size and modification time of every input
+  file, so a file that changed on disk is parsed again.
+  """
+
+  def __init__(self, max_entries = 8, max_bytes = None):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.nbytes = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(files, delimiter):
+    """Build the cache key for a list of input files
+
+    Args:
+      files (List): list of filenames
+      delimiter (String): value to split data
+
+    Returns (Tuple):
+      Hashable key for the parsed data
+    """
+    key = []
+    for f in files:
+      st = os.stat(f)
+      key.append((os.path.abspath(f), st.st_size, st.st_mtime_ns))
+    return (tuple(key), delimiter)
+
+  def get(self, key):
+    """Fetch parsed data from the cache
+
+    Returns:
+      Pandas dataframe (a copy, so callers can change it freely, values
+      included), or None if it has not been cached
+    """
+    with self._lock:
+      if key not in self._entries:
+        return None
+      self._entries.move_to_end(key)
+      df, _ = self._entries[key]
+    return df.copy()
+
+  def put(self, key, df):
+    """Add parsed data to the cache, evicting older entries as needed"""
+    nbytes = int(df.memory_usage(index = True, deep = True).sum())
+    if self.max_bytes is not None and nbytes > self.max_bytes:
+      return
+    with self._lock:
+      if key in self._entries:
+        self.nbytes -= self._entries.pop(key)[1]
+      self._entries[key] = (df, nbytes)
+      self.nbytes += nbytes
+      while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+        _, (_, evicted) = self._entries.popitem(last = False)
+        self.nbytes -= evicted
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.nbytes = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+# Cache used by `read_data`. It is disabled by default, as a one-off run has
+# no use for it; long-running modes call `enable_input_cache`
+input_cache = None
+
+def enable_input_cache(max_entries = 8, max_bytes = None):
+  """Turn on caching of parsed inputs for the rest of the process
+
+  Args:
+    max_entries (Int): maximum number of parsed inputs to keep
+    max_bytes (Int): maximum total in-memory size of parsed inputs, or None
+
+  Returns (InputCache):
+    The cache used by `read_data`
+  """
+  global input_cache
+  input_cache = InputCache(max_entries, max_bytes)
+  return input_cache
+
 def read_data(args, delimiter):
   """Reads in the data from either STDIN or a list of files
 
@@ -342,17 +496,40 @@ def read_data(args, delimiter):
     Pandas DataFrame
   """
   files = args.files
+  cache = input_cache
+  key = None
+  if cache is not None and len(files) > 0:
+    key = InputCache.key(files, delimiter)
+    df = cache.get(key)
+    if df is not None:
+      return df
   try:
-    fp = fileinput.input(files)
+    # Use a FileInput instance rather than `fileinput.input`, as the latter is
+    # global state and cannot be used by more than one job at a time
+    fp = fileinput.FileInput(files)
     df = None
-    if len(files) < 1:
-      df = read_stdin(fp, delimiter)
-    else:
-      df = read_files(fp, delimiter)
+    try:
+      if len(files) < 1:
+        with profiling.stage('parse') as stage:
+          df = read_stdin(fp, delimiter)
+          stage.rows, stage.columns = df.shape
+      else:
+        with profiling.stage('read') as stage:
+          if len(files) > 1 and args.pipeline:
+            df = read_files_concurrently(files, delimiter)
+          else:
+            df = read_files(fp, delimiter)
+          stage.rows, stage.columns = df.shape
+          stage.bytes = sum(os.path.getsize(f) for f in files)
+    finally:
+      fp.close()
 
     if df is None:
       raise Exception("No data supplied.")
   except:
     raise
 
+  if key is not None:
+    cache.put(key, df)
+    df = df.copy()
   return df
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Output manifests for incremental runs
+
+When a run is incremental, a manifest is kept in the output directory that
+records, for the last run, the content hash of every input file, the
+transformer and its version, the options that affect the output, and a digest
+of every output file. A rerun with the same inputs and options does nothing.
+Otherwise the whole input is read and split again (the inputs are tracked as a
+whole, not per output), and only the outputs whose digest changed are written
+again; the rest of the output directory is left untouched.
+"""
+
+import hashlib
+import json
+import os
+
+from . import __version__
+
+MANIFEST_FILENAME = '.manifest.json'
+
+# Options that change how a run is carried out or reported, but not its output
+IGNORED_OPTIONS = set([
+  'verbose', 'debug', 'outdir', 'files', 'transformer', 'incremental',
+  'batch', 'workers', 'summary', 'serve', 'cache_size', 'profile',
+  'profile_cprofile', 'max_memory', 'spill_dir', 'pipeline', 'writers',
+  'queue_size', 'split_workers', 'resume', 'checkpoint_interval', 'verify',
+  'sparse', 'plan', 'run_shard', 'merge_shards', 'inspect',
+])
+
+
+def file_digest(path, blocksize = 1 << 24):
+  """Hash the content of a file
+
+  Args:
+    path (String): path of the file
+
+  Returns (String):
+    Hex digest of the content
+  """
+  h = hashlib.sha256()
+  with open(path, 'rb') as ifp:
+    while True:
+      block = ifp.read(blocksize)
+      if not block:
+        break
+      h.update(block)
+  return h.hexdigest()
+
+def frame_digest(df):
+  """Hash the content of a DataFrame, including its row and column labels
+
+  Args:
+    df (DataFrame): data to hash
+
+  Returns (String):
+    Hex digest of the content
+  """
+  import pandas as pd
+  h = hashlib.sha256()
+  h.update(json.dumps([ str(c) for c in df.columns ]).encode())
+  h.update(json.dumps([ str(t) for t in df.dtypes ]).encode())
+  h.update(pd.util.hash_pandas_object(df, index = True).values.tobytes())
+  return h.hexdigest()
+
+def input_files(paths):
+  """Expand the directories among the inputs of a run into the files they hold,
+  leaving out hidden files (e.g., the manifest of a previous run)
+
+  Args:
+    paths (List): paths of files or directories
+
+  Returns (List):
+    Paths of files
+  """
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files += sorted([ os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)) and not f.startswith('.') ])
+    else:
+      files.append(path)
+  return files
+
+def run_options(args):
+  """Collect the options of a run that affect its output
+
+  Args:
+    args (Namespace): arguments supplied by user
+
+  Returns (dict):
+    Option name -> value, for every option that is not ignored
+  """
+  options = {}
+  for key, value in sorted(vars(args).items()):
+    if key in IGNORED_OPTIONS:
+      continue
+    options[key] = value if isinstance(value, (str, int, float, bool, type(None), list)) else str(value)
+  return options
+
+
+class Manifest:
+  """
+  Manifest of the outputs of a transformer in an output directory
+
+  Args:
+    outdir (String): path of output directory
+    transformer (String): name of the transformer
+    options (dict): options that affect the output (see `run_options`)
+    inputs (List): paths of the input files
+  """
+
+  def __init__(self, outdir, transformer, options, inputs):
+    self.outdir = str(outdir)
+    self.path = os.path.join(self.outdir, MANIFEST_FILENAME)
+    self.transformer = transformer
+    self.options = json.loads(json.dumps(options))
+    self.inputs = { os.path.abspath(f): file_digest(f) for f in input_files(inputs) }
+    self.outputs = {}
+    self.previous = None
+    if os.path.exists(self.path):
+      with open(self.path, 'r') as ifp:
+        self.previous = json.load(ifp)
+
+  def _same_run(self):
+    """Check that the previous run used the same transformer and options"""
+    return self.previous is not None \
+      and self.previous.get('transformer') == self.transformer \
+      and self.previous.get('version') == __version__ \
+      and self.previous.get('options') == self.options
+
+  def unchanged(self):
+    """Check whether the previous run used the same inputs and options, and all
+    of its outputs are still there, in which case there is nothing to do
+    """
+    if not self._same_run() or len(self.inputs) == 0:
+      return False
+    if self.previous.get('inputs') != self.inputs:
+      return False
+    return all(os.path.exists(os.path.join(self.outdir, f)) for f in self.previous.get('outputs', {}))
+
+  def is_current(self, filename, digest):
+    """Check whether an output file was written by the previous run with the same
+    content, so that it does not have to be written again
+
+    Args:
+      filename (String): name of the output file within the output directory
+      digest (String): digest of the content that would be written
+    """
+    if not self._same_run():
+      return False
+    previous = self.previous.get('outputs', {}).get(filename)
+    if previous is None or previous.get('digest') != digest:
+      return False
+    return os.path.exists(os.path.join(self.outdir, filename))
+
+  def record(self, filename, digest):
+    """Record an output file of the current run"""
+    self.outputs[filename] = { 'digest': digest }
+
+  def remove_stale(self):
+    """Remove the outputs of the previous run that the current run no longer
+    produces
+
+    Returns (List):
+      Names of the files that were removed
+    """
+    removed = []
+    if self.previous is None:
+      return removed
+    for filename in self.previous.get('outputs', {}):
+      path = os.path.join(self.outdir, filename)
+      if filename not in self.outputs and os.path.exists(path):
+        os.remove(path)
+        removed.append(filename)
+    return removed
+
+  def save(self):
+    """Write the manifest of the current run to the output directory"""
+    manifest = {
+      'transformer': self.transformer,
+      'version': __version__,
+      'options': self.options,
+      'inputs': self.inputs,
+      'outputs': self.outputs,
+    }
+    tmp = f'{self.path}.tmp'
+    with open(tmp, 'w') as ofp:
+      json.dump(manifest, ofp, indent = 2, sort_keys = True)
+    os.replace(tmp, self.path)
@@ -0,0 +1,210 @@
+"""
+Memory budgets
+
+Runs given a memory budget (`--max-memory`) estimate how much memory their
+input needs before reading it. Inputs that fit are processed as usual; those
+that do not are read in chunks sized from the budget, and the partial outputs
+of each chunk are kept in a `SpillStore`, which moves them to local disk once
+they no longer fit in the budget. A run that cannot fit even one output in
+the budget fails before doing any work, with an estimate of what it needs.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import weakref
+
+UNITS = { '': 1, 'B': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40 }
+
+# Bytes held in memory per parsed cell (float64) and per row label (object)
+BYTES_PER_CELL = 8
+BYTES_PER_LABEL = 64
+
+# Number of lines sampled to estimate the size of an input
+SAMPLE_LINES = 1000
+
+
+def parse_size(value):
+  """Convert a human-readable size to a number of bytes
+
+  Args:
+    value (String): size, optionally followed by a unit (K, M, G, T)
+
+  Returns (Int):
+    Number of bytes
+
+  Example cases:
+    >>> parse_size('512M')
+    536870912
+    >>> parse_size('4G')
+    4294967296
+    >>> parse_size('1000')
+    1000
+  """
+  match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$', str(value), re.IGNORECASE)
+  if match is None:
+    raise ValueError(f"`{value}` is not a valid size (e.g., 512M, 4G)")
+  number, unit = match.groups()
+  return int(float(number) * UNITS[unit.upper()])
+
+def format_size(nbytes):
+  """Convert a number of bytes to a human-readable size
+
+  Example cases:
+    >>> format_size(536870912)
+    '512.0 MiB'
+  """
+  for unit in ['B', 'KiB', 'MiB', 'GiB']:
+    if abs(nbytes) < 1024:
+      return f'{nbytes:.1f} {unit}'
+    nbytes /= 1024
+  return f'{nbytes:.1f} TiB'
+
+
+class InputEstimate:
+  """
+  Estimated shape and in-memory size of a delimited text input, based on the
+  header and the first lines of every file
+
+  Args:
+    files (List): list of filenames
+    delimiter (String): value to split data
+  """
+
+  def __init__(self, files, delimiter):
+    self.columns = 0
+    self.rows = 0
+    for f in files:
+      with open(f, 'r') as ifp:
+        header = ifp.readline()
+        self.columns = max(self.columns, len(header.split(delimiter)))
+        sampled = 0
+        length = 0
+        for line in ifp:
+          sampled += 1
+          length += len(line)
+          if sampled >= SAMPLE_LINES:
+            break
+      if sampled > 0:
+        body = os.path.getsize(f) - len(header)
+        self.rows += int(round(body / (length / sampled)))
+
+  @property
+  def row_bytes(self):
+    """Estimated size of a single row once parsed"""
+    return self.columns * BYTES_PER_CELL + BYTES_PER_LABEL
+
+  @property
+  def nbytes(self):
+    """Estimated size of the whole input once parsed"""
+    return self.rows * self.row_bytes
+
+  def chunk_rows(self, budget, share = 4):
+    """Number of rows to read at a time so that a chunk takes up at most
+    1/`share` of the budget"""
+    return max(1, int(budget // (share * self.row_bytes)))
+
+
+def over_budget(args, delimiter):
+  """Estimate the size of the input files of a run, and check it against the
+  memory budget
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data
+
+  Returns (InputEstimate):
+    The estimate if the input does not fit in the budget, otherwise None
+  """
+  if getattr(args, 'max_memory', None) is None or len(args.files) == 0:
+    return None
+  estimate = InputEstimate(args.files, delimiter)
+  if estimate.nbytes > args.max_memory:
+    return estimate
+  return None
+
+
+class SpillStore:
+  """
+  Holds the partial outputs of a chunked run, keyed by output. Partitions are
+  kept in memory until their total size exceeds the budget, at which point all
+  of them are written (pickled) to a temporary directory on local disk. The
+  directory is removed by `cleanup`, or else once the store (and every
+  `SpilledOutput` that reads from it) is garbage collected, or at exit.
+
+  Args:
+    budget (Int): number of bytes partitions may take up in memory
+    directory (String): where to create the temporary directory, defaults to
+                        the system's temporary directory
+  """
+
+  def __init__(self, budget, directory = None):
+    self.budget = budget
+    self.nbytes = 0
+    self.spilled = 0
+    self._memory = {}
+    self._disk = {}
+    self._tmp = tempfile.TemporaryDirectory(prefix = 'spill_', dir = directory)
+    self._finalizer = weakref.finalize(self, self._tmp.cleanup)
+    self._lock = threading.Lock()
+
+  def keys(self):
+    return list(dict.fromkeys(list(self._memory) + list(self._disk)))
+
+  def append(self, key, df):
+    """Add a partition of an output"""
+    nbytes = int(df.memory_usage(index = True, deep = True).sum())
+    with self._lock:
+      self._memory.setdefault(key, []).append(df)
+      self._disk.setdefault(key, [])
+      self.nbytes += nbytes
+      if self.nbytes > self.budget:
+        self._spill()
+
+  def _spill(self):
+    for key, parts in self._memory.items():
+      for df in parts:
+        path = os.path.join(self._tmp.name, f'{self.spilled}.pkl')
+        df.to_pickle(path)
+        self._disk[key].append(path)
+        self.spilled += 1
+      self._memory[key] = []
+    self.nbytes = 0
+
+  def load(self, key):
+    """Assemble all partitions of an output, in the order they were added
+
+    Returns:
+      Pandas dataframe
+    """
+    import pandas as pd
+    with self._lock:
+      parts = [ pd.read_pickle(path) for path in self._disk.get(key, []) ] + list(self._memory.get(key, []))
+    if len(parts) == 1:
+      return parts[0]
+    return pd.concat(parts, axis = 0)
+
+  def cleanup(self):
+    self._finalizer()
+
+
+class SpilledOutput(dict):
+  """
+  Entry of a transformer's output whose data is only assembled (from a
+  `SpillStore`) when it is accessed, so that only one output at a time has to
+  fit in memory while the outputs are written
+  """
+
+  def __init__(self, filename, store, key):
+    super().__init__(filename = filename)
+    self.store = store
+    self.key = key
+
+  def __getitem__(self, name):
+    if name == 'data':
+      return self.store.load(self.key)
+    return super().__getitem__(name)
+
+  def __contains__(self, name):
+    return name == 'data' or super().__contains__(name)
@@ -0,0 +1,150 @@
+"""
+Parallel splitting
+
+Splitting a parsed table into its location-year outputs with worker processes
+would normally pickle the whole table to every worker. Instead, the numeric
+values of the table are copied once into a block of shared memory
+(`multiprocessing.shared_memory`), and the row labels are sent once to every
+worker when it starts. Each task then only names a range of rows and a list of
+columns; the worker builds its output from a view of the shared block and
+writes it itself, so no data is sent back either.
+
+Transformers take part by providing `split_tasks(args)`, which returns the
+table of values (indexed by row label) along with its tasks, or None when the
+input cannot be split this way (e.g., it has text columns). The table is let
+go of once it has been copied, so that the input is not held twice.
+
+The columns are laid out in the block in the order the tasks use them, so
+that the columns of a task are usually a contiguous range of the block, which
+its worker views rather than copies.
+"""
+
+import collections
+import multiprocessing
+
+from . import profiling
+
+# A single output: rows `start:stop` of the shared block (all rows if None),
+# the positions of its columns within the block and their names in the output,
+# and whether rows without any values are dropped
+Task = collections.namedtuple('Task', ['filename', 'rows', 'columns', 'names', 'dropna'])
+
+# State of a worker process, set up once by `_attach`
+_worker = {}
+
+
+def _attach(spec, outdir, fmt, manifest):
+  import numpy as np
+  from multiprocessing import shared_memory
+  shm = shared_memory.SharedMemory(name = spec['name'])
+  _worker['shm'] = shm
+  _worker['block'] = np.ndarray(spec['shape'], dtype = spec['dtype'], buffer = shm.buf)
+  _worker['spec'] = spec
+  _worker['outdir'] = outdir
+  _worker['format'] = fmt
+  _worker['manifest'] = manifest
+
+def _columns(columns):
+  """Index of the columns of a task within the block: a slice when they are a
+  contiguous range, so that indexing the block gives a view rather than a copy
+
+  Example cases:
+    >>> _columns([2, 3, 4])
+    slice(2, 5, None)
+    >>> _columns([4, 2])
+    [4, 2]
+  """
+  if len(columns) > 0 and list(columns) == list(range(columns[0], columns[0] + len(columns))):
+    return slice(columns[0], columns[0] + len(columns))
+  return list(columns)
+
+def _build(task):
+  import pandas as pd
+  spec = _worker['spec']
+  start, stop = task.rows if task.rows is not None else (0, spec['shape'][0])
+  # A view of the rows and columns of the task
+  values = _worker['block'][start:stop, _columns(task.columns)]
+  index = pd.Index(spec['index'][start:stop], name = spec['index_name'])
+  data = pd.DataFrame(values, index = index, columns = task.names, copy = False)
+  # Restore the types of columns that did not share the type of the block
+  dtypes = { name: spec['dtypes'][c] for c, name in zip(task.columns, task.names) if spec['dtypes'][c] != spec['dtype'] }
+  if dtypes:
+    data = data.astype(dtypes)
+  if task.dropna:
+    data = data.dropna(how = 'all')
+  return data
+
+def _run(task):
+  from . import writers
+  from .manifest import frame_digest
+  data = _build(task)
+  manifest = _worker['manifest']
+  filename = writers.output_filename(task.filename, _worker['format'])
+  digest = None
+  if manifest is not None:
+    digest = frame_digest(data)
+    if manifest.is_current(filename, digest):
+      return filename, digest, None
+  path = writers.write(data, _worker['outdir'], task.filename, _worker['format'])
+  return filename, digest, path
+
+def split(shared, outdir, fmt, workers, manifest = None):
+  """Build and write outputs from a table on worker processes, which share the
+  memory of its values
+
+  Args:
+    shared (List): numeric values, indexed by row label, and the outputs to
+                   build (see `Task`), as returned by `split_tasks`. The values
+                   are taken out of the list once they have been copied to
+                   shared memory.
+    outdir (String): path of output directory
+    fmt (String): output format (see `writers.FORMATS`)
+    workers (Int): number of worker processes
+    manifest (Manifest): manifest of an incremental run, or None
+
+  Returns (List):
+    (filename, digest, path) of every output, in the order of the tasks. The
+    path is None if the output was left untouched, and the digest is None
+    outside of incremental runs.
+  """
+  import numpy as np
+  from multiprocessing import shared_memory
+
+  values, tasks = shared
+  shared.clear()
+  # Columns in the order the tasks use them; those that no task uses are left
+  # out
+  layout = list(dict.fromkeys([ c for task in tasks for c in task.columns ]))
+  position = { c: k for k, c in enumerate(layout) }
+  tasks = [ task._replace(columns = [ position[c] for c in task.columns ]) for task in tasks ]
+  dtypes = [ np.dtype(values.dtypes.iloc[c]) for c in layout ]
+  dtype = np.result_type(*dtypes) if dtypes else np.dtype('float64')
+  shape = (values.shape[0], len(layout))
+  shm = shared_memory.SharedMemory(create = True, size = max(1, int(np.prod(shape)) * dtype.itemsize))
+  try:
+    block = np.ndarray(shape, dtype = dtype, buffer = shm.buf)
+    # Copy a column at a time, so that the values are not held twice over
+    for k, c in enumerate(layout):
+      block[:, k] = values.iloc[:, c].to_numpy(dtype = dtype)
+    spec = {
+      'name': shm.name,
+      'shape': shape,
+      'dtype': dtype.str,
+      'dtypes': [ t.str for t in dtypes ],
+      'index': values.index.tolist(),
+      'index_name': values.index.name,
+    }
+    # The block holds the values from here on
+    del values
+    # Workers are started fresh rather than forked, as the caller may be
+    # running other threads (e.g., in service mode)
+    context = multiprocessing.get_context('spawn')
+    with profiling.stage('split') as stage:
+      with context.Pool(max(1, workers), initializer = _attach, initargs = (spec, outdir, fmt, manifest)) as pool:
+        results = pool.map(_run, tasks, chunksize = 1)
+      stage.rows, stage.columns = shape
+    del block
+    return results
+  finally:
+    shm.close()
+    shm.unlink()
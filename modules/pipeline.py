@@ -0,0 +1,169 @@
+"""
+Pipelined execution
+
+Stages of a run (reading, transforming, writing) are connected by bounded
+queues and run on their own threads, so that the disk is kept busy while data
+is being parsed and split, and vice versa. A stage that gets ahead of the next
+one blocks once the queue between them is full, which caps how much data is
+held in memory at any one time.
+
+The input is read a chunk of rows at a time on its own thread (`prefetch`),
+and each chunk is split while the next one is read. Every output holds rows
+from the whole input, so outputs are only assembled, and handed over to the
+writer threads (`run`), once the last chunk has been split.
+"""
+
+import collections
+import concurrent.futures
+import queue
+import threading
+
+# Marks the end of the items in a queue
+_DONE = object()
+
+# Number of rows of an input read at a time when reading overlaps with
+# splitting (see `prefetch`)
+CHUNK_ROWS = 1 << 16
+
+
+def run(source, consume, workers = 1, maxsize = 2):
+  """Consume the items of an iterable on worker threads while it is being
+  produced on another thread
+
+  Args:
+    source (Iterable): items to consume; it is iterated on its own thread
+    consume (function): called on every item, on one of the worker threads
+    workers (Int): number of worker threads
+    maxsize (Int): number of produced items that may wait to be consumed
+
+  Returns (List):
+    Return values of `consume`, in the order they completed
+
+  Raises:
+    The first exception raised while producing or consuming items. Remaining
+    items are neither produced nor consumed once that happens.
+  """
+  workers = max(1, workers)
+  items = queue.Queue(maxsize = max(1, maxsize))
+  stop = threading.Event()
+  errors = []
+  results = []
+  lock = threading.Lock()
+
+  def fail(e):
+    with lock:
+      errors.append(e)
+    stop.set()
+
+  def produce():
+    try:
+      for item in source:
+        # Wait for room in the queue, unless a consumer has failed
+        while not stop.is_set():
+          try:
+            items.put(item, timeout = 0.1)
+            break
+          except queue.Full:
+            continue
+        if stop.is_set():
+          break
+    except BaseException as e:
+      fail(e)
+    finally:
+      for _ in range(workers):
+        items.put(_DONE)
+
+  def work():
+    while True:
+      item = items.get()
+      if item is _DONE:
+        return
+      # Keep draining the queue after a failure, so the producer never blocks
+      if stop.is_set():
+        continue
+      try:
+        result = consume(item)
+        with lock:
+          results.append(result)
+      except BaseException as e:
+        fail(e)
+
+  threads = [ threading.Thread(target = produce, name = 'pipeline-produce') ]
+  threads += [ threading.Thread(target = work, name = f'pipeline-consume-{i}') for i in range(workers) ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  if errors:
+    raise errors[0]
+  return results
+
+def ordered_map(func, items, workers = 2, ahead = 2):
+  """Apply a function to items on worker threads, at most `ahead` items ahead
+  of the caller, and yield the results in the order of the items
+
+  Args:
+    func (function): function to apply
+    items (Iterable): items to apply it to
+    workers (Int): number of worker threads
+    ahead (Int): number of results that may wait to be consumed
+  """
+  with concurrent.futures.ThreadPoolExecutor(max_workers = max(1, workers)) as executor:
+    pending = collections.deque()
+    for item in items:
+      pending.append(executor.submit(func, item))
+      if len(pending) > max(1, ahead):
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+def prefetch(source, ahead = 2):
+  """Iterate over an iterable on its own thread, at most `ahead` items ahead of
+  the caller
+
+  Args:
+    source (Iterable): items to produce, e.g., the chunks of an input
+    ahead (Int): number of produced items that may wait to be consumed
+
+  Yields:
+    The items of `source`, in order
+
+  Raises:
+    Whatever exception producing the items raised
+  """
+  items = queue.Queue(maxsize = max(1, ahead))
+  stop = threading.Event()
+
+  def put(item):
+    # Wait for room in the queue, unless the caller stopped iterating
+    while not stop.is_set():
+      try:
+        items.put(item, timeout = 0.1)
+        return True
+      except queue.Full:
+        continue
+    return False
+
+  def produce():
+    try:
+      for item in source:
+        if not put((item, None)):
+          return
+    except BaseException as e:
+      put((_DONE, e))
+      return
+    put((_DONE, None))
+
+  thread = threading.Thread(target = produce, name = 'pipeline-prefetch')
+  thread.start()
+  try:
+    while True:
+      item, error = items.get()
+      if item is _DONE:
+        if error is not None:
+          raise error
+        return
+      yield item
+  finally:
+    stop.set()
+    thread.join()
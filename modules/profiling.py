@@ -0,0 +1,184 @@
+"""
+Per-stage profiling
+
+Readers, transformers and writers mark the stages of a run (read, parse,
+split, write) with `profiling.stage`. Unless profiling has been enabled, a
+stage does nothing. Once enabled, the wall time and the number of rows, columns
+and bytes processed are recorded for each stage, and summed over stages that
+run more than once (e.g., writing each output file). The peak resident memory
+of a process only ever grows, so each stage records how far it raised that
+peak (`peak_rss_increase`), and the report gives the peak of the whole
+process.
+
+  with profiling.stage('read') as s:
+    df = ...
+    s.rows, s.columns = df.shape
+"""
+
+import contextlib
+import cProfile
+import json
+import sys
+import threading
+import time
+
+try:
+  import resource
+except ImportError:
+  # Not available on Windows
+  resource = None
+
+
+def peak_rss():
+  """Peak resident memory of the process
+
+  Returns (Int):
+    Number of bytes, or None if it cannot be determined on this platform
+  """
+  if resource is None:
+    return None
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS reports bytes
+  return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Stage:
+  """Measurements of a single run of a stage. Callers fill in the amount of
+  data they processed."""
+
+  __slots__ = ['name', 'rows', 'columns', 'bytes']
+
+  def __init__(self, name):
+    self.name = name
+    self.rows = 0
+    self.columns = 0
+    self.bytes = 0
+
+
+class Profiler:
+  """
+  Collects measurements of every stage
+
+  Args:
+    cprofile (Boolean): also run every stage under cProfile, so that the
+                        slowest stage can be dumped for inspection
+  """
+
+  def __init__(self, cprofile = False):
+    self.cprofile = cprofile
+    self.stages = {}
+    self.profiles = {}
+    self.start = time.perf_counter()
+    self._lock = threading.Lock()
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    record = Stage(name)
+    profile = None
+    if self.cprofile:
+      profile = self.profiles.setdefault(name, cProfile.Profile())
+      try:
+        profile.enable()
+      except ValueError:
+        # Another stage is already being profiled (e.g., on another thread)
+        profile = None
+    baseline = peak_rss()
+    start = time.perf_counter()
+    try:
+      yield record
+    finally:
+      seconds = time.perf_counter() - start
+      if profile is not None:
+        profile.disable()
+      peak = peak_rss()
+      self._add(record, seconds, None if peak is None else peak - baseline)
+
+  def _add(self, record, seconds, increase):
+    with self._lock:
+      totals = self.stages.setdefault(record.name, { 'calls': 0, 'seconds': 0.0, 'rows': 0, 'columns': 0, 'bytes': 0 })
+      totals['calls'] += 1
+      totals['seconds'] += seconds
+      totals['rows'] += record.rows
+      totals['columns'] = max(totals['columns'], record.columns)
+      totals['bytes'] += record.bytes
+      if increase is not None:
+        totals['peak_rss_increase'] = max(totals.get('peak_rss_increase', 0), increase)
+
+  def report(self):
+    """Summarize the measurements
+
+    Returns (dict):
+      Total wall time, overall peak memory and measurements of each stage
+    """
+    stages = {}
+    for name, totals in self.stages.items():
+      stage = dict(totals)
+      seconds = stage['seconds']
+      stage['rows_per_second'] = stage['rows'] / seconds if seconds > 0 else None
+      stage['bytes_per_second'] = stage['bytes'] / seconds if seconds > 0 else None
+      stages[name] = stage
+    return {
+      'seconds': time.perf_counter() - self.start,
+      'peak_rss': peak_rss(),
+      'stages': stages,
+    }
+
+  def hot_stage(self):
+    """Name of the stage that took the most time"""
+    if not self.stages:
+      return None
+    return max(self.stages, key = lambda name: self.stages[name]['seconds'])
+
+  def save(self, path, cprofile_path = None):
+    """Write the report as JSON, and optionally the cProfile statistics of the
+    slowest stage
+
+    Args:
+      path (String): path of the JSON report
+      cprofile_path (String): path of the cProfile dump (see `pstats`)
+    """
+    report = self.report()
+    hot = self.hot_stage()
+    report['hot_stage'] = hot
+    if cprofile_path is not None and hot in self.profiles:
+      self.profiles[hot].dump_stats(cprofile_path)
+      report['cprofile'] = cprofile_path
+    with open(path, 'w') as ofp:
+      json.dump(report, ofp, indent = 2)
+    return report
+
+
+class _Disabled:
+  """Stand-in for a profiler that records nothing"""
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    yield Stage(name)
+
+
+_profiler = _Disabled()
+
+def enable(cprofile = False):
+  """Start recording stages for the rest of the process
+
+  Args:
+    cprofile (Boolean): also run every stage under cProfile
+
+  Returns (Profiler):
+    The profiler that records every stage
+  """
+  global _profiler
+  _profiler = Profiler(cprofile)
+  return _profiler
+
+def disable():
+  global _profiler
+  _profiler = _Disabled()
+
+def stage(name):
+  """Mark a stage of the run (see module documentation)
+
+  Args:
+    name (String): name of the stage (e.g., 'read')
+  """
+  return _profiler.stage(name)
@@ -0,0 +1,94 @@
+"""
+Transformer registry
+
+Transformers are looked up by name from the modules that live next to this
+file, plus any that are installed by other packages under the
+`gwasdatatransformers.transformers` entry point group. Looking up names does
+not import anything; a transformer module (and pandas along with it) is only
+imported once it is loaded to be run.
+
+A transformer hands its outputs back in one of three ways:
+  - `stream(args)` yields `(filename, frame)` pairs, building each output only
+    once the previous one was written
+  - `process(args)` returns (or yields) the same pairs
+  - `process(args)` returns a dict of `{'filename': ..., 'data': ...}` entries,
+    as the original transformers did
+
+`outputs()` turns all of them into the first form. Transformers that write
+their own output (e.g., cut) return None.
+"""
+
+import importlib
+import os
+
+ENTRY_POINT_GROUP = 'gwasdatatransformers.transformers'
+
+
+def _builtin():
+  directory = os.path.dirname(os.path.abspath(__file__))
+  return set([ f[:-3] for f in os.listdir(directory) if not f.startswith('_') and f.endswith('.py') ])
+
+def _entry_points():
+  try:
+    from importlib.metadata import entry_points
+  except ImportError:
+    # Python 3.7 does not ship importlib.metadata
+    return {}
+  try:
+    eps = entry_points(group = ENTRY_POINT_GROUP)
+  except TypeError:
+    # Python < 3.10 does not support selecting by group
+    eps = entry_points().get(ENTRY_POINT_GROUP, [])
+  return { ep.name: ep for ep in eps }
+
+def available():
+  """List the names of all known transformers without importing them
+
+  Returns (List):
+    Sorted list of transformer names
+  """
+  return sorted(_builtin() | set(_entry_points()))
+
+def load(name):
+  """Import a transformer by name
+
+  Args:
+    name (String): name of the transformer (e.g., 'csv')
+
+  Returns (Module):
+    The transformer module, which provides a `process(args)` function
+  """
+  if name is None:
+    raise Exception("No transformer was supplied. Cannot process data. Aborting.")
+  if name in _builtin():
+    return importlib.import_module(f'{__name__}.{name}')
+  entry_points = _entry_points()
+  if name in entry_points:
+    return entry_points[name].load()
+  raise Exception(f"Unknown transformer `{name}`. Available transformers: {available()}. Aborting.")
+
+def _from_dict(dfs):
+  # Hand the entries over one at a time, and let go of each before handing
+  # over the next
+  for key in list(dfs):
+    output = dfs.pop(key)
+    yield output['filename'], output['data']
+
+def outputs(transformer, args):
+  """Run a transformer and iterate over its outputs
+
+  Args:
+    transformer (Module): transformer, as returned by `load()`
+    args (Namespace): arguments supplied by user
+
+  Returns (Iterator):
+    `(filename, frame)` pairs, or None if the transformer writes its own output
+  """
+  if hasattr(transformer, 'stream'):
+    return iter(transformer.stream(args))
+  result = transformer.process(args)
+  if result is None:
+    return None
+  if isinstance(result, dict):
+    return _from_dict(result)
+  return iter(result)
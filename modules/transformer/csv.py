@@ -16,11 +16,399 @@ Expected input:
 """
 
 import fileinput
+import os
 
+import numpy as np
 import pandas as pd
 
-from ..helpers import Convert, read_data
+from .. import parallel
+from .. import pipeline
+from .. import profiling
+from .. import writers
+from ..helpers import Convert, read_chunks, read_data, reads_ahead
+from ..memory import BYTES_PER_CELL, BYTES_PER_LABEL, InputEstimate, SpillStore, SpilledOutput, format_size, over_budget
+from ..verify import MISSING, Report, compare, unexpected_files
 
+# Size of the dense chunks that are read at a time with --sparse
+SPARSE_CHUNK_BYTES = 64 << 20
+
+
+def groups(columns):
+  """Group the trait columns of a long-format table by the file they belong to
+
+  Args:
+    columns (List): column names; the first is the row label (e.g., Pedigree)
+
+  Returns (dict):
+    Filename (e.g., 'FL_2006') -> trait columns, sorted by filename
+  """
+  result = {}
+  for trait in columns[1:]:
+    result.setdefault(Convert.loyr_to_filename(trait), []).append(trait)
+  return { filename: result[filename] for filename in sorted(result) }
+
+def split(df, filename, traits):
+  """Build the output of a single location-year
+
+  Args:
+    df (DataFrame): long-format table (or some of its rows)
+    filename (String): basename of the output (e.g., 'FL_2006')
+    traits (List): trait columns of the location-year
+
+  Returns (DataFrame):
+    Traits of the lines grown in the location-year, indexed by row label
+  """
+  # Only include relevant column, set row label as index, and drop any rows that have all missing values
+  data = df.reindex(columns = [df.columns[0]] + traits).set_index(df.columns[0]).dropna(how = 'all')
+  # Rename columns to omit location-year pairs
+  data.columns = [ Convert.trait_to_column(t) for t in traits ]
+  return data
+
+def split_sparse(df, filename, traits):
+  """Build the output of a single location-year from a table whose traits are
+  sparse columns (see `read_sparse`), from the values that are present alone
+
+  Args:
+    df (DataFrame): long-format table, with sparse trait columns
+    filename (String): basename of the output (e.g., 'FL_2006')
+    traits (List): trait columns of the location-year
+
+  Returns (DataFrame):
+    Traits of the lines grown in the location-year, indexed by row label, as
+    built by `split`
+  """
+  columns = [ df[t] for t in traits ]
+  present = []
+  for column in columns:
+    if isinstance(column.dtype, pd.SparseDtype):
+      present.append(column.array.sp_index.indices)
+    else:
+      present.append(np.flatnonzero(column.notna().to_numpy()))
+  # Lines grown in the location-year are those with a value for any of its
+  # traits
+  rows = np.unique(np.concatenate(present)) if present else np.array([], dtype = np.int64)
+  data = {}
+  for trait, column, positions in zip(traits, columns, present):
+    if isinstance(column.dtype, pd.SparseDtype):
+      values = np.full(rows.size, np.nan)
+      values[np.searchsorted(rows, positions)] = column.array.sp_values
+      data[Convert.trait_to_column(trait)] = values
+    else:
+      data[Convert.trait_to_column(trait)] = column.iloc[rows].to_numpy()
+  index = pd.Index(df.iloc[rows, 0], name = df.columns[0])
+  return pd.DataFrame(data, index = index, columns = [ Convert.trait_to_column(t) for t in traits ])
+
+def header(files, delimiter):
+  """Column names of all input files, in the order they first appear"""
+  columns = []
+  for f in files:
+    columns += [ c for c in pd.read_table(f, delimiter = delimiter, nrows = 0).columns if c not in columns ]
+  return columns
+
+def read_sparse(args, delimiter = ','):
+  """Read the input a few rows at a time, and hold every float column (i.e.,
+  the traits, most of whose values are missing) as a sparse column, so that
+  only the values that are present take up memory
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data
+
+  Returns (DataFrame):
+    Long-format table
+  """
+  if len(args.files) == 0:
+    raise Exception("--sparse cannot read from STDIN. Supply the input files instead. Aborting.")
+  columns = header(args.files, delimiter)
+  chunk_rows = max(1, SPARSE_CHUNK_BYTES // (BYTES_PER_CELL * len(columns)))
+  parts = []
+  for chunk in read_chunks(args.files, delimiter, chunk_rows):
+    # Files that lack some of the columns have no values for them
+    chunk = chunk.reindex(columns = columns)
+    with profiling.stage('sparsify') as stage:
+      for c in chunk.columns[1:]:
+        if pd.api.types.is_float_dtype(chunk[c].dtype):
+          chunk[c] = pd.arrays.SparseArray(chunk[c].to_numpy(), fill_value = np.nan)
+      stage.rows, stage.columns = chunk.shape
+    parts.append(chunk)
+  with profiling.stage('concat') as stage:
+    df = pd.concat(parts, axis = 0, ignore_index = True, sort = False) if parts else pd.DataFrame(columns = columns)
+    stage.rows, stage.columns = df.shape
+  return df
+
+def process_chunked(args, delimiter, estimate, store):
+  """Process data that does not fit in the memory budget, a few rows at a time.
+  The outputs are assembled from partitions that are spilled to disk as needed.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data
+    estimate (InputEstimate): estimated size of the input
+    store (SpillStore): where the partitions of the outputs are kept
+  """
+  budget = args.max_memory
+  columns = header(args.files, delimiter)
+  traits = groups(columns)
+
+  # The largest output has to be assembled in memory to be written
+  largest = max([ len(t) for t in traits.values() ] + [0])
+  required = estimate.rows * (largest * BYTES_PER_CELL + BYTES_PER_LABEL) + budget // 4
+  if required > budget:
+    raise Exception(f"Cannot fit the largest output ({largest} traits x ~{estimate.rows} lines) in --max-memory "
+                    f"{format_size(budget)}. An estimated {format_size(required)} is needed. Aborting.")
+
+  for chunk in read_chunks(args.files, delimiter, estimate.chunk_rows(budget)):
+    chunk = chunk.reindex(columns = columns)
+    with profiling.stage('split') as stage:
+      for filename, t in traits.items():
+        store.append(filename, split(chunk, filename, t))
+      stage.rows, stage.columns = chunk.shape
+
+  return { filename: SpilledOutput('.'.join([filename, 'csv']), store, filename) for filename in traits }
+
+def process_pipelined(args, delimiter):
+  """Split the input a chunk of rows at a time while the next chunk is being
+  read on another thread. Every output is assembled from its partitions once
+  the last chunk has been split.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data
+
+  Yields (String, dict):
+    Key and entry ('filename' and 'data') of each output
+  """
+  columns = header(args.files, delimiter)
+  traits = groups(columns)
+  parts = { filename: [] for filename in traits }
+  for chunk in pipeline.prefetch(read_chunks(args.files, delimiter, pipeline.CHUNK_ROWS)):
+    chunk = chunk.reindex(columns = columns)
+    with profiling.stage('split') as stage:
+      for filename, t in traits.items():
+        parts[filename].append(split(chunk, filename, t))
+      stage.rows, stage.columns = chunk.shape
+  for filename in traits:
+    output = {}
+    output['filename'] = '.'.join([filename, 'csv'])
+    output['data'] = pd.concat(parts.pop(filename), axis = 0)
+    yield filename, output
+
+def inverse_inputs(paths):
+  """List the per-location-year files to rebuild a long-format table from
+
+  Args:
+    paths (List): files, or directories of files (e.g., the output directory
+                  of a previous run, in any of the output formats)
+
+  Returns (List):
+    Paths of the files, those of each directory sorted by name
+  """
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files += sorted([ os.path.join(path, f) for f in os.listdir(path) if writers.format_of(f) is not None and not f.startswith('.') ])
+    else:
+      files.append(path)
+  if not files:
+    raise Exception(f"No location-year files were found in {paths}. Aborting.")
+  seen = {}
+  for f in files:
+    filename = os.path.basename(f).split('.', 1)[0]
+    if filename in seen:
+      raise Exception(f"`{seen[filename]}` and `{f}` hold the same location-year. Aborting.")
+    seen[filename] = f
+  return files
+
+def inverse(args, delimiter = ','):
+  """Rebuild a long-format table from the per-location-year outputs of a run
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Returns (DataFrame):
+    Traits (e.g., weight_FL06) by row label (e.g., Pedigree)
+  """
+  files = inverse_inputs(args.files)
+
+  def read(path):
+    filename = os.path.basename(path).split('.', 1)[0]
+    fmt = writers.format_of(path)
+    if fmt is None or fmt == 'csv':
+      # Float precision helps to avoid rounding errors, but it does hurt performance
+      df = pd.read_table(path, float_precision = 'round_trip', delimiter = delimiter, index_col = 0)
+    else:
+      df = writers.read(os.path.dirname(path), f'{filename}.csv', fmt)
+    # Every column of a file gets the same location-year suffix
+    df.columns = df.columns.astype(str) + Convert.column_to_trait('', filename)
+    return df
+
+  with profiling.stage('read') as stage:
+    workers = min(len(files), os.cpu_count() or 1, 8)
+    frames = list(pipeline.ordered_map(read, files, workers, ahead = workers))
+    stage.bytes = sum(os.path.getsize(f) for f in files)
+  with profiling.stage('join') as stage:
+    # A single outer join on the row labels of all files at once
+    df = pd.concat(frames, axis = 1, join = 'outer', sort = False)
+    df.index.name = frames[0].index.name
+    stage.rows, stage.columns = df.shape
+  return df
+
+def _entries(args, delimiter = ',', cleanup = False):
+  """Build the outputs one at a time
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+    cleanup (Boolean): remove the partitions spilled to disk once every output
+                       has been yielded, as they have all been read back by
+                       then (see `stream`)
+
+  Yields (String, dict):
+    Key and entry ('filename' and 'data') of each output
+  """
+  if args.inverse is not None:
+    yield args.inverse, { 'filename': f'{args.inverse}.csv', 'data': inverse(args, delimiter) }
+    return
+
+  # Inputs that would not fit in the memory budget are read a few rows at a
+  # time instead, unless they are held as sparse columns
+  estimate = over_budget(args, delimiter) if not args.sparse else None
+  if estimate is not None:
+    store = SpillStore(args.max_memory // 2, getattr(args, 'spill_dir', None))
+    try:
+      outputs = process_chunked(args, delimiter, estimate, store)
+    except:
+      store.cleanup()
+      raise
+    try:
+      yield from outputs.items()
+    finally:
+      if cleanup:
+        store.cleanup()
+    return
+
+  # Reading overlaps with splitting (unless the traits are held as sparse
+  # columns, which are built from the whole input)
+  if reads_ahead(args) and not args.sparse:
+    yield from process_pipelined(args, delimiter)
+    return
+
+  df = read_sparse(args, delimiter) if args.sparse else read_data(args, delimiter)
+
+  # Group the traits by the file they belong to; the filenames are used to
+  # access the data stored as dataframes
+  for filename, traits in groups(list(df.columns)).items():
+    with profiling.stage('split') as stage:
+      output = {}
+      output['filename'] = '.'.join([filename, 'csv'])
+      output['data'] = split_sparse(df, filename, traits) if args.sparse else split(df, filename, traits)
+      stage.rows, stage.columns = output['data'].shape
+    yield filename, output
+
+def split_tasks(args, delimiter = ','):
+  """Describe the outputs as tasks over a table of values that worker
+  processes share (see `parallel.split`)
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Returns (List):
+    Trait values indexed by row label, and a task per output. The values are
+    taken out of the list once they are in shared memory. None if the input
+    has to be read in chunks to fit in the memory budget, is held as sparse
+    columns, has text columns, or when rebuilding a long-format table.
+  """
+  if args.inverse is not None or args.sparse or over_budget(args, delimiter) is not None:
+    return None
+  df = read_data(args, delimiter)
+  values = df.set_index(df.columns[0])
+  del df
+  text = [ c for c, t in values.dtypes.items() if not pd.api.types.is_numeric_dtype(t) ]
+  if text:
+    # Text columns cannot be shared, and are split sequentially instead
+    return None
+  positions = { c: i for i, c in enumerate(values.columns) }
+  tasks = []
+  for filename, traits in groups([values.index.name] + list(values.columns)).items():
+    columns = [ positions[t] for t in traits ]
+    names = [ Convert.trait_to_column(t) for t in traits ]
+    tasks.append(parallel.Task('.'.join([filename, 'csv']), None, columns, names, True))
+  return [values, tasks]
+
+def verify(args, delimiter = ','):
+  """Check the outputs of a run in the output directory against its input
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Returns (Report):
+    Mismatches between the outputs and the input
+  """
+  if args.inverse is not None:
+    raise Exception("--verify cannot be combined with --inverse. Aborting.")
+  report = Report()
+  df = read_data(args, delimiter)
+  values = df.set_index(df.columns[0])
+  del df
+  expected_files = []
+  with profiling.stage('verify') as stage:
+    for filename, traits in groups([values.index.name] + list(values.columns)).items():
+      output = writers.output_filename(f'{filename}.csv', args.format)
+      expected_files.append(output)
+      try:
+        found = writers.read(args.outdir, output, args.format)
+      except FileNotFoundError:
+        report.add(output, None, None, 'file', MISSING)
+        continue
+      # Columns are matched back to the traits they came from, and the lines
+      # without any of them are not written
+      found.columns = [ Convert.column_to_trait(c, filename) for c in found.columns ]
+      compare(report, output, values[traits].dropna(how = 'all'), found)
+    unexpected_files(report, args.outdir, writers.FORMATS[args.format][0], expected_files)
+    stage.rows, stage.columns = values.shape
+  return report
+
+def inspect(args, delimiter = ','):
+  """Describe the input from the header of every file alone, without reading
+  any of its values
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Returns (dict):
+    Size of every file, the row label, the traits and location-years (with
+    their number of traits), and the number of columns and (estimated) rows
+  """
+  if len(args.files) == 0:
+    raise Exception("Cannot inspect STDIN. Supply the input files instead. Aborting.")
+  columns = header(args.files, delimiter)
+  return {
+    'files': { f: os.path.getsize(f) for f in args.files },
+    'label': columns[0],
+    'columns': len(columns),
+    # Estimated from the length of the first lines, not counted
+    'estimated_rows': InputEstimate(args.files, delimiter).rows,
+    'traits': sorted(set([ Convert.trait_to_column(t) for t in columns[1:] ])),
+    'location_years': { filename: len(traits) for filename, traits in groups(columns).items() },
+  }
+
+def stream(args, delimiter = ','):
+  """Generate the outputs one at a time, so that each can be written and freed
+  before the next one is built
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Yields (String, DataFrame):
+    Filename and data of each output
+  """
+  for _, output in _entries(args, delimiter, cleanup = True):
+    yield output['filename'], output['data']
 
 def process(args, delimiter = ','):
   """Process data
@@ -30,38 +418,8 @@ def process(args, delimiter = ','):
     delimiter (String): value to split data, default ','
   """
   try:
-    df = read_data(args, delimiter)
-
-    # Create a set of filenames and identifiers
-    # The filenames are used to access the data stored as dataframes,
-    # and the identifiers are used to filter the appropriate columns
-    # to omit irrelevant data in the output dataframe
-    filenames = set()
-    identifiers = set()
-    for trait in df.columns[1:]:
-      filename = Convert.loyr_to_filename(trait)
-      filenames.add(filename)
-      identity = Convert.trait_to_identifier(trait)
-      identifiers.add(identity)
-    filenames = sorted(list(filenames))
-    identifiers = sorted(list(identifiers))
-
-    dfs = {}
-    for index, filename in enumerate(filenames):
-      dfs[filename] = {}
-      dfs[filename]['filename'] = '.'.join([filename, 'csv'])
-      identity = identifiers[index]
-      # Create a regex pattern that joins the identifier with Boolean ORs
-      # Also, make it so that it can be anywhere in the column name and be
-      # included.
-      pattern = f".*{'|'.join([list(df)[0], identity])}.*"
-      # Only include relevant column, set row label as index, and drop any rows that have all missing values
-      dfs[filename]['data'] = df.filter(regex = pattern).set_index(df.columns[0]).dropna(how = 'all')
-      # Rename columns to omit location-year pairs
-      dfs[filename]['data'].columns = [ Convert.trait_to_column(t) for t in dfs[filename]['data'].columns ]
-
     # Return the resultant dataframes
-    return dfs
+    return dict(_entries(args, delimiter))
 
   except:
     raise 
@@ -15,44 +15,302 @@ Expected input:
 
 """
 
+import csv
 import fileinput
+import os
+import re
 
+import numpy as np
 import pandas as pd
 
-from ..helpers import Convert, read_data
+from .. import parallel
+from .. import pipeline
+from .. import profiling
+from .. import writers
+from ..helpers import Convert, read_chunks, read_data, reads_ahead
+from ..memory import SpillStore, SpilledOutput, format_size, over_budget
+from ..verify import MISSING, Report, compare, unexpected_files
 
+# Number of bytes scanned at a time by `inspect`
+INSPECT_BLOCK_BYTES = 1 << 24
 
-def process(args, delimiter = ','):
+
+def process_chunked(args, delimiter, estimate, store):
+  """Process data that does not fit in the memory budget, a few rows at a time.
+  The outputs are assembled from partitions that are spilled to disk as needed.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data
+    estimate (InputEstimate): estimated size of the input
+    store (SpillStore): where the partitions of the outputs are kept
   """
-  Process data
+  budget = args.max_memory
+
+  # The largest output has to be assembled in memory to be written; scan the
+  # "loc" column alone to find out how large it is
+  counts = {}
+  for f in args.files:
+    for chunk in pd.read_table(f, delimiter = delimiter, usecols = ['loc'], chunksize = 1 << 20):
+      for identity, count in chunk['loc'].value_counts(sort = False).items():
+        counts[identity] = counts.get(identity, 0) + count
+  largest = max(list(counts.values()) + [0])
+  required = largest * estimate.row_bytes + budget // 4
+  if required > budget:
+    raise Exception(f"Cannot fit the largest output ({largest} rows) in --max-memory {format_size(budget)}. "
+                    f"An estimated {format_size(required)} is needed. Aborting.")
+
+  for chunk in read_chunks(args.files, delimiter, estimate.chunk_rows(budget)):
+    with profiling.stage('split') as stage:
+      for identity, rows in chunk.groupby('loc', sort = False):
+        store.append(identity, rows.drop(['loc'], axis = 1).set_index(chunk.columns[0]))
+      stage.rows, stage.columns = chunk.shape
+
+  dfs = {}
+  for identity in counts:
+    filename = Convert.loyr_to_filename(identity)
+    dfs[filename] = SpilledOutput(f'{filename}.csv', store, identity)
+  return dfs
+
+def process_pipelined(args, delimiter):
+  """Split the input a chunk of rows at a time while the next chunk is being
+  read on another thread. Every output is assembled from its partitions once
+  the last chunk has been split.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data
+
+  Yields (String, dict):
+    Key and entry ('filename' and 'data') of each output
+  """
+  parts = {}
+  for chunk in pipeline.prefetch(read_chunks(args.files, delimiter, pipeline.CHUNK_ROWS)):
+    with profiling.stage('split') as stage:
+      for identity, rows in chunk.groupby('loc', sort = False):
+        parts.setdefault(identity, []).append(rows.drop(['loc'], axis = 1).set_index(chunk.columns[0]))
+      stage.rows, stage.columns = chunk.shape
+  for identity in list(parts):
+    filename = Convert.loyr_to_filename(identity)
+    output = {}
+    output['filename'] = f'{filename}.csv'
+    output['data'] = pd.concat(parts.pop(identity), axis = 0)
+    yield filename, output
+
+def _entries(args, delimiter = ',', cleanup = False):
+  """Build the outputs one at a time
 
   Args:
     args (Namespace): arguments supplied by user
     delimiter (String): value to split data, default ','
+    cleanup (Boolean): remove the partitions spilled to disk once every output
+                       has been yielded, as they have all been read back by
+                       then (see `stream`)
+
+  Yields (String, dict):
+    Key and entry ('filename' and 'data') of each output
   """
-  try:
-    df = read_data(args, delimiter)
+  # Inputs that would not fit in the memory budget are read a few rows at a
+  # time instead
+  estimate = over_budget(args, delimiter)
+  if estimate is not None:
+    store = SpillStore(args.max_memory // 2, getattr(args, 'spill_dir', None))
+    try:
+      outputs = process_chunked(args, delimiter, estimate, store)
+    except:
+      store.cleanup()
+      raise
+    try:
+      yield from outputs.items()
+    finally:
+      if cleanup:
+        store.cleanup()
+    return
+
+  # Reading overlaps with splitting
+  if reads_ahead(args):
+    yield from process_pipelined(args, delimiter)
+    return
 
-    # The location column contains the LOYR (location, year) value
-    # Get unique values in "loc" column, convert to filename
-    identifiers = df['loc'].unique()
+  df = read_data(args, delimiter)
 
-    dfs = {}
-    for identity in identifiers:
+  # The location column contains the LOYR (location, year) value
+  # Get unique values in "loc" column, convert to filename
+  identifiers = df['loc'].unique()
+
+  for identity in identifiers:
+    with profiling.stage('split') as stage:
       filename = Convert.loyr_to_filename(identity)
-      dfs[filename] = {}
-      dfs[filename]['filename'] = f'{filename}.csv'
+      output = {}
+      output['filename'] = f'{filename}.csv'
       # For each identifier, create a new df that filters for rows with the
       # identifier
       # Select rows where loc == location, year pair
-      dfs[filename]['data'] = df.loc[df['loc'] == identity]
+      output['data'] = df.loc[df['loc'] == identity]
       # Remove 'loc' column
-      dfs[filename]['data'] = dfs[filename]['data'].drop(['loc'], axis = 1)
+      output['data'] = output['data'].drop(['loc'], axis = 1)
       # Set first column as index
-      dfs[filename]['data'] = dfs[filename]['data'].set_index(df.columns[0])
+      output['data'] = output['data'].set_index(df.columns[0])
+      stage.rows, stage.columns = output['data'].shape
+    yield filename, output
+
+def split_tasks(args, delimiter = ','):
+  """Describe the outputs as tasks over a table of values that worker
+  processes share (see `parallel.split`)
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
 
+  Returns (List):
+    Trait values indexed by row label, and a task per output. The values are
+    taken out of the list once they are in shared memory. None if the input
+    has to be read in chunks to fit in the memory budget, or has text columns.
+  """
+  if over_budget(args, delimiter) is not None:
+    return None
+  df = read_data(args, delimiter)
+  identifiers = df['loc'].dropna().unique()
+  # Order the rows by location-year, keeping their order within each, so that
+  # every output is a contiguous range of rows
+  codes = pd.Categorical(df['loc'], categories = identifiers).codes
+  order = np.argsort(codes, kind = 'stable')
+  order = order[codes[order] >= 0]
+  values = df.iloc[order].drop(['loc'], axis = 1).set_index(df.columns[0])
+  del df
+  text = [ c for c, t in values.dtypes.items() if not pd.api.types.is_numeric_dtype(t) ]
+  if text:
+    # Text columns cannot be shared, and are split sequentially instead
+    return None
+  bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength = len(identifiers)))])
+  columns = list(range(values.shape[1]))
+  tasks = []
+  for i, identity in enumerate(identifiers):
+    filename = f'{Convert.loyr_to_filename(identity)}.csv'
+    tasks.append(parallel.Task(filename, (int(bounds[i]), int(bounds[i + 1])), columns, list(values.columns), False))
+  return [values, tasks]
+
+def verify(args, delimiter = ','):
+  """Check the outputs of a run in the output directory against its input
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Returns (Report):
+    Mismatches between the outputs and the input
+  """
+  report = Report()
+  df = read_data(args, delimiter)
+  expected_files = []
+  with profiling.stage('verify') as stage:
+    for identity, rows in df.groupby('loc', sort = False):
+      output = writers.output_filename(f'{Convert.loyr_to_filename(identity)}.csv', args.format)
+      expected_files.append(output)
+      try:
+        found = writers.read(args.outdir, output, args.format)
+      except FileNotFoundError:
+        report.add(output, None, None, 'file', MISSING)
+        continue
+      compare(report, output, rows.drop(['loc'], axis = 1).set_index(df.columns[0]), found)
+    unexpected_files(report, args.outdir, writers.FORMATS[args.format][0], expected_files)
+    stage.rows, stage.columns = df.shape
+  return report
+
+def inspect(args, delimiter = ','):
+  """Describe the input from the header of every file and a scan of its "loc"
+  column alone: the column is picked out of the raw bytes of every line,
+  without parsing the other columns (unless the line has quotes)
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Returns (dict):
+    Size of every file, the row label and columns, the number of rows, and the
+    number of rows of every location-year
+  """
+  if len(args.files) == 0:
+    raise Exception("Cannot inspect STDIN. Supply the input files instead. Aborting.")
+  columns = []
+  locations = {}
+  rows = 0
+  with profiling.stage('scan') as stage:
+    for f in args.files:
+      with open(f, 'rb') as ifp:
+        names = [ c.strip() for c in next(csv.reader([ ifp.readline().decode() ], delimiter = delimiter), []) ]
+        columns += [ c for c in names if c not in columns ]
+        if 'loc' not in names:
+          raise Exception(f"`{f}` has no \"loc\" column. Aborting.")
+        index = names.index('loc')
+        d = re.escape(delimiter.encode())
+        # The loc field of every line that is not blank
+        field = re.compile(rb'^(?=[^\r\n])(?:[^' + d + rb'\n]*' + d + rb'){' + str(index).encode() + rb'}([^' + d + rb'\r\n]*)', re.MULTILINE)
+        def identities(block):
+          if b'"' not in block:
+            return [ identity.decode() for identity in field.findall(block) ]
+          # Quoted fields may hold the delimiter, so the lines with quotes are
+          # parsed in full
+          found = []
+          for line in block.split(b'\n'):
+            if b'"' not in line:
+              found += [ identity.decode() for identity in field.findall(line) ]
+            elif line.rstrip(b'\r'):
+              row = next(csv.reader([ line.rstrip(b'\r').decode() ], delimiter = delimiter, skipinitialspace = True))
+              found.append(row[index] if index < len(row) else '')
+          return found
+        def blocks():
+          rest = b''
+          while True:
+            block = ifp.read(INSPECT_BLOCK_BYTES)
+            if not block:
+              break
+            # Lines that run over the end of the block are scanned with the next
+            block, _, rest = (rest + block).rpartition(b'\n')
+            yield block
+          yield rest
+        for block in blocks():
+          for identity in identities(block):
+            # Padding around the location-year is not part of it
+            identity = identity.strip()
+            locations[identity] = locations.get(identity, 0) + 1
+            rows += 1
+      stage.bytes += os.path.getsize(f)
+    stage.rows = rows
+  return {
+    'files': { f: os.path.getsize(f) for f in args.files },
+    'label': columns[0],
+    'columns': columns,
+    'rows': rows,
+    # Rows without a location-year are not in any output
+    'location_years': { identity: count for identity, count in locations.items() if identity },
+  }
+
+def stream(args, delimiter = ','):
+  """Generate the outputs one at a time, so that each can be written and freed
+  before the next one is built
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+
+  Yields (String, DataFrame):
+    Filename and data of each output
+  """
+  for _, output in _entries(args, delimiter, cleanup = True):
+    yield output['filename'], output['data']
+
+def process(args, delimiter = ','):
+  """
+  Process data
+
+  Args:
+    args (Namespace): arguments supplied by user
+    delimiter (String): value to split data, default ','
+  """
+  try:
     # Return the resultant dataframes
-    return dfs
+    return dict(_entries(args, delimiter))
 
   except:
     raise 
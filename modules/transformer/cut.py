@@ -1,15 +1,40 @@
 """PandaPiper
+
+Split a genotype (.012) dataset into one dataset per chromosome (or scaffold).
+
+Common usage:
+  python -m modules.transformer.cut -g in.012 -p in.012.pos -i in.012.indv -o outdir -n setaria
+  python modules/transformer/cut.py -g in.012 -p in.012.pos -i in.012.indv -o outdir -n setaria
 """
-import pandas as pd
 import os
 import sys
-import fileinput as fi
 import datetime
 import argparse
+import collections
+import hashlib
+import itertools
+import json
 import shutil
+import tempfile
+import time
+
+if __name__ == '__main__' and not __package__:
+  # Run as a script (python modules/transformer/cut.py) rather than as a
+  # module. The directory of the script would shadow the standard library
+  # (csv), so the root of the repository takes its place.
+  sys.path[0] = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  __package__ = 'modules.transformer'
+
 from pprint import pprint
+import numpy as np
 from tqdm import tqdm
 
+from .. import genotype
+from .. import profiling
+from ..memory import format_size, parse_size
+from ..manifest import Manifest, file_digest, run_options
+from ..verify import MISSING, Report, values_digest
+
 
 def stripLine(line):
 	"""Converts a tab-delimited string to a list. Each element is trimmed of
@@ -26,122 +51,1072 @@ def stripLine(line):
 			xs[i] = 'NA'
 	return xs
 
-def process(args):
-  """General processing function that does all the heavy lifting in terms of
-  reading the input files and splitting them into individual files based on
-  chromosome (or scaffold)
+# Bytes that may make up the calls of a row that can be sliced without parsing
+# it (see `slice_row`)
+_CALLS = b'012\t'
+_CALLS_OR_MISSING = b'012-\t'
+
+def slice_row(line, bounds):
+  """Cut the columns of every chromosome out of a raw .012 row without
+  splitting it into cells. In a row where every call is a single character,
+  column N starts at a fixed offset from the start of the calls; in a row with
+  missing calls (-1), the offsets are found from the positions of its tabs.
+
+  Args:
+    line (bytes): row of the .012 file, including its row index
+    bounds (List): chromosome, first and last column + 1 of every chromosome
+
+  Returns (List):
+    Calls of each chromosome separated by tabs (missing calls as NA), or None if
+    the row has anything but calls and tabs in it and has to be parsed instead
   """
-  # Get all of the output directory info and set up the folderimport shutil
-  try:
-    if os.path.isdir(args.outdir):
-      shutil.rmtree(args.outdir)
-    os.mkdir(args.outdir)
-  except:
-    raise
-
-  if args.debug:
-    print('/============= .pos =============')
-  posfp = fi.input(args.positions)
-  length_of_positions_file = 0
-  with open(args.positions, 'r') as tmpposfp:
-    for line in tmpposfp:
-      length_of_positions_file += 1
-  erdbeere = {}
-  current_chromosome = None
-  max_lineno = 0
-  for line in tqdm(posfp, desc = "extract postions (by chromosome)", total = length_of_positions_file):
-    line = stripLine(line)
-    if args.debug:
-      print(line)
-    chromosome, snp = line
-    if current_chromosome != chromosome:
-      current_chromosome = chromosome
-      erdbeere[chromosome] = {}
-      erdbeere[chromosome]['data'] = {}
-      erdbeere[chromosome]['data']['genotype'] = []
-      erdbeere[chromosome]['min'] = posfp.lineno()
-    erdbeere[chromosome]['max'] = posfp.lineno()
-    prefix = current_chromosome[:3].lower()
-    id_num = str(int(current_chromosome[-2:]))
-    filename = f'{args.outdir}/{prefix}{id_num}_{args.name}.012.pos'
-    message = f"{str(int(current_chromosome[-2:]))}\t{snp}\n"
-    with open(filename, 'a+') as ofp:
-      ofp.write(message)
-  # Make sure to define the upper bound for the last chromosome
-  erdbeere[current_chromosome]['max'] = posfp.lineno()
+  start = line.find(b'\t') + 1
+  end = len(line) - 1 if line.endswith(b'\n') else len(line)
+  if start == 0 or end <= start:
+    return None
+  view = memoryview(line)[start:end]
+  calls = view.tobytes()
+  last = max([ upper for _, _, upper in bounds ] + [1]) - 1
+  if not calls.translate(None, _CALLS) and len(calls) % 2 == 1 and calls.count(b'\t') == len(calls) // 2 and calls[1::2].count(b'\t') == len(calls) // 2:
+    # Fixed width: a single character and a tab per call
+    if (len(calls) + 1) // 2 < last:
+      return None
+    return [ view[2 * (lower - 1):2 * (upper - 1) - 1] for _, lower, upper in bounds ]
+  if not calls.translate(None, _CALLS_OR_MISSING):
+    tabs = np.flatnonzero(np.frombuffer(calls, dtype = np.uint8) == 9)
+    if tabs.size + 1 < last:
+      return None
+    starts = np.concatenate([[0], tabs + 1])
+    ends = np.concatenate([tabs, [len(calls)]])
+    return [ calls[starts[lower - 1]:ends[upper - 2]].replace(b'-1', b'NA') for _, lower, upper in bounds ]
+  return None
 
-  if args.verbose:
-    pprint(erdbeere)
+class ChromosomeOutput:
+  """
+  Destination of one of the output files of a chromosome. Whatever is written
+  is sent to the file (unless it is None) and, for incremental runs, hashed so
+  that it can be compared to the previous run.
+  """
+
+  def __init__(self, path = None, digest = False, buffering = -1, binary = False, offset = None):
+    self.fp = None
+    if path is not None and offset is not None:
+      # Pick up where a previous run left off, dropping whatever it wrote after
+      self.fp = open(path, 'r+b' if binary else 'r+', buffering = buffering)
+      self.fp.truncate(offset)
+      self.fp.seek(offset)
+    elif path is not None:
+      self.fp = open(path, 'wb' if binary else 'w', buffering = buffering)
+    self.path = path
+    self.hash = hashlib.sha256() if digest else None
+    self.binary = binary
+
+  def flush(self):
+    """Make sure that everything written so far is on disk
+
+    Returns (Int):
+      Size of the file
+    """
+    if self.fp is None:
+      return 0
+    self.fp.flush()
+    os.fsync(self.fp.fileno())
+    return self.fp.tell()
+
+  def write(self, message):
+    if self.fp is not None:
+      self.fp.write(message)
+    if self.hash is not None:
+      self.hash.update(message if self.binary else message.encode())
+
+  def close(self):
+    if self.fp is not None:
+      self.fp.close()
+
+class Checkpoint:
+  """
+  Progress of a split, saved in the output directory every `interval` seconds
+  so that an interrupted run can be resumed (--resume): the number of rows of
+  the .012 file that were written in full, the offset of the next row, and the
+  size of every genotype output at that point. The positions and individuals
+  of every chromosome are written before the first checkpoint.
+
+  Args:
+    outdir (String): path of output directory
+    identity (dict): options and inputs of the run; a checkpoint is only
+                     resumed by a run with the same identity
+    interval (Float): number of seconds between checkpoints
+  """
+
+  FILENAME = '.checkpoint.json'
+
+  def __init__(self, outdir, identity, interval = 60):
+    self.path = os.path.join(outdir, self.FILENAME)
+    self.identity = json.loads(json.dumps(identity))
+    self.interval = interval
+    self.saved = time.monotonic()
+
+  def load(self):
+    """Read the checkpoint of a previous run with the same identity
+
+    Returns (dict):
+      'row', 'offset' and 'outputs' (filename -> size), or None if there is no
+      checkpoint to resume from
+    """
+    if not os.path.exists(self.path):
+      return None
+    with open(self.path, 'r') as ifp:
+      state = json.load(ifp)
+    if state.get('identity') != self.identity:
+      return None
+    return state
+
+  def due(self):
+    return time.monotonic() - self.saved >= self.interval
+
+  def save(self, row, offset, outputs):
+    """Record that the first `row` rows were written in full
+
+    Args:
+      row (Int): number of rows (of those selected) written in full
+      offset (Int): offset in the .012 file of the next row
+      outputs (dict): chromosome -> ChromosomeOutput of its genotypes
+    """
+    sizes = { os.path.basename(output.path): output.flush() for output in outputs.values() }
+    state = { 'identity': self.identity, 'row': row, 'offset': offset, 'outputs': sizes }
+    tmp = f'{self.path}.tmp'
+    with open(tmp, 'w') as ofp:
+      json.dump(state, ofp, indent = 2, sort_keys = True)
+    os.replace(tmp, self.path)
+    self.saved = time.monotonic()
+
+  def remove(self):
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+def checkpoint_identity(args):
+  """Options and inputs (by size and modification time) of a run, which a
+  resumed run has to share with the one it resumes"""
+  inputs = {}
+  for f in [args.genotypes, args.positions, args.individuals, args.keep_individuals]:
+    if f is not None:
+      stat = os.stat(f)
+      inputs[os.path.abspath(f)] = [stat.st_size, stat.st_mtime_ns]
+  return { 'options': run_options(args), 'inputs': inputs }
+
+# Bytes held in memory per call of a split row (a short string and a reference
+# to it)
+BYTES_PER_CALL = 64
+
+def check_memory(args, chromosomes):
+  """Make sure that a split fits in the memory budget, and pick the size of
+  the write buffers from it
+
+  Args:
+    args (Namespace): arguments supplied by user
+    chromosomes (OrderedDict): column range of every chromosome
+
+  Returns (Int):
+    Size of the write buffer of each output file, or -1 for the default
+  """
+  if args.max_memory is None:
+    return -1
+  snps = sum(c['max'] - c['min'] + 1 for c in chromosomes.values())
+  # A row is held as text and then split into one string per call
+  required = (snps + 1) * (BYTES_PER_CALL + 2)
+  if required > args.max_memory:
+    raise Exception(f"Cannot fit a single genotype row ({snps} SNPs) in --max-memory {format_size(args.max_memory)}. "
+                    f"An estimated {format_size(required)} is needed. Aborting.")
+  # Whatever is left is shared among the write buffers of the output files
+  share = (args.max_memory - required) // max(1, 3 * len(chromosomes))
+  return int(min(max(share, 1 << 13), 1 << 24))
+
+# Suffix of the genotype output of a chromosome, by layout: individual-major
+# (.012), or SNP-major as text or as binary (--transpose)
+GENOTYPE_SUFFIXES = { None: '', 'text': '.snp', 'binary': '.snp.bin' }
+
+def output_files(chromosome, name, qc = False, transpose = None, dedup = False):
+  """Names of the output files of a chromosome"""
+  prefix = genotype.output_name(chromosome, name)
+  files = [f'{prefix}{GENOTYPE_SUFFIXES[transpose]}', f'{prefix}.pos', f'{prefix}.indv']
+  if qc:
+    files += [f'{prefix}.pos.qc', f'{prefix}.indv.qc']
+  if dedup:
+    files += [f'{prefix}.pos.dup']
+  return files
+
+def _format_rate(x):
+  return 'NA' if x != x else f'{x:.6g}'
+
+def write_stats(args, stats, selected, individuals, outdir, selection = None):
+  """Write the QC statistics of every selected chromosome next to its outputs:
+  one row per SNP in `.012.pos.qc` and one row per individual in `.012.indv.qc`
+
+  Args:
+    args (Namespace): arguments supplied by user
+    stats (GenotypeStats): statistics accumulated over the genotypes
+    selected (List): chromosomes to output
+    individuals (List): name of every individual, in the order of the rows
+    outdir (String): path of output directory
+    selection (Selection): SNPs and individuals that passed the filters, if
+                           any; the statistics are those of the input
+  """
+  with profiling.stage('qc') as stage:
+    prefixes = { c: os.path.join(outdir, genotype.output_name(c, args.name)) for c in selected }
+
+    # SNPs, in the order of the .pos file
+    snps = { c: stats.snp_stats(c) for c in selected }
+    offsets = dict.fromkeys(selected, 0)
+    outputs = { c: open(f'{prefixes[c]}.pos.qc', 'w') for c in selected }
+    try:
+      for output in outputs.values():
+        output.write('chromosome\tposition\tcalled\tmissing\tmaf\n')
+      for j, (chromosome, snp) in enumerate(genotype.iter_positions(args.positions)):
+        if chromosome not in outputs:
+          continue
+        called, missing, maf = snps[chromosome]
+        i = offsets[chromosome]
+        offsets[chromosome] += 1
+        if selection is not None and selection.snps is not None and not selection.snps[j]:
+          continue
+        outputs[chromosome].write(f"{genotype.chromosome_number(chromosome)}\t{snp}\t{called[i]}\t{_format_rate(missing[i])}\t{_format_rate(maf[i])}\n")
+    finally:
+      for output in outputs.values():
+        output.close()
+
+    # Individuals, in the order of the .indv file
+    for c in selected:
+      called, missing = stats.individual_stats(c)
+      with open(f'{prefixes[c]}.indv.qc', 'w') as ofp:
+        ofp.write('individual\tcalled\tmissing\n')
+        for r, n, rate in zip(stats.row_ids, called, missing):
+          if selection is not None and selection.rows is not None and not selection.rows[r]:
+            continue
+          name = individuals[r]
+          ofp.write(f"{name}\t{n}\t{_format_rate(rate)}\n")
+    stage.rows = stats.rows
+    stage.columns = stats.snps
+
+def tile_size(args, individuals):
+  """Number of SNPs transposed at a time, so that a tile (and its text, unless
+  the output is binary) takes up at most a quarter of the memory budget, or
+  64 MiB without one"""
+  budget = args.max_memory // 4 if args.max_memory is not None else 64 << 20
+  stored = np.dtype(args.dosage).itemsize if args.dosage is not None else 1
+  per_call = stored if args.transpose == 'binary' else BYTES_PER_CALL
+  return max(1, int(budget // (max(1, individuals) * per_call)))
+
+def write_transposed(matrix, bounds, columns, outputs, binary, tile, dosages = None):
+  """Write the genotypes of every chromosome SNP-major, a tile of SNPs at a time
+
+  Args:
+    matrix (ndarray): calls of the individuals (rows) for every SNP (columns),
+                      usually memory-mapped
+    bounds (List): chromosome, first and last column + 1 (1-based, as in a
+                   split .012 row) of every chromosome to write
+    columns (dict): columns to write of every chromosome, or None for all
+    outputs (dict): chromosome -> ChromosomeOutput
+    binary (Boolean): write the calls as they are stored (8-bit integers, or
+                      compact dosages) rather than text
+    tile (Int): number of SNPs transposed at a time
+    dosages (Dosages): storage of the calls when they are dosages, or None
+  """
+  lookup = np.array(['NA', '0', '1', '2'])
+  for c, lower, upper in bounds:
+    snps = columns[c] if columns is not None else range(lower, upper)
+    for start in range(0, len(snps), tile):
+      if columns is None:
+        block = matrix[:, lower - 1 + start:min(upper, lower + start + tile) - 1]
+      else:
+        block = matrix[:, [ i - 1 for i in snps[start:start + tile] ]]
+      # One row per SNP, one column per individual
+      block = np.ascontiguousarray(block.T)
+      if binary:
+        outputs[c].write(block.tobytes())
+      elif dosages is not None:
+        outputs[c].write(b''.join([ dosages.format(row) for row in block ]))
+      else:
+        outputs[c].write(''.join('\t'.join(row) + '\n' for row in lookup[block + 1].tolist()).encode())
+
+def dosage_storage(args):
+  """Compact storage of the calls, when they are dosages (--dosage)"""
+  if args.dosage is None:
+    return None
+  return genotype.Dosages(args.dosage, args.dosage_precision)
+
+# SNPs (a mask over the .pos file, or None for all of them) and individuals (a
+# mask over the rows, or None for all of them) to output, and the SNP that
+# stands in for each SNP dropped as a duplicate (see
+# `genotype.ColumnHashes.representatives`), if any
+Selection = collections.namedtuple('Selection', ['snps', 'rows', 'representatives'], defaults = [None])
+
+def filtering(args):
+  """Check whether any SNP or individual filter (including --dedup) was
+  requested"""
+  return args.min_maf is not None or args.max_missing is not None or args.max_missing_individual is not None or args.dedup
+
+def keep_rows(args):
+  """Find the rows of the individuals listed in the --keep-individuals file
+
+  Args:
+    args (Namespace): arguments supplied by user
+
+  Returns (ndarray):
+    Mask over the rows of the .012 file (and lines of the .012.indv file)
+  """
+  with open(args.keep_individuals, 'r') as ifp:
+    keep = set([ line.strip() for line in ifp if line.strip() ])
+  with open(args.individuals, 'r') as indvfp:
+    names = [ line.strip() for line in indvfp ]
+  rows = np.array([ name in keep for name in names ], dtype = bool)
+  missing = keep - set(names)
+  if missing:
+    print(f"{len(missing)} of the individuals in {args.keep_individuals} are not in {args.individuals}: {sorted(missing)[:10]}")
+  if not rows.any():
+    raise Exception(f"None of the individuals in {args.keep_individuals} are in {args.individuals}. Aborting.")
+  return rows
+
+def offsets_cache(args):
+  """Directory that the row offsets of the .012 file are kept in between runs
+  (see `genotype.row_offsets`): the output directory, unless nothing is
+  written to disk"""
+  return None if args.debug else args.outdir
+
+def genotype_rows(args, rows = None, binary = False, start = (0, 0), stop = None):
+  """Iterate over the rows of the .012 file. When only some of the rows are
+  wanted, each is read directly at its offset (see `genotype.row_offsets`)
+  rather than reading through the rows in between.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    rows (ndarray): mask of the rows to read, or None for all of them
+    binary (Boolean): yield the rows as bytes rather than text
+    start (Int, Int): row number and offset of the first row to read
+    stop (Int): row number to stop before, or None to read to the end
+
+  Yields (Int, String):
+    Row number and row
+  """
+  row, offset = start
+  if rows is None:
+    with open(args.genotypes, 'rb' if binary else 'r') as genofp:
+      if offset:
+        genofp.seek(offset)
+      for r, line in enumerate(genofp, row):
+        if stop is not None and r >= stop:
+          return
+        yield r, line
+    return
+  offsets = genotype.row_offsets(args.genotypes, offsets_cache(args))
+  with open(args.genotypes, 'rb') as genofp:
+    for r in np.flatnonzero(rows[:offsets.size]):
+      if r < row:
+        continue
+      if stop is not None and r >= stop:
+        return
+      genofp.seek(offsets[r])
+      line = genofp.readline()
+      yield int(r), line if binary else line.decode()
+
+def select(args, chromosomes, rows = None):
+  """First pass of a filtered split: measure every SNP and individual, and
+  decide which of them pass the filters. Only running totals are kept, never
+  the genotypes themselves.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    chromosomes (OrderedDict): column range of every chromosome
+    rows (ndarray): mask of the rows to consider, or None for all of them
+
+  Returns (GenotypeStats, Selection):
+    Statistics of the input, and the SNPs and individuals to keep
+  """
+  dosages = dosage_storage(args)
+  stats = genotype.GenotypeStats(chromosomes, dosages = dosages)
+  # Duplicate SNPs are found from a running hash of their calls
+  hashes = genotype.ColumnHashes(stats.snps) if args.dedup else None
+  length_of_genotype_file = genotype.count_lines(args.genotypes)
+  total = length_of_genotype_file if rows is None else int(rows.sum())
+  with profiling.stage('filter') as stage:
+    for r, line in tqdm(genotype_rows(args, rows), desc = "measure genotype (by line)", total = total):
+      calls = dosages.parse(line, stats.snps) if dosages is not None else genotype.parse_calls(line, stats.snps)
+      stats.add_calls(calls, r)
+      if hashes is not None:
+        hashes.add_calls(calls)
+    stage.rows = stats.rows
+    stage.columns = stats.snps
+    stage.bytes = os.path.getsize(args.genotypes)
+
+  _, missing, maf = stats.snp_stats()
+  snps = np.ones(stats.snps, dtype = bool)
+  # SNPs without any calls have no allele frequency, and never pass --min-maf
+  if args.min_maf is not None:
+    snps &= np.nan_to_num(maf, nan = -1) >= args.min_maf
+  if args.max_missing is not None:
+    snps &= missing <= args.max_missing
+  if args.max_missing_individual is not None:
+    passed = np.zeros(length_of_genotype_file, dtype = bool)
+    passed[stats.row_ids] = stats.individual_missing() <= args.max_missing_individual
+    rows = passed if rows is None else rows & passed
+  # Of the SNPs that passed, only the first of those with identical calls
+  # (over every individual measured) within a chromosome is kept
+  representatives = None
+  if hashes is not None:
+    representatives = hashes.representatives([ (c['min'] - 1, c['max']) for c in chromosomes.values() ], snps)
+    snps &= representatives < 0
+    print(f"Dropping {int((representatives >= 0).sum())} SNPs identical to another")
+  print(f"Keeping {int(snps.sum())} of {stats.snps} SNPs and "
+        f"{stats.rows if rows is None else int(rows.sum())} of {stats.rows} individuals")
+  return stats, Selection(snps, rows, representatives)
+
+def split(args, chromosomes, selected, outdir = None, digest = False, echo = True, buffering = -1, selection = None, stats = None,
+          checkpoint = None, resume = None, stop = None):
+  """Split the input into one .012, .012.pos and .012.indv file per chromosome
+  in a single pass over each input file
+
+  Args:
+    args (Namespace): arguments supplied by user
+    chromosomes (OrderedDict): column range of every chromosome
+    selected (List): chromosomes to output
+    outdir (String): path of output directory, or None to not write anything
+    digest (Boolean): hash the output of each chromosome
+    echo (Boolean): print what is written when running verbosely
+    buffering (Int): size of the write buffer of each output file
+    selection (Selection): SNPs and individuals to keep, or None for all
+    stats (GenotypeStats): statistics of the input, if already measured
+    checkpoint (Checkpoint): where to record the progress of the split
+    resume (dict): row and offset to start from ('row', 'offset') and the size
+                   of every genotype output to continue ('outputs', None to
+                   start them afresh), e.g., the state of a checkpoint. The
+                   positions and individuals are then not written.
+    stop (Int): row of the .012 file to stop before, or None to split all rows
+
+  Returns (dict):
+    Chromosome -> hex digest of its output, if `digest` is set
+  """
+  def open_outputs(suffix, binary = False, sizes = None):
+    outputs = {}
+    for c in selected:
+      path = None
+      filename = f'{genotype.output_name(c, args.name)}{suffix}'
+      if outdir is not None:
+        path = os.path.join(outdir, filename)
+      offset = sizes[filename] if sizes is not None else None
+      outputs[c] = ChromosomeOutput(path, digest, buffering, binary, offset)
+    return outputs
+
+  hashes = { c: hashlib.sha256() for c in selected }
+
+  verbose = args.verbose and echo
+
+  # Positions
+  # (positions and individuals were written in full before the checkpoint that
+  # is resumed from, if any)
+  if resume is None:
+    if args.debug and echo:
+      print('/============= .pos =============')
+    outputs = open_outputs('.pos')
+    # SNPs dropped as duplicates are listed next to the positions, along with
+    # the position of the SNP that stands in for them
+    representatives = selection.representatives if selection is not None else None
+    duplicates = open_outputs('.pos.dup') if representatives is not None else {}
+    # Positions of the SNPs of the current chromosome that stand in for others
+    kept = {}
+    total = chromosomes[next(reversed(chromosomes))]['max'] if chromosomes else 0
+    for j, (chromosome, snp) in enumerate(tqdm(genotype.iter_positions(args.positions), desc = "extract postions (by chromosome)", total = total)):
+      if args.debug and echo:
+        print([chromosome, snp])
+      if representatives is not None:
+        if j == chromosomes[chromosome]['min'] - 1:
+          kept = {}
+        if representatives[j] >= 0:
+          if chromosome in duplicates:
+            duplicates[chromosome].write(f"{genotype.chromosome_number(chromosome)}\t{snp}\t{kept[representatives[j]]}\n")
+        elif selection.snps[j]:
+          kept[j] = snp
+      if selection is not None and selection.snps is not None and not selection.snps[j]:
+        continue
+      if chromosome in outputs:
+        outputs[chromosome].write(f"{genotype.chromosome_number(chromosome)}\t{snp}\n")
+    for c, output in list(outputs.items()) + list(duplicates.items()):
+      output.close()
+      if digest:
+        hashes[c].update(output.hash.digest())
 
   # Find the pedigree name for each genotype
   indvxs = []
   with open(args.individuals, 'r') as indvfp:
     for line in indvfp:
       indvxs.append(stripLine(line))
-  indvdf = pd.DataFrame(indvxs)
-  # Copy the individual/line files
-  for i, c in enumerate(erdbeere.keys()):
-    dest = f'{args.outdir}/{c[:3].lower()}{str(int(c[-2:]))}_{args.name}.012.indv'
-    try:
-      if not args.debug:
+  if verbose:
+    pprint(indvxs)
+  rows = selection.rows if selection is not None else None
+  if resume is None and rows is None:
+    # Copy the individual/line files
+    for c in selected:
+      if outdir is not None:
+        dest = os.path.join(outdir, f'{genotype.output_name(c, args.name)}.indv')
         shutil.copyfile(args.individuals, dest)
-      if args.verbose:
-        print(f'Copying {arg.individuals} to {dest}')
-    except:
-      raise
+        if verbose:
+          print(f'Copying {args.individuals} to {dest}')
+    if digest:
+      indv_digest = file_digest(args.individuals)
+      for c in selected:
+        hashes[c].update(indv_digest.encode())
+  elif resume is None:
+    # Only keep the individuals that passed the filters
+    outputs = open_outputs('.indv')
+    with open(args.individuals, 'r') as indvfp:
+      for r, line in enumerate(indvfp):
+        if r < len(rows) and rows[r]:
+          for output in outputs.values():
+            output.write(line)
+    for c, output in outputs.items():
+      output.close()
+      if digest:
+        hashes[c].update(output.hash.digest())
+
+  # Genotypes
+  # For each line in the genotype (.012) file... and literally the line as in
+  # pedigree, cut out the columns of every chromosome
+  outputs = open_outputs(GENOTYPE_SUFFIXES[args.transpose], binary = True, sizes = resume['outputs'] if resume is not None else None)
+  start = (resume['row'], resume['offset']) if resume is not None else (0, 0)
+  if checkpoint is not None and resume is None:
+    checkpoint.save(*start, outputs)
+  bounds = [ (c, chromosomes[c]['min'], chromosomes[c]['max'] + 1) for c in selected ]
+  # Columns that passed the filters, for each chromosome
+  columns = None
+  if selection is not None and selection.snps is not None:
+    columns = { c: (np.flatnonzero(selection.snps[lower - 1:upper - 1]) + lower).tolist() for c, lower, upper in bounds }
+    indices = { c: np.array(x, dtype = np.int64) - 1 for c, x in columns.items() }
+  # QC statistics are accumulated along the way, rather than reading the
+  # genotypes again
+  accumulate = args.qc and outdir is not None and stats is None
+  dosages = dosage_storage(args)
+  if accumulate:
+    stats = genotype.GenotypeStats(chromosomes, dosages = dosages)
+  length_of_genotype_file = genotype.count_lines(args.genotypes) if stop is None else stop
+  # To transpose, the calls are first gathered in a memory-mapped matrix on
+  # local disk, and then written out a tile at a time
+  matrix = None
+  snps = chromosomes[next(reversed(chromosomes))]['max'] if chromosomes else 0
+  # SNPs dropped as duplicates were only matched by the hashes of their calls,
+  # so their calls are compared with those of the SNP kept in their place
+  dropped = None
+  if selection is not None and selection.representatives is not None:
+    dropped = np.flatnonzero(selection.representatives >= 0)
+    standins = selection.representatives[dropped]
+  def check_duplicates(r, calls):
+    codes = np.ascontiguousarray(calls[:snps]).view(f'u{calls.dtype.itemsize}')
+    # The calls of a row that is too short are absent, as when they were hashed
+    if codes.size < snps:
+      codes = np.concatenate([codes.astype(np.int64), np.full(snps - codes.size, -1)])
+    same = codes[dropped] == codes[standins]
+    if not same.all():
+      j = dropped[np.argmin(same)]
+      raise Exception(f"SNP {j + 1} was dropped as identical to SNP {selection.representatives[j] + 1}, but their calls differ in row {r}. Aborting.")
+
+  if args.transpose is not None:
+    individuals = length_of_genotype_file if rows is None else int(rows[:length_of_genotype_file].sum())
+    tmp = tempfile.TemporaryDirectory(prefix = 'transpose_', dir = args.spill_dir)
+    dtype = dosages.dtype if dosages is not None else np.dtype(np.int8)
+    matrix = np.memmap(os.path.join(tmp.name, f'calls.{dtype.name}'), dtype = dtype, mode = 'w+', shape = (max(1, individuals), max(1, snps)))
+    k = 0
+  total = length_of_genotype_file if rows is None else int(rows[:length_of_genotype_file].sum())
+  with profiling.stage('split' if echo else 'digest') as stage:
+    offset = start[1]
+    for r, line in tqdm(genotype_rows(args, rows, binary = True, start = start, stop = stop), desc = "extract genotype (by line)", total = total, initial = start[0]):
+      # Every row before this one was written in full
+      if checkpoint is not None and checkpoint.due():
+        checkpoint.save(r, offset, outputs)
+      offset += len(line)
+      # Dosages are parsed into their compact storage, and written back with
+      # a fixed number of decimals
+      if matrix is not None or dosages is not None:
+        calls = dosages.parse(line, snps) if dosages is not None else genotype.parse_calls(line, snps)
+        if dropped is not None:
+          check_duplicates(r, calls)
+        if accumulate:
+          stats.add_calls(calls, r)
+        if matrix is not None:
+          matrix[k, :calls.size] = calls
+          k += 1
+          continue
+        for c, lower, upper in bounds:
+          text = dosages.format(calls[lower - 1:upper - 1] if columns is None else calls[indices[c]])
+          outputs[c].write(text)
+          if verbose:
+            print(text.decode(), end = '')
+        continue
+      if accumulate:
+        stats.add(line, r)
+      # Most rows are sliced as they are, and only irregular ones (or those
+      # that lose some of their columns to filters) are split into cells
+      pieces = slice_row(line, bounds) if columns is None else None
+      if pieces is not None:
+        for (c, _, _), piece in zip(bounds, pieces):
+          outputs[c].write(piece)
+          outputs[c].write(b'\n')
+          if verbose:
+            print(bytes(piece).decode())
+        continue
+      xs = stripLine(line.decode())
+      if dropped is not None:
+        check_duplicates(r, genotype.parse_calls(line, snps))
+      for c, chr_lowerbound, chr_upperbound in bounds:
+        if columns is None:
+          message = '\t'.join(xs[chr_lowerbound:chr_upperbound])
+        else:
+          message = '\t'.join([ xs[i] for i in columns[c] ])
+        outputs[c].write(f"{message}\n".encode())
+        if verbose:
+          print(f"{message}")
+    stage.rows = total
+    stage.columns = sum(upper - lower for _, lower, upper in bounds) if columns is None else sum(len(x) for x in columns.values())
+    stage.bytes = os.path.getsize(args.genotypes)
+  if matrix is not None:
+    with profiling.stage('transpose') as stage:
+      write_transposed(matrix[:k], bounds, columns, outputs, args.transpose == 'binary', tile_size(args, k), dosages)
+      stage.rows = k
+      stage.columns = snps
+    del matrix
+    tmp.cleanup()
+  for c, output in outputs.items():
+    output.close()
+    if digest:
+      hashes[c].update(output.hash.digest())
+
+  if args.qc and outdir is not None:
+    write_stats(args, stats, selected, [ xs[0] for xs in indvxs ], outdir, selection)
+
+  return { c: h.hexdigest() for c, h in hashes.items() } if digest else {}
+
+# Plan of a sharded run, and the directory of the outputs of its shards, in
+# the output directory
+SHARD_PLAN = 'shards.json'
+SHARD_DIRECTORY = 'shards'
+
+def sharding(args):
+  """Check whether a step of a sharded run was requested, and that the run can
+  be sharded"""
+  if args.plan is None and args.run_shard is None and not args.merge_shards:
+    return False
+  unsupported = [ option for option, value in [('--min-maf', args.min_maf), ('--max-missing', args.max_missing),
+                                               ('--max-missing-individual', args.max_missing_individual),
+                                               ('--qc', args.qc or None), ('--transpose', args.transpose),
+                                               ('--incremental', args.incremental or None), ('--resume', args.resume or None),
+                                               ('--verify', args.verify or None), ('--dedup', args.dedup or None)] if value is not None ]
+  if unsupported:
+    raise Exception(f"Sharded runs cannot be combined with {', '.join(unsupported)}. Aborting.")
+  return True
+
+def plan_shards(args, shards):
+  """Split the rows of the .012 file into ranges of about the same number of
+  bytes, and write them to the plan of a sharded run (`shards.json`) in a new
+  output directory. Each shard is then run on its own (--run-shard), e.g., on
+  another node that shares the filesystem, and the outputs of all of them are
+  assembled (--merge-shards) once they are done.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    shards (Int): number of shards
+
+  Returns (dict):
+    The plan
+  """
+  if shards < 1:
+    raise Exception(f"Cannot plan {shards} shards. Aborting.")
+  offsets = genotype.row_offsets(args.genotypes, offsets_cache(args))
+  size = os.path.getsize(args.genotypes)
+  # First row of every shard, and the end of the last one
+  bounds = np.searchsorted(offsets, np.linspace(0, size, shards + 1)[:-1], side = 'left')
+  bounds = np.unique(np.concatenate([bounds, [offsets.size]]))
+  ends = np.concatenate([offsets, [size]])
+  plan = {
+    'identity': checkpoint_identity(args),
+    'rows': int(offsets.size),
+    'shards': [ { 'shard': k, 'rows': [int(a), int(b)], 'offsets': [int(ends[a]), int(ends[b])] }
+                for k, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])) ],
+  }
+  if os.path.isdir(args.outdir):
+    shutil.rmtree(args.outdir)
+  os.makedirs(os.path.join(args.outdir, SHARD_DIRECTORY))
+  with open(os.path.join(args.outdir, SHARD_PLAN), 'w') as ofp:
+    json.dump(plan, ofp, indent = 2)
+  print(f"Planned {len(plan['shards'])} shards of {plan['rows']} rows in {os.path.join(args.outdir, SHARD_PLAN)}")
+  return plan
+
+def load_plan(args):
+  """Read the plan of a sharded run, which has to have been made for the same
+  options and inputs"""
+  path = os.path.join(args.outdir, SHARD_PLAN)
+  if not os.path.exists(path):
+    raise Exception(f"No plan of a sharded run was found in {args.outdir}. Run with --plan first. Aborting.")
+  with open(path, 'r') as ifp:
+    plan = json.load(ifp)
+  if plan['identity'] != json.loads(json.dumps(checkpoint_identity(args))):
+    raise Exception(f"The plan in {args.outdir} was made for other options or inputs. Aborting.")
+  return plan
+
+def shard_directory(args, k):
+  return os.path.join(args.outdir, SHARD_DIRECTORY, f'{k:05d}')
+
+def run_shard(args, chromosomes, k, buffering = -1):
+  """Split the rows of a single shard of a sharded run into its own directory,
+  from the offset of its first row. Only the genotypes are written; the
+  positions and individuals are written when the shards are merged.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    chromosomes (OrderedDict): column range of every chromosome
+    k (Int): shard to run
+    buffering (Int): size of the write buffer of each output file
+  """
+  plan = load_plan(args)
+  if not 0 <= k < len(plan['shards']):
+    raise Exception(f"There is no shard {k}; the plan has {len(plan['shards'])}. Aborting.")
+  shard = plan['shards'][k]
+  (start, stop), (offset, _) = shard['rows'], shard['offsets']
+  directory = shard_directory(args, k)
+  # A shard that is run again starts over
+  if os.path.isdir(directory):
+    shutil.rmtree(directory)
+  os.makedirs(directory)
+  rows = keep_rows(args) if args.keep_individuals is not None else None
+  selection = Selection(None, rows) if rows is not None else None
+  split(args, chromosomes, list(chromosomes), directory, buffering = buffering, selection = selection,
+        resume = { 'row': start, 'offset': offset, 'outputs': None }, stop = stop)
+  # Only complete shards are merged
+  with open(os.path.join(directory, '.complete'), 'w') as ofp:
+    json.dump(shard, ofp)
+  print(f"Split rows {start} to {stop} (shard {k}) into {directory}")
+
+def merge_shards(args, chromosomes, buffering = -1):
+  """Assemble the outputs of every shard of a sharded run into the output of
+  each chromosome, as a run without shards would have written it. The shards
+  are removed once merged.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    chromosomes (OrderedDict): column range of every chromosome
+    buffering (Int): size of the write buffer of each output file
+  """
+  plan = load_plan(args)
+  directories = [ shard_directory(args, shard['shard']) for shard in plan['shards'] ]
+  missing = [ k for k, d in enumerate(directories) if not os.path.exists(os.path.join(d, '.complete')) ]
+  if missing:
+    raise Exception(f"Shards {missing} have not been run to completion. Aborting.")
+  rows = keep_rows(args) if args.keep_individuals is not None else None
+  selection = Selection(None, rows) if rows is not None else None
+  # The positions and individuals, with empty genotypes (no rows)
+  split(args, chromosomes, list(chromosomes), args.outdir, buffering = buffering, selection = selection, stop = 0)
+  with profiling.stage('merge') as stage:
+    for c in chromosomes:
+      filename = genotype.output_name(c, args.name)
+      with open(os.path.join(args.outdir, filename), 'ab') as ofp:
+        for d in directories:
+          with open(os.path.join(d, filename), 'rb') as ifp:
+            shutil.copyfileobj(ifp, ofp, 1 << 24)
+        stage.bytes += ofp.tell()
+    stage.rows = plan['rows']
+  shutil.rmtree(os.path.join(args.outdir, SHARD_DIRECTORY))
+  os.remove(os.path.join(args.outdir, SHARD_PLAN))
+  print(f"Merged {len(directories)} shards into {args.outdir}")
+
+def _subsequence(expected, found):
+  """Match the items of `found` to those of `expected`, in which they must
+  appear in the same order
+
+  Returns (ndarray, Int):
+    Position in `expected` of every item that was matched, and the index in
+    `found` of the first that was not (the length of `found` if all were)
+
+  Example cases:
+    >>> _subsequence(['a', 'b', 'c', 'd'], ['b', 'd'])
+    (array([1, 3]), 2)
+    >>> _subsequence(['a', 'b', 'c'], ['c', 'a'])
+    (array([2]), 1)
+  """
+  positions = []
+  candidates = enumerate(expected)
+  for i, item in enumerate(found):
+    for j, x in candidates:
+      if x == item:
+        positions.append(j)
+        break
+    else:
+      return np.array(positions, dtype = np.int64), i
+  return np.array(positions, dtype = np.int64), len(found)
+
+def _parse_block(lines, width):
+  """Parse rows of calls (missing calls as -1 or NA) into a matrix of `width`
+  columns, or None if a row does not have that many calls"""
+  try:
+    calls = np.array(b'\t'.join(lines).replace(b'NA', b'-1').split(), dtype = np.int8)
+  except ValueError:
+    return None
+  if calls.size != len(lines) * width:
+    return None
+  return calls.reshape(len(lines), width)
+
+def verify(args, limit = 10):
+  """Check the outputs of a run in the output directory against its input. The
+  SNPs and individuals of each chromosome are read from its .pos and .indv
+  outputs (so that filtered runs are checked too), and must appear in the input
+  in the same order. Its genotypes are then compared a block of rows at a time.
+
+  Args:
+    args (Namespace): arguments supplied by user
+    limit (Int): number of mismatches to report
+
+  Returns (Report):
+    Mismatches between the outputs and the input
+  """
+  if args.transpose is not None or args.dosage is not None:
+    raise Exception("--verify cannot check transposed (--transpose) outputs or dosages (--dosage). Aborting.")
+  report = Report(limit)
+  chromosomes = genotype.read_positions(args.positions)
+  snps = { c: [] for c in chromosomes }
+  for chromosome, snp in genotype.iter_positions(args.positions):
+    snps[chromosome].append(f"{genotype.chromosome_number(chromosome)}\t{snp}")
+  with open(args.individuals, 'r') as indvfp:
+    individuals = indvfp.read().splitlines()
+  # Without filters, every SNP and individual of the input is output
+  every_snp = args.min_maf is None and args.max_missing is None and not args.dedup
+  every_row = args.keep_individuals is None and args.max_missing_individual is None
+
+  # Columns of the input that were output for every chromosome, and the rows
+  # (shared by all chromosomes)
+  columns = {}
+  rows = None
+  for c in chromosomes:
+    prefix = os.path.join(args.outdir, genotype.output_name(c, args.name))
+    name = os.path.basename(prefix)
+    if not os.path.exists(prefix):
+      # Chromosomes are only left out when the filters dropped all of their SNPs
+      if every_snp:
+        report.add(name, None, None, 'file', MISSING)
+      continue
+    report.files += 3
+    with open(f'{prefix}.pos', 'r') as posfp:
+      found = posfp.read().splitlines()
+    positions, stop = _subsequence(snps[c], found)
+    if stop < len(found) or (every_snp and len(found) < len(snps[c])):
+      report.add(f'{name}.pos', stop + 1, None, snps[c][stop].replace('\t', ':') if stop < len(snps[c]) else MISSING,
+                 found[stop].replace('\t', ':') if stop < len(found) else MISSING)
+      continue
+    with open(f'{prefix}.indv', 'r') as indvfp:
+      found = indvfp.read().splitlines()
+    matched, stop = _subsequence(individuals, found)
+    if stop < len(found) or (every_row and len(found) < len(individuals)):
+      report.add(f'{name}.indv', stop + 1, None, individuals[stop] if stop < len(individuals) else MISSING,
+                 found[stop] if stop < len(found) else MISSING)
+      continue
+    if rows is None:
+      rows = matched
+    elif not np.array_equal(rows, matched):
+      report.add(f'{name}.indv', None, None, f'the individuals of the other chromosomes', f'{matched.size} individuals')
+      continue
+    columns[c] = chromosomes[c]['min'] + positions
+  if rows is None:
+    return report
+
+  # Genotypes, a block of rows at a time (about 64 MiB of calls)
+  width = chromosomes[next(reversed(chromosomes))]['max'] + 1
+  block = max(1, (64 << 20) // (4 * width))
+  mask = None
+  if not every_row:
+    mask = np.zeros(len(individuals), dtype = bool)
+    mask[rows] = True
+  inputs = { c: open(os.path.join(args.outdir, genotype.output_name(c, args.name)), 'rb') for c in columns }
+  try:
+    with profiling.stage('verify') as stage:
+      lines = genotype_rows(args, mask, binary = True)
+      k = 0
+      while inputs:
+        chunk = [ line for _, line in itertools.islice(lines, block) ]
+        if not chunk:
+          break
+        expected = _parse_block(chunk, width)
+        if expected is None:
+          raise Exception(f"The rows of {args.genotypes} after row {k} do not all have {width - 1} calls. Aborting.")
+        for c in list(inputs):
+          name = genotype.output_name(c, args.name)
+          written = [ inputs[c].readline() for _ in chunk ]
+          found = _parse_block(written, columns[c].size)
+          if found is None:
+            # Point at the first row that is short, or not there at all
+            i = next(i for i, line in enumerate(written) if _parse_block([line], columns[c].size) is None)
+            report.add(name, individuals[rows[k + i]], None, f'{columns[c].size} calls', 'row' if written[i] else MISSING)
+            inputs.pop(c).close()
+            continue
+          calls = expected[:, columns[c]]
+          report.values += calls.size
+          # Most blocks match, and are only hashed
+          if values_digest(calls) == values_digest(found):
+            continue
+          different = np.argwhere(calls != found)
+          i, j = different[0]
+          report.add(name, individuals[rows[k + i]], snps[c][columns[c][j] - chromosomes[c]['min']].replace('\t', ':'), calls[i, j], found[i, j], count = len(different))
+        k += len(chunk)
+      stage.rows = k
+      stage.columns = width - 1
+    for c, ifp in inputs.items():
+      if ifp.readline():
+        report.add(genotype.output_name(c, args.name), k + 1, None, MISSING, 'row')
+  finally:
+    for ifp in inputs.values():
+      ifp.close()
+  return report
+
+def inspect(args):
+  """Describe the input without reading its genotypes: the individuals are
+  counted from the .indv file, and the SNPs of every chromosome from the .pos
+  file
+
+  Args:
+    args (Namespace): arguments supplied by user
+
+  Returns (dict):
+    Size of every input file, the number of individuals, the number of SNPs
+    (in total and of every chromosome), and the outputs of every chromosome
+  """
+  files = [args.genotypes, args.positions, args.individuals]
+  with profiling.stage('scan') as stage:
+    individuals = genotype.count_lines(args.individuals)
+    chromosomes = genotype.count_positions(args.positions)
+    stage.rows = individuals
+    stage.columns = sum(chromosomes.values())
+    stage.bytes = os.path.getsize(args.positions) + os.path.getsize(args.individuals)
+  return {
+    'files': { f: os.path.getsize(f) for f in files },
+    'individuals': individuals,
+    'snps': sum(chromosomes.values()),
+    'chromosomes': chromosomes,
+    'outputs': { c: output_files(c, args.name, args.qc, args.transpose, args.dedup)[0] for c in chromosomes },
+  }
+
+def process(args):
+  """General processing function that does all the heavy lifting in terms of
+  reading the input files and splitting them into individual files based on
+  chromosome (or scaffold)
+  """
+  if args.inspect:
+    print(json.dumps(inspect(args), indent = 2))
+    return None
+  if args.verify:
+    report = verify(args)
+    report.check()
+    print(report.summary())
+    return None
+  sharded = sharding(args)
+  if sharded and args.plan is not None:
+    plan_shards(args, args.plan)
+    return None
+
+  with profiling.stage('parse') as stage:
+    chromosomes = genotype.read_positions(args.positions)
+    stage.rows = sum(c['max'] - c['min'] + 1 for c in chromosomes.values())
+    stage.bytes = os.path.getsize(args.positions)
   if args.verbose:
-    pprint(indvdf)
-  
-  # # Cut out the columns for each
-  # genoxs = []
-  # # Count the number of lines in the genotype table for progress info
-  # length_of_genotype_file = 0
-  # with open(args.genotypes, 'r') as tmp_genofp:
-  #   length_of_genotype_file += 1
-  # with open(args.genotypes, 'r') as genofp:
-  #   for line in tqdm(genofp, desc="extract genotype (by line)", total = length_of_genotype_file):
-  #     xs = stripLine(line)
-  #     # For each chromosome, pull out the columns from the genotype
-  #     for i, c in enumerate(erdbeere.keys()):
-  #       chr_lowerbound = erdbeere[c]['min']
-  #       chr_upperbound = erdbeere[c]['max'] + 1
-  #       xss = xs[chr_lowerbound:chr_upperbound]
-  #       c = f'{c[:3].lower()}{str(int(c[-2:]))}_{args.name}.012'
-  #       filename = f'{args.outdir}/{c}'
-  #       message = '\t'.join(xss)
-  #       with open(filename, 'a+') as chromome_genofp:
-  #         if not args.debug:
-  #           chromome_genofp.write(f"{message}\n")
-  #         if args.verbose:
-  #           print(f"{message}")
-
-  length_of_genotype_file = 0
-  with open(args.genotypes, 'r') as tmp_genofp:
-    length_of_genotype_file += 1
-
-  # For each chromosome...
-  for i, c in enumerate(erdbeere.keys()):
-    chr_lowerbound = erdbeere[c]['min']
-    chr_upperbound = erdbeere[c]['max'] + 1
-    alias = c
-    c = f'{c[:3].lower()}{str(int(c[-2:]))}_{args.name}.012'
-    filename = f'{args.outdir}/{c}'
-    # For each line in the genotype (.012) file... and literally the line as in pedigree
-    with open(args.genotypes, 'r') as genofp:
-      for line in tqdm(genofp, desc = f"extract genotype (by line) for {alias}", total = length_of_genotype_file):
-        xs = stripLine(line)
-        xss = xs[chr_lowerbound:chr_upperbound]
-        message = '\t'.join(xss)
-        with open(filename, 'a+') as chromome_genofp:
-          if not args.debug:
-            chromome_genofp.write(f"{message}\n")
-          if args.verbose:
-            print(f"{message}")
-
-
-def parseOptions():
+    pprint(chromosomes)
+  selected = list(chromosomes.keys())
+  buffering = check_memory(args, chromosomes)
+  if sharded and args.run_shard is not None:
+    run_shard(args, chromosomes, args.run_shard, buffering)
+    return None
+  if sharded and args.merge_shards:
+    merge_shards(args, chromosomes, buffering)
+    return None
+
+  # Get all of the output directory info and set up the folder
+  manifest = None
+  checkpoint = None
+  resume = None
+  if args.incremental:
+    if args.resume:
+      raise Exception("--resume cannot be combined with --incremental, which does not keep checkpoints. Aborting.")
+    # Keep the outputs of the previous run. Every chromosome is split again,
+    # but only those whose output differs are rewritten
+    manifest = Manifest(args.outdir, 'cut', run_options(args), [args.genotypes, args.positions, args.individuals])
+    if manifest.unchanged():
+      print(f"Outputs in {args.outdir} are up to date")
+      return None
+
+  # Filters are applied in two passes: the first measures the SNPs and
+  # individuals, and the second splits the ones that passed
+  stats = None
+  selection = None
+  rows = keep_rows(args) if args.keep_individuals is not None else None
+  if filtering(args):
+    stats, selection = select(args, chromosomes, rows)
+    # Chromosomes without any SNP left have no output
+    selected = [ c for c in selected if selection.snps[chromosomes[c]['min'] - 1:chromosomes[c]['max']].any() ]
+  elif rows is not None:
+    selection = Selection(None, rows)
+
+  if manifest is not None:
+    os.makedirs(args.outdir, exist_ok = True)
+  else:
+    # Progress is recorded along the way, so that the run can be resumed if it
+    # is interrupted (transposed outputs are only written at the end, and QC
+    # statistics are not kept across runs)
+    if not args.debug and args.transpose is None and not args.qc:
+      checkpoint = Checkpoint(args.outdir, checkpoint_identity(args), args.checkpoint_interval)
+    if args.resume:
+      if args.transpose is not None or args.qc:
+        raise Exception("--resume cannot be combined with --transpose or --qc. Aborting.")
+      if args.debug:
+        raise Exception("--resume cannot be combined with --debug, which does not keep checkpoints. Aborting.")
+      resume = checkpoint.load() if os.path.isdir(args.outdir) else None
+      if resume is None:
+        print(f"No checkpoint of the same run was found in {args.outdir}. Starting over")
+      else:
+        print(f"Resuming from row {resume['row']}")
+    if resume is None:
+      if os.path.isdir(args.outdir):
+        shutil.rmtree(args.outdir)
+      os.mkdir(args.outdir)
+
+  outdir = None if args.debug else args.outdir
+  # The outputs of a rerun are hashed as they are written to a staging
+  # directory, and only those that changed replace the previous ones
+  staging = None
+  if manifest is not None and manifest.previous is not None and outdir is not None:
+    staging = tempfile.mkdtemp(prefix = '.incremental_', dir = args.outdir)
+  try:
+    digests = split(args, chromosomes, selected, staging or outdir, digest = manifest is not None, buffering = buffering,
+                    selection = selection, stats = stats, checkpoint = checkpoint, resume = resume)
+    if manifest is not None and manifest.previous is not None:
+      changed = [ c for c in selected if not all(manifest.is_current(f, digests[c]) for f in output_files(c, args.name, args.qc, args.transpose, args.dedup)) ]
+      print(f"{len(changed)} of {len(selected)} chromosomes changed")
+      if staging is not None:
+        for c in changed:
+          for f in output_files(c, args.name, args.qc, args.transpose, args.dedup):
+            os.replace(os.path.join(staging, f), os.path.join(args.outdir, f))
+  finally:
+    if staging is not None:
+      shutil.rmtree(staging)
+  if checkpoint is not None:
+    checkpoint.remove()
+
+  if manifest is not None:
+    for c in selected:
+      for f in output_files(c, args.name, args.qc, args.transpose, args.dedup):
+        manifest.record(f, digests[c])
+    if not args.debug:
+      manifest.remove_stale()
+      manifest.save()
+
+  return None
+
+
+def parseOptions(argv = None):
   """
   Function to parse user-provided options from terminal
+
+  Args:
+    argv (List): arguments to parse, defaults to those given on the terminal
   """
 
   default_output_directory = f"unnamed_output_{datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}"
@@ -159,8 +1134,51 @@ def parseOptions():
                       help="path of output directory")
   parser.add_argument("-n", "--name", default = "unnamed",
                       help = "name of species used in naming output files")
+  parser.add_argument("--qc", action = "store_true",
+                      help = "also write the minor allele frequency and missingness of every SNP (.012.pos.qc) and the missingness of every individual (.012.indv.qc) of each chromosome")
+  parser.add_argument("--keep-individuals", default = None, metavar = "FILE",
+                      help = "only output the individuals named in FILE (one per line, as in the .012.indv file)")
+  parser.add_argument("--min-maf", default = None, type = float,
+                      help = "drop SNPs whose minor allele frequency is below this value")
+  parser.add_argument("--max-missing", default = None, type = float,
+                      help = "drop SNPs whose fraction of missing calls is above this value")
+  parser.add_argument("--max-missing-individual", default = None, type = float,
+                      help = "drop individuals whose fraction of missing calls (over all SNPs) is above this value")
+  parser.add_argument("--dedup", action = "store_true",
+                      help = "only output the first of the SNPs of a chromosome whose calls are identical, and list the others, with the position of the SNP kept in their place, in .012.pos.dup. Their calls are matched by hash, and compared while writing (the run fails in the unlikely event that they differ)")
+  parser.add_argument("--transpose", default = None, choices = ["text", "binary"],
+                      help = "write the genotypes of each chromosome SNP-major (one row per SNP) instead of as .012, as text (.012.snp) or as 8-bit integers (.012.snp.bin)")
+  parser.add_argument("--dosage", default = None, choices = genotype.Dosages.STORAGE,
+                      help = "the calls are imputed dosages (0.0 to 2.0, -1 when missing), held as 16-bit floats or as 8-bit integers in hundredths of an allele")
+  parser.add_argument("--dosage-precision", default = 2, type = int, metavar = "DECIMALS",
+                      help = "number of decimals of the dosages written as text (default: 2)")
+  parser.add_argument("--spill-dir", default = None,
+                      help = "directory of the temporary files of --transpose, defaults to the system's temporary directory")
+  parser.add_argument("--max-memory", default = None, type = parse_size, metavar = "SIZE",
+                      help = "memory budget (e.g., 4G); fails early if a genotype row cannot fit in it")
+  parser.add_argument("--inspect", action = "store_true",
+                      help = "print the number of individuals and the SNPs of every chromosome (as JSON), without reading the genotypes, instead of splitting them")
+  parser.add_argument("--verify", action = "store_true",
+                      help = "check the outputs in the output directory against the input instead of writing them, and fail if any call differs")
+  shards = parser.add_mutually_exclusive_group()
+  shards.add_argument("--plan", default = None, type = int, metavar = "SHARDS",
+                      help = "plan a sharded run: split the rows of the .012 file into SHARDS ranges, written to shards.json in the output directory")
+  shards.add_argument("--run-shard", default = None, type = int, metavar = "K",
+                      help = "split the rows of shard K of the planned run (e.g., on another node sharing the filesystem)")
+  shards.add_argument("--merge-shards", action = "store_true",
+                      help = "assemble the outputs of every shard of the planned run into the output of each chromosome")
+  parser.add_argument("--incremental", action = "store_true",
+                      help = "skip the run if neither the inputs nor the options changed since the last one into the output directory; otherwise every chromosome is split again, and only those whose outputs changed are rewritten")
+  parser.add_argument("--resume", action = "store_true",
+                      help = "continue an interrupted run from its last checkpoint in the output directory, instead of starting over")
+  parser.add_argument("--checkpoint-interval", default = 60, type = float, metavar = "SECONDS",
+                      help = "number of seconds between checkpoints (default: 60)")
+  parser.add_argument("--profile", nargs = "?", const = "profile.json", default = None, metavar = "REPORT",
+                      help = "write a JSON report of the time, throughput and memory of each stage (default: profile.json)")
+  parser.add_argument("--profile-cprofile", default = None, metavar = "PATH",
+                      help = "with --profile, also dump cProfile statistics of the slowest stage to PATH")
   parser.add_argument("--debug", action = "store_true", help = "enables --verbose and disables writes to disk")
-  args = parser.parse_args()
+  args = parser.parse_args(argv)
   if args.debug is True:
     args.verbose = True
   
@@ -168,4 +1186,8 @@ def parseOptions():
 
 if __name__=="__main__":
   args = parseOptions()
+  if args.profile is not None:
+    profiler = profiling.enable(cprofile = args.profile_cprofile is not None)
   process(args)
+  if args.profile is not None:
+    profiler.save(args.profile, args.profile_cprofile)
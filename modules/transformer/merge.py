@@ -0,0 +1,154 @@
+"""Merge
+
+Merge per-chromosome genotype (.012) datasets, as written by `cut`, back into
+a single genome-wide .012, .012.pos and .012.indv set. The chromosome files are
+read in lockstep, one row at a time, so that only a single row of each is held
+in memory no matter the size of the genome.
+
+Common usage:
+  python -m modules.transformer.merge -o merged.012 outdir/chr*_setaria.012
+"""
+import os
+import shutil
+import argparse
+import itertools
+from pprint import pprint
+from tqdm import tqdm
+
+from .. import genotype
+from .. import profiling
+from ..manifest import file_digest
+
+
+def chromosome_key(path):
+  """Sort key of a chromosome dataset: the chromosome on the first line of its
+  .pos file, by number when it is numeric (as `cut` writes it)
+
+  Args:
+    path (String): path of the .012 file of the chromosome
+  """
+  with open(f'{path}.pos', 'r') as posfp:
+    line = posfp.readline()
+  if not line:
+    raise Exception(f"`{path}.pos` is empty. Aborting.")
+  chromosome = line.split('\t', 1)[0].strip()
+  return (0, int(chromosome), '') if chromosome.isdigit() else (1, 0, chromosome)
+
+def chromosome_name(chromosome, template):
+  """Name of a chromosome in the merged .pos file. Numeric chromosomes (as
+  written by `cut`) are named after `template`, so that the merged dataset can
+  be cut again; others are kept as they are.
+
+  Example cases:
+    >>> chromosome_name('1', 'Chr_{:02d}')
+    'Chr_01'
+    >>> chromosome_name('scaffold_36', 'Chr_{:02d}')
+    'scaffold_36'
+  """
+  return template.format(int(chromosome)) if chromosome.isdigit() else chromosome
+
+def check_individuals(files):
+  """Make sure that every chromosome lists the same individuals, in the same
+  order
+
+  Args:
+    files (List): paths of the .012 files of the chromosomes
+
+  Returns (String):
+    Path of the .012.indv file shared by all of them
+  """
+  expected = file_digest(f'{files[0]}.indv')
+  for f in files[1:]:
+    if file_digest(f'{f}.indv') != expected:
+      raise Exception(f"`{f}.indv` does not list the same individuals as `{files[0]}.indv`. Aborting.")
+  return f'{files[0]}.indv'
+
+def process(args):
+  """Merge the chromosome datasets into one, with the chromosomes in order
+  """
+  keyed = sorted([ (chromosome_key(f), f) for f in args.files ])
+  for (a, x), (b, y) in zip(keyed, keyed[1:]):
+    if a == b:
+      raise Exception(f"`{x}` and `{y}` hold the same chromosome. Aborting.")
+  files = [ f for _, f in keyed ]
+  if args.verbose:
+    pprint(files)
+  individuals = check_individuals(files)
+  expected_rows = genotype.count_lines(individuals)
+  if args.debug:
+    return None
+  os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok = True)
+
+  # Positions
+  with profiling.stage('parse') as stage, open(f'{args.output}.pos', 'w') as ofp:
+    snps = 0
+    for f in files:
+      for chromosome, snp in genotype.iter_positions(f'{f}.pos'):
+        ofp.write(f"{chromosome_name(chromosome, args.chromosome_format)}\t{snp}\n")
+        snps += 1
+    stage.rows = snps
+
+  # Individuals
+  shutil.copyfile(individuals, f'{args.output}.indv')
+
+  # Genotypes
+  # Concatenate the same row of every chromosome, and turn missing calls (NA)
+  # back into -1
+  inputs = [ open(f, 'r') for f in files ]
+  try:
+    with profiling.stage('merge') as stage, open(args.output, 'w') as ofp:
+      r = 0
+      for lines in tqdm(itertools.zip_longest(*inputs), desc = "merge genotype (by line)", total = expected_rows):
+        for f, line in zip(files, lines):
+          if line is None:
+            raise Exception(f"`{f}` has {r} rows, fewer than the other chromosomes. Aborting.")
+        row = '\t'.join([ line.rstrip('\n') for line in lines ])
+        ofp.write(f"{r}\t{row.replace('NA', '-1')}\n")
+        r += 1
+      stage.rows = r
+      stage.columns = snps
+      stage.bytes = ofp.tell()
+  finally:
+    for fp in inputs:
+      fp.close()
+  if r != expected_rows:
+    raise Exception(f"The chromosomes have {r} rows, but {individuals} lists {expected_rows} individuals. Aborting.")
+
+  print(f"Merged {len(files)} chromosomes ({snps} SNPs, {r} individuals) into {args.output}")
+  return None
+
+
+def parseOptions(argv = None):
+  """
+  Function to parse user-provided options from terminal
+
+  Args:
+    argv (List): arguments to parse, defaults to those given on the terminal
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument('files', metavar = 'FILE', nargs = '+',
+                      help = ".012 file of every chromosome; its .pos and .indv files are found next to it")
+  parser.add_argument("-v", "--verbose", action = "store_true",
+                      help = "increase output verbosity")
+  parser.add_argument("-o", "--output", required = True,
+                      help = "(required) path of the merged .012 file; .pos and .indv are appended for the other two files")
+  parser.add_argument("--chromosome-format", default = "Chr_{:02d}",
+                      help = "name of numbered chromosomes in the merged .pos file (default: Chr_{:02d})")
+  parser.add_argument("--profile", nargs = "?", const = "profile.json", default = None, metavar = "REPORT",
+                      help = "write a JSON report of the time, throughput and memory of each stage (default: profile.json)")
+  parser.add_argument("--profile-cprofile", default = None, metavar = "PATH",
+                      help = "with --profile, also dump cProfile statistics of the slowest stage to PATH")
+  parser.add_argument("--debug", action = "store_true", help = "enables --verbose and disables writes to disk")
+  args = parser.parse_args(argv)
+  if args.debug is True:
+    args.verbose = True
+
+  return args
+
+if __name__=="__main__":
+  args = parseOptions()
+  if args.profile is not None:
+    profiler = profiling.enable(cprofile = args.profile_cprofile is not None)
+  process(args)
+  if args.profile is not None:
+    profiler.save(args.profile, args.profile_cprofile)
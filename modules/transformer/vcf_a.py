@@ -39,6 +39,7 @@ import fileinput
 
 import pandas as pd
 
+from .. import profiling
 from ..helpers import Convert, read_data
 from pprint import pprint
 from tqdm import tqdm
@@ -53,21 +54,23 @@ def process(args, delimiter = ','):
   """
   try:
     chrdata = {}
-    fp = fileinput.input(args.files)
-    current_chromosome = ''
-    max_lineno = 0
-    for line in fp:
-      line = line.strip().split('\t')[0] # Pull out the chromosome name (e.g., Chr_01)
-      # Change chromosome context if the current differs from the previous line
-      if current_chromosome != line:
-        current_chromosome = line
-        chrdata[line] = {}
-        # Record the line at which the change was made
-        chrdata[line]['min'] = fp.lineno()
-
-      # Update the max number for the current chromosome
-      else:
-        chrdata[line]['max'] = fp.lineno()
+    fp = fileinput.FileInput(args.files)
+    with profiling.stage('parse') as stage:
+      current_chromosome = ''
+      max_lineno = 0
+      for line in fp:
+        line = line.strip().split('\t')[0] # Pull out the chromosome name (e.g., Chr_01)
+        # Change chromosome context if the current differs from the previous line
+        if current_chromosome != line:
+          current_chromosome = line
+          chrdata[line] = {}
+          # Record the line at which the change was made
+          chrdata[line]['min'] = fp.lineno()
+
+        # Update the max number for the current chromosome
+        else:
+          chrdata[line]['max'] = fp.lineno()
+      stage.rows = fp.lineno()
 
     pprint(chrdata)
 
@@ -105,9 +108,12 @@ def process(args, delimiter = ','):
     vcffp = open(args.vcf_input, 'r') # genotype datafile
     posfp = open(args.files[0], 'r') # chromosome position file
     tmpdf = open('.tmpdf', 'w')      # temporary data file to be loaded as pandas df
-    for lines in tqdm(itertools.zip_longest(posfp, vcffp), desc="Genotype File", total=total_line_count):
-      lines = [ line.strip() for line in lines ]
-      tmpdf.write('\t'.join(lines))
+    with profiling.stage('write') as stage:
+      for lines in tqdm(itertools.zip_longest(posfp, vcffp, fillvalue = ''), desc="Genotype File", total=total_line_count):
+        lines = [ line.strip() for line in lines ]
+        tmpdf.write('\t'.join(lines))
+      stage.rows = total_line_count
+      stage.bytes = tmpdf.tell()
     vcffp.close()
     posfp.close()
     tmpdf.close()
@@ -0,0 +1,165 @@
+"""
+Output verification
+
+A run is verified (`--verify`) by reading its outputs back from disk and
+checking them against its input, rather than by running it again. Outputs are
+compared a column (or, for genotypes, a block of rows) at a time: the digests
+of the expected and the written values are compared first, and only when they
+differ are the values compared as arrays to find the cells that do not match.
+Missing values (NaN, NA) are equal to one another. The first mismatches are
+kept for the report.
+"""
+
+import collections
+import hashlib
+import os
+import time
+
+import numpy as np
+
+# A value of an output that does not match the input. Whole rows, columns and
+# files that are missing (or should not be there) have no column (or row)
+Mismatch = collections.namedtuple('Mismatch', ['filename', 'row', 'column', 'expected', 'found'])
+
+# Stands in for a row, column or file that is not there
+MISSING = '<missing>'
+
+
+class Report:
+  """
+  Outcome of verifying the outputs of a run
+
+  Args:
+    limit (Int): number of mismatches to keep for the report, the first found
+  """
+
+  def __init__(self, limit = 10):
+    self.limit = limit
+    self.files = 0
+    self.values = 0
+    self.count = 0
+    self.mismatches = []
+    self.started = time.perf_counter()
+
+  @property
+  def ok(self):
+    return self.count == 0
+
+  def add(self, filename, row, column, expected, found, count = 1):
+    """Record `count` mismatches, of which the first is described"""
+    self.count += count
+    if len(self.mismatches) < self.limit:
+      self.mismatches.append(Mismatch(filename, row, column, expected, found))
+
+  def summary(self):
+    seconds = time.perf_counter() - self.started
+    lines = [ f"Verified {self.values} values in {self.files} files in {seconds:.2f}s: "
+              + ("no mismatches" if self.ok else f"{self.count} mismatches") ]
+    for m in self.mismatches:
+      where = ', '.join([ f'{label} {value}' for label, value in [('row', m.row), ('column', m.column)] if value is not None ])
+      lines.append(f"  {m.filename}{f' ({where})' if where else ''}: expected {m.expected}, found {m.found}")
+    if self.count > len(self.mismatches):
+      lines.append(f"  ... and {self.count - len(self.mismatches)} more")
+    return '\n'.join(lines)
+
+  def check(self):
+    """Raise an exception listing the first mismatches, if there were any"""
+    if not self.ok:
+      raise Exception(f"{self.summary()}\nThe outputs do not match the input. Aborting.")
+
+
+def values_digest(values):
+  """Hash an array of values, as they are laid out in memory
+
+  Args:
+    values (ndarray): values to hash
+
+  Returns (bytes):
+    Digest of the values
+  """
+  if values.dtype == object:
+    import pandas as pd
+    values = pd.util.hash_array(values, categorize = False)
+  return hashlib.sha256(np.ascontiguousarray(values).tobytes()).digest()
+
+def _normalize(expected, found):
+  """Bring two columns to a common type: floats when both are numeric (so that
+  2 and 2.0 are equal), and strings otherwise, with every missing value as NaN
+  (or None)"""
+  import pandas as pd
+  if pd.api.types.is_numeric_dtype(expected.dtype) and pd.api.types.is_numeric_dtype(found.dtype):
+    a, b = [ x.to_numpy(dtype = np.float64, na_value = np.nan) for x in (expected, found) ]
+    # NaNs do not all share the same bits
+    return np.where(np.isnan(a), np.nan, a), np.where(np.isnan(b), np.nan, b)
+  a, b = [ np.array([ None if pd.isna(v) else str(v) for v in x.tolist() ], dtype = object) for x in (expected, found) ]
+  return a, b
+
+def _equal(a, b):
+  if a.dtype == np.float64:
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+  return a == b
+
+def _labels(report, filename, expected, found, axis):
+  """Compare the row (or column) labels of an output, and find those that both
+  have
+
+  Returns (List):
+    Labels of the expected output that are also in the written one, or None if
+    the labels cannot be matched up because some are duplicated
+  """
+  if expected.equals(found):
+    return list(expected)
+  if expected.has_duplicates or found.has_duplicates:
+    report.add(filename, None, None, f"{len(expected)} {axis}s", f"{len(found)} {axis}s, with duplicated labels")
+    return None
+  missing = expected.difference(found, sort = False)
+  unexpected = found.difference(expected, sort = False)
+  for labels, present in [(missing, False), (unexpected, True)]:
+    if len(labels) > 0:
+      row, column = (labels[0], None) if axis == 'row' else (None, labels[0])
+      report.add(filename, row, column, MISSING if present else axis, axis if present else MISSING, count = len(labels))
+  return [ label for label in expected if label not in missing ]
+
+def compare(report, filename, expected, found):
+  """Compare an output read back from disk with the one expected from the
+  input, a column at a time
+
+  Args:
+    report (Report): where mismatches are recorded
+    filename (String): name of the output
+    expected (DataFrame): output expected from the input
+    found (DataFrame): output as written
+  """
+  report.files += 1
+  rows = _labels(report, filename, expected.index, found.index, 'row')
+  columns = _labels(report, filename, expected.columns, found.columns, 'column')
+  if rows is None or columns is None:
+    return
+  if not expected.index.equals(found.index):
+    expected = expected.loc[rows]
+    found = found.loc[rows]
+  for column in columns:
+    a, b = _normalize(expected[column], found[column])
+    report.values += len(a)
+    # Most columns match, and are only hashed
+    if values_digest(a) == values_digest(b):
+      continue
+    different = np.flatnonzero(~_equal(a, b))
+    if different.size > 0:
+      i = different[0]
+      report.add(filename, rows[i], column, a[i], b[i], count = different.size)
+
+def unexpected_files(report, outdir, extension, expected):
+  """Record the files of an output directory that have the extension of the
+  outputs, but that no output was expected to be written to
+
+  Args:
+    report (Report): where mismatches are recorded
+    outdir (String): path of output directory
+    extension (String): extension of the output files (e.g., '.csv')
+    expected (Iterable): names of the expected output files
+  """
+  expected = set(expected)
+  for f in sorted(os.listdir(outdir)):
+    if f.endswith(extension) and not f.startswith('.') and f not in expected:
+      report.add(f, None, None, MISSING, 'file')
@@ -0,0 +1,146 @@
+"""
+Output writers for transformed datasets
+
+Each transformer hands back a dictionary of datasets, each of which has a
+`filename` (e.g., `FL_2006.csv`) and its `data` as a DataFrame. The writers
+below take care of serializing that data in the format chosen by the user. The
+basename of the filename is kept as is, and only its extension is swapped out
+for the one that matches the output format.
+
+  csv      plain text, comma-separated (default)
+  csv.gz   gzip-compressed CSV
+  csv.zst  zstandard-compressed CSV (requires `zstandard`)
+  parquet  Apache Parquet (requires `pyarrow`)
+  feather  Feather/Arrow IPC (requires `pyarrow`)
+"""
+
+import importlib.util
+import os
+
+
+def _write_csv(df, path):
+  df.to_csv(path)
+
+def _write_csv_gz(df, path):
+  df.to_csv(path, compression = 'gzip')
+
+def _write_csv_zst(df, path):
+  df.to_csv(path, compression = 'zstd')
+
+def _write_parquet(df, path):
+  df.to_parquet(path, index = True)
+
+def _write_feather(df, path):
+  # Feather does not store an index, so the row labels (e.g., Pedigree) are
+  # kept as the first column instead
+  df.reset_index().to_feather(path)
+
+
+# Format name -> (file extension, writer, optional dependency)
+FORMATS = {
+  'csv': ('.csv', _write_csv, None),
+  'csv.gz': ('.csv.gz', _write_csv_gz, None),
+  'csv.zst': ('.csv.zst', _write_csv_zst, 'zstandard'),
+  'parquet': ('.parquet', _write_parquet, 'pyarrow'),
+  'feather': ('.feather', _write_feather, 'pyarrow'),
+}
+
+DEFAULT_FORMAT = 'csv'
+
+
+def check_format(fmt):
+  """Verify that an output format is known and that its dependencies are
+  installed, so that a run fails before any data is processed rather than
+  after.
+
+  Args:
+    fmt (String): name of the output format
+
+  Raises:
+    Exception: the format is unknown or its optional dependency is missing
+  """
+  if fmt not in FORMATS:
+    raise Exception(f"Unknown output format `{fmt}`. Available formats: {list(FORMATS)}. Aborting.")
+  dependency = FORMATS[fmt][2]
+  if dependency is not None and importlib.util.find_spec(dependency) is None:
+    raise Exception(f"Output format `{fmt}` requires the `{dependency}` package. Aborting.")
+
+def output_filename(filename, fmt):
+  """Swap the extension of a transformer-supplied filename for the one used by
+  the output format
+
+  Args:
+    filename (String): filename given by the transformer
+    fmt (String): name of the output format
+
+  Returns (String):
+    Return the filename with the extension of the output format
+
+  Example cases:
+    >>> output_filename('FL_2006.csv', 'parquet')
+    'FL_2006.parquet'
+    >>> output_filename('FL_2006.csv', 'csv.gz')
+    'FL_2006.csv.gz'
+  """
+  basename, _ = os.path.splitext(filename)
+  return f'{basename}{FORMATS[fmt][0]}'
+
+def format_of(path):
+  """Find the output format of a file from its extension
+
+  Args:
+    path (String): path of the file
+
+  Returns (String):
+    Name of the output format, or None if the extension is not one of them
+
+  Example cases:
+    >>> format_of('out/FL_2006.csv.gz')
+    'csv.gz'
+    >>> format_of('out/FL_2006.parquet')
+    'parquet'
+    >>> format_of('out/notes.txt') is None
+    True
+  """
+  # Longest extensions first, so that .csv.gz is not taken for .csv
+  for fmt, (extension, _, _) in sorted(FORMATS.items(), key = lambda item: -len(item[1][0])):
+    if path.endswith(extension):
+      return fmt
+  return None
+
+def write(df, outdir, filename, fmt = DEFAULT_FORMAT):
+  """Write a single dataset to disk
+
+  Args:
+    df (DataFrame): data to write
+    outdir (String): path of output directory
+    filename (String): filename given by the transformer
+    fmt (String): name of the output format
+
+  Returns (String):
+    Path of the file that was written
+  """
+  path = os.path.join(str(outdir), output_filename(filename, fmt))
+  FORMATS[fmt][1](df, path)
+  return path
+
+def read(outdir, filename, fmt = DEFAULT_FORMAT):
+  """Read back a dataset written by `write`
+
+  Args:
+    outdir (String): path of output directory
+    filename (String): filename given by the transformer
+    fmt (String): name of the output format
+
+  Returns (DataFrame):
+    The data, indexed by row label
+  """
+  import pandas as pd
+  path = os.path.join(str(outdir), output_filename(filename, fmt))
+  if fmt == 'parquet':
+    return pd.read_parquet(path)
+  if fmt == 'feather':
+    df = pd.read_feather(path)
+    return df.set_index(df.columns[0])
+  # Float precision makes sure that values are read back exactly as written
+  return pd.read_csv(path, index_col = 0, float_precision = 'round_trip')
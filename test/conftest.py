@@ -41,3 +41,10 @@ def data_csv_a():
 def args_csv_a():
   with patch('sys.argv', ['-v', '--debug', '-t', 'csv_a', './test/data/csv_a']):
     return po()
+
+@pytest.fixture(autouse=True)
+def reset_input_cache():
+  # Batch and service modes turn on the input cache for the whole process
+  from modules import helpers
+  yield
+  helpers.input_cache = None
@@ -0,0 +1,48 @@
+"""
+Unit tester module for verifying batch mode
+"""
+import json
+import os
+from main import process, parseOptions
+from modules import batch, helpers
+
+def test_options_to_argv():
+  argv = batch.options_to_argv({ 'format': 'csv.gz', 'verbose': True, 'debug': False, 'files': ['a', 'b'] })
+  assert argv == ['--format', 'csv.gz', '--verbose', '--files', 'a', 'b']
+
+def test_batch(tmp_path):
+  jobs = [
+    { 'transformer': 'csv', 'inputs': ['./test/data/csv'], 'outdir': str(tmp_path / 'csv') },
+    { 'transformer': 'csv_a', 'inputs': ['./test/data/csv_a'], 'outdir': str(tmp_path / 'csv_a'),
+      'options': { 'format': 'csv.gz' } },
+    { 'transformer': 'cut', 'outdir': str(tmp_path / 'cut'),
+      'options': { 'genotypes': './data/dummy.012', 'positions': './data/dummy.012.pos',
+                   'individuals': './data/dummy.012.indv', 'name': 'dummy' } },
+    { 'transformer': 'not_a_transformer', 'inputs': [], 'outdir': str(tmp_path / 'bad') },
+  ]
+  manifest = tmp_path / 'manifest.json'
+  manifest.write_text(json.dumps({ 'jobs': jobs }))
+
+  report = batch.run(str(manifest), process, parseOptions, workers = 2)
+
+  assert [ job['status'] for job in report['jobs'] ] == ['ok', 'ok', 'ok', 'failed']
+  assert report['failed'] == 1
+  assert 'Unknown transformer' in report['jobs'][3]['error']
+  assert sorted(os.listdir(tmp_path / 'csv')) == ['FL_2006.csv', 'MO_2010.csv', 'PU_1998.csv']
+  assert sorted(os.listdir(tmp_path / 'csv_a')) == ['FL_2006.csv.gz', 'MO_2010.csv.gz', 'PU_1998.csv.gz']
+  assert 'chr1_dummy.012' in os.listdir(tmp_path / 'cut')
+  with open(f'{manifest}.results.json') as ifp:
+    assert json.load(ifp)['succeeded'] == 3
+
+def test_input_cache_copies(monkeypatch):
+  cache = helpers.InputCache()
+  monkeypatch.setattr(helpers, 'input_cache', cache)
+  args = parseOptions(['-t', 'csv', './test/data/csv'])
+  expected = helpers.read_data(args, ',').copy()
+  # Neither the data that was just parsed nor the data from the cache share
+  # values with the cached entry
+  for _ in range(2):
+    df = helpers.read_data(args, ',')
+    for column in df.select_dtypes('number'):
+      df.loc[:, column] = -1
+  assert helpers.read_data(args, ',').equals(expected)
@@ -0,0 +1,27 @@
+"""
+Unit tester module for verifying the synthetic benchmark inputs
+"""
+import filecmp
+from benchmarks import run, synthetic
+
+def test_generators_are_deterministic(tmp_path):
+  a = run.generate(str(tmp_path / 'a'), run.SCALES['tiny'], seed = 1)
+  b = run.generate(str(tmp_path / 'b'), run.SCALES['tiny'], seed = 1)
+  for name in ['csv', 'csv_a', 'genotypes', 'positions', 'individuals']:
+    assert filecmp.cmp(a[name], b[name], shallow = False)
+
+def test_panel_shape(tmp_path):
+  prefix = str(tmp_path / 'panel.012')
+  synthetic.panel_012(prefix, individuals = 4, snps = 30, chromosomes = 3, seed = 2)
+  with open(prefix) as ifp:
+    rows = ifp.readlines()
+  assert len(rows) == 4
+  assert all(len(row.split('\t')) == 31 for row in rows)
+  with open(f'{prefix}.pos') as ifp:
+    assert len(ifp.readlines()) == 30
+
+def test_run(tmp_path):
+  paths = run.generate(str(tmp_path), run.SCALES['tiny'])
+  results = run.run(['csv'], paths)
+  assert results['csv']['seconds'] > 0
+  assert results['csv']['stages']['write']['calls'] == 4
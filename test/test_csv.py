@@ -2,9 +2,14 @@
 Unit tester module for verifying the output of the `splitLongFormat` module
 Sample name of input file: `5.mergedWeightNorm.LM.rankAvg.longFormat.csv`
 """
+import json
+import os
 import pytest
-from lib.transformer.csv import process
-from lib.helpers import Convert
+import pandas as pd
+import main
+from modules.transformer import csv_a
+from modules.transformer.csv import process
+from modules.helpers import Convert
 import math
 
 def test_csv(args_csv, data_csv):
@@ -85,4 +90,94 @@ def test_csv(args_csv, data_csv):
   # Successfully processed from source > targets *and* targets > source
   # Check that the same number of values were compared
   difference = src_processed_count - target_processed_count
-  assert src_processed_count == target_processed_count, f'The number of values processed for input files differed by {difference}'
\ No newline at end of file
+  assert src_processed_count == target_processed_count, f'The number of values processed for input files differed by {difference}'
+
+@pytest.mark.parametrize('transformer', ['csv', 'csv_a'])
+def test_verify(tmp_path, transformer):
+  options = ['-t', transformer, '-o', str(tmp_path), f'./test/data/{transformer}']
+  main.process(main.parseOptions(options))
+  main.process(main.parseOptions(['--verify'] + options))
+  # Change a value, and leave out a whole output
+  path = tmp_path / 'FL_2006.csv'
+  path.write_text(path.read_text().replace('1.5', '1.25', 1))
+  os.remove(tmp_path / 'MO_2010.csv')
+  with pytest.raises(Exception, match = '2 mismatches') as error:
+    main.process(main.parseOptions(['--verify'] + options))
+  assert 'expected 1.5, found 1.25' in str(error.value)
+  assert 'MO_2010.csv: expected file' in str(error.value)
+
+@pytest.mark.parametrize('fmt', ['csv', 'csv.gz', 'parquet', 'feather'])
+def test_inverse(tmp_path, fmt):
+  outdir = str(tmp_path / 'split')
+  main.process(main.parseOptions(['-t', 'csv', '-f', fmt, '--incremental', '-o', outdir, './test/data/csv']))
+  written = main.process(main.parseOptions(['-t', 'csv', '--inverse', 'rebuilt', '-o', str(tmp_path / 'inverse'), outdir]))
+  assert [ os.path.basename(f) for f in written ] == ['rebuilt.csv']
+  expected = pd.read_csv('./test/data/csv', index_col = 0, float_precision = 'round_trip').dropna(how = 'all')
+  rebuilt = pd.read_csv(written[0], index_col = 0, float_precision = 'round_trip')
+  assert sorted(rebuilt.columns) == sorted(expected.columns)
+  pd.testing.assert_frame_equal(rebuilt.loc[expected.index, expected.columns], expected)
+
+def test_inverse_duplicate_location_year(tmp_path):
+  outdir = tmp_path / 'split'
+  for fmt in ['csv', 'parquet']:
+    main.process(main.parseOptions(['-t', 'csv', '-f', fmt, '-o', str(outdir / fmt), './test/data/csv']))
+  os.rename(outdir / 'parquet' / 'FL_2006.parquet', outdir / 'csv' / 'FL_2006.parquet')
+  with pytest.raises(Exception, match = 'same location-year'):
+    main.process(main.parseOptions(['-t', 'csv', '--inverse', 'rebuilt', '-o', str(tmp_path / 'inverse'), str(outdir / 'csv')]))
+
+def test_sparse(tmp_path):
+  # Most lines are only grown in one location-year, and some traits have no
+  # missing values at all
+  rows = [ 'Pedigree,weight_FL06,height_FL06,weight_MO10,height_MO10,count_PU98' ]
+  for i in range(40):
+    values = [ '', '', '', '', str(i) ]
+    values[(i % 2) * 2] = f'{i / 4}'
+    if i % 3 == 0:
+      values[(i % 2) * 2 + 1] = f'{i * 1.5}'
+    rows.append(','.join([ f'L{i}' ] + values))
+  path = tmp_path / 'input.csv'
+  path.write_text('\n'.join(rows) + '\n')
+  expected = process(main.parseOptions(['-t', 'csv', str(path), './test/data/csv']))
+  result = process(main.parseOptions(['-t', 'csv', '--sparse', str(path), './test/data/csv']))
+  assert list(result) == list(expected)
+  for key in expected:
+    pd.testing.assert_frame_equal(result[key]['data'], expected[key]['data'])
+
+def test_inspect(tmp_path, capsys, monkeypatch):
+  outdir = tmp_path / 'out'
+  main.process(main.parseOptions(['-t', 'csv', '--inspect', '-o', str(outdir), './test/data/csv']))
+  info = json.loads(capsys.readouterr().out)
+  assert info['label'] == 'Pedigree'
+  assert info['traits'] == ['B11_lmResid', 'height', 'weight']
+  assert info['location_years'] == { 'FL_2006': 2, 'MO_2010': 1, 'PU_1998': 2 }
+  # The rows are not counted
+  assert 'rows' not in info and info['estimated_rows'] > 0
+  # Nothing is written
+  assert not outdir.exists()
+
+  # The loc column is scanned across blocks, and past a last line without an
+  # end of line
+  path = tmp_path / 'input.csv'
+  path.write_text('Pedigree,weight,loc\n' + ''.join(f'L{i},{i},{"FL06" if i % 3 else "PU98"}\n' for i in range(20)) + 'L20,1,MO10')
+  monkeypatch.setattr(csv_a, 'INSPECT_BLOCK_BYTES', 16)
+  info = csv_a.inspect(main.parseOptions(['-t', 'csv_a', str(path), './test/data/csv_a']))
+  assert info['rows'] == 26
+  assert info['location_years'] == { 'PU98': 9, 'FL06': 15, 'MO10': 2 }
+
+  # loc is the first column, with a blank line, a row without a location-year
+  # and an end of line after the last row
+  path.write_text('loc,Pedigree,weight\nFL06,A,1\n\nPU98,B,2\n,C,3\nFL06,D,4\n')
+  for blocksize in [4, 1 << 24]:
+    monkeypatch.setattr(csv_a, 'INSPECT_BLOCK_BYTES', blocksize)
+    info = csv_a.inspect(main.parseOptions(['-t', 'csv_a', str(path)]))
+    assert info['rows'] == 4
+    assert info['location_years'] == { 'FL06': 2, 'PU98': 1 }
+
+  # Padding and quotes are not part of the location-year, and a quoted field
+  # may hold the delimiter
+  path.write_text('Pedigree,loc,weight\nA,FL 2006,1\nB, FL 2006 ,2\nC,"GA, 2007",3\n"D,E", "GA, 2007",4\nF,FL 2006,"5"\n')
+  for blocksize in [4, 1 << 24]:
+    monkeypatch.setattr(csv_a, 'INSPECT_BLOCK_BYTES', blocksize)
+    info = csv_a.inspect(main.parseOptions(['-t', 'csv_a', str(path)]))
+    assert info['rows'] == 5
+    assert info['location_years'] == { 'FL 2006': 3, 'GA, 2007': 2 }
@@ -3,8 +3,8 @@ Unit tester module for verifying the output of the CSV-A module
 Sample name of input file: `1.meanByLineandLoc.divpanel.LocSpecificResids.csv`
 """
 import pytest
-from lib.transformer.csv_a import process
-from lib.helpers import Convert
+from modules.transformer.csv_a import process
+from modules.helpers import Convert
 import math
 
 def test_csv_a(args_csv_a, data_csv_a):
@@ -0,0 +1,261 @@
+"""
+Unit tester module for verifying the cut transformer
+"""
+import json
+import shutil
+import subprocess
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+from modules import genotype
+from modules.transformer import cut
+
+def outputs(outdir):
+  # Hidden files (e.g., the row offsets of the input) are not outputs
+  return sorted(f.name for f in outdir.iterdir() if not f.name.startswith('.'))
+
+def run(outdir, *options):
+  cut.process(cut.parseOptions(['-g', './data/dummy.012', '-p', './data/dummy.012.pos', '-i', './data/dummy.012.indv',
+                                '-o', str(outdir), '-n', 'test'] + list(options)))
+
+def test_qc(tmp_path):
+  run(tmp_path / 'plain')
+  run(tmp_path / 'qc', '--qc')
+  # The split itself is unchanged
+  assert (tmp_path / 'qc' / 'chr3_test.012').read_bytes() == (tmp_path / 'plain' / 'chr3_test.012').read_bytes()
+  assert not (tmp_path / 'plain' / 'chr3_test.012.pos.qc').exists()
+
+  calls = pd.read_table('./data/dummy.012', header = None, index_col = 0).iloc[:, 5:9].replace(-1, np.nan)
+  snps = pd.read_table(tmp_path / 'qc' / 'chr3_test.012.pos.qc')
+  assert list(snps['position']) == [198, 211, 286, 232]
+  assert list(snps['called']) == list(calls.count())
+  frequency = calls.sum() / (2 * calls.count())
+  np.testing.assert_allclose(snps['maf'], np.minimum(frequency, 1 - frequency), atol = 1e-6)
+  np.testing.assert_allclose(snps['missing'], calls.isna().mean(), atol = 1e-6)
+
+  individuals = pd.read_table(tmp_path / 'qc' / 'chr3_test.012.indv.qc')
+  assert len(individuals) == len(calls)
+  np.testing.assert_allclose(individuals['missing'], calls.isna().mean(axis = 1), atol = 1e-6)
+
+def test_filters(tmp_path):
+  run(tmp_path, '--min-maf', '0.42', '--max-missing', '0.05', '--max-missing-individual', '0.05', '--qc')
+  calls = pd.read_table('./data/dummy.012', header = None, index_col = 0).replace(-1, np.nan)
+  positions = pd.read_table('./data/dummy.012.pos', header = None)
+  frequency = calls.sum() / (2 * calls.count())
+  snps = (np.minimum(frequency, 1 - frequency) >= 0.42) & (calls.isna().mean() <= 0.05)
+  rows = calls.isna().mean(axis = 1) <= 0.05
+  assert not rows.all() and not snps.all()
+
+  # Chromosomes 5 and 8 have no SNP left
+  assert sorted(f.name for f in tmp_path.glob('*.012')) == [ f'chr{n}_test.012' for n in [1, 2, 3, 4] ]
+  for number, columns in [(1, [1, 2, 3]), (2, [4, 5]), (3, [6, 7, 8, 9]), (4, [10])]:
+    kept = [ c for c in columns if snps[c] ]
+    expected = calls.loc[rows, kept]
+    genotypes = pd.read_table(tmp_path / f'chr{number}_test.012', header = None, na_values = 'NA')
+    np.testing.assert_array_equal(genotypes.values, expected.values)
+    pos = pd.read_table(tmp_path / f'chr{number}_test.012.pos', header = None)
+    assert list(pos[1]) == list(positions[1][[ c - 1 for c in kept ]])
+    assert list(pd.read_table(tmp_path / f'chr{number}_test.012.pos.qc')['position']) == list(pos[1])
+    assert (tmp_path / f'chr{number}_test.012.indv').read_text().count('\n') == rows.sum()
+    assert len(pd.read_table(tmp_path / f'chr{number}_test.012.indv.qc')) == rows.sum()
+
+@pytest.mark.parametrize('options', [[], ['--min-maf', '0.42', '--max-missing-individual', '0.05']])
+def test_transpose(tmp_path, options):
+  run(tmp_path / 'rows', *options)
+  run(tmp_path / 'text', '--transpose', 'text', *options)
+  # A tiny budget transposes a single SNP at a time
+  run(tmp_path / 'binary', '--transpose', 'binary', '--max-memory', '4K', *options)
+  for f in (tmp_path / 'rows').glob('*.012'):
+    expected = pd.read_table(f, header = None, na_values = 'NA').fillna(-1).astype('int8').values
+    text = pd.read_table(tmp_path / 'text' / f'{f.name}.snp', header = None, na_values = 'NA').fillna(-1).astype('int8').values
+    np.testing.assert_array_equal(text, expected.T)
+    binary = np.fromfile(tmp_path / 'binary' / f'{f.name}.snp.bin', dtype = np.int8).reshape(expected.shape[1], expected.shape[0])
+    np.testing.assert_array_equal(binary, expected.T)
+    assert (tmp_path / 'text' / f'{f.name}.pos').read_bytes() == (tmp_path / 'rows' / f'{f.name}.pos').read_bytes()
+    assert not (tmp_path / 'text' / f.name).exists()
+
+def test_keep_individuals(tmp_path):
+  for suffix in ['', '.pos', '.indv']:
+    shutil.copyfile(f'./data/dummy.012{suffix}', tmp_path / f'panel.012{suffix}')
+  (tmp_path / 'keep').write_text('J_J_J_J\nB_B_B_B\nI_I_I_I\nnobody\n')
+  def split(outdir, *options):
+    cut.process(cut.parseOptions(['-g', str(tmp_path / 'panel.012'), '-p', str(tmp_path / 'panel.012.pos'), '-i', str(tmp_path / 'panel.012.indv'),
+                                  '-o', str(tmp_path / outdir), '-n', 'test'] + list(options)))
+  split('all')
+  split('some', '--keep-individuals', str(tmp_path / 'keep'), '--qc')
+  # The row offsets are kept in the output directory, rather than next to the
+  # input, and reused by the next run into it
+  assert (tmp_path / 'some' / '.panel.012.rowidx.npy').exists()
+  assert not (tmp_path / 'panel.012.rowidx.npy').exists()
+  split('some', '--keep-individuals', str(tmp_path / 'keep'), '--qc')
+  split('again', '--keep-individuals', str(tmp_path / 'keep'))
+  for f in (tmp_path / 'all').glob('*.012'):
+    rows = f.read_text().splitlines()
+    assert (tmp_path / 'some' / f.name).read_text().splitlines() == [ rows[1], rows[8], rows[9] ]
+    assert (tmp_path / 'some' / f'{f.name}.indv').read_text() == 'B_B_B_B\nI_I_I_I\nJ_J_J_J\n'
+    assert (tmp_path / 'again' / f.name).read_bytes() == (tmp_path / 'some' / f.name).read_bytes()
+  individuals = pd.read_table(tmp_path / 'some' / 'chr1_test.012.indv.qc')
+  assert list(individuals['individual']) == ['B_B_B_B', 'I_I_I_I', 'J_J_J_J']
+
+@pytest.mark.parametrize('line,regular', [
+  (b'0\t0\t1\t2\t2\t1\t0\n', True),
+  (b'12\t0\t-1\t2\t-1\t1\t0\n', True),
+  (b'3\t0\t1\t2\t2\t1\t0', True),
+  (b'4\t0\t1 \t2\t2\t1\t0\r\n', False),
+])
+def test_slice_row(line, regular):
+  bounds = [('Chr_01', 1, 3), ('Chr_02', 3, 4), ('Chr_03', 4, 7)]
+  pieces = cut.slice_row(line, bounds)
+  if not regular:
+    assert pieces is None
+    return
+  xs = cut.stripLine(line.decode())
+  assert [ bytes(p).decode() for p in pieces ] == [ '\t'.join(xs[lower:upper]) for _, lower, upper in bounds ]
+
+@pytest.mark.parametrize('options', [[], ['--min-maf', '0.42', '--max-missing-individual', '0.05']])
+def test_resume(tmp_path, monkeypatch, options):
+  run(tmp_path / 'full', *options)
+  # Interrupt a run after its last checkpoint, which is taken before the last
+  # row, while that row was only partly written
+  monkeypatch.setattr(cut.Checkpoint, 'remove', lambda self: None)
+  run(tmp_path / 'resumed', '--checkpoint-interval', '0', *options)
+  assert (tmp_path / 'resumed' / cut.Checkpoint.FILENAME).exists()
+  for f in (tmp_path / 'resumed').glob('*.012'):
+    with open(f, 'ab') as ofp:
+      ofp.write(b'0\t1\t')
+  monkeypatch.undo()
+
+  run(tmp_path / 'resumed', '--resume', *options)
+  assert not (tmp_path / 'resumed' / cut.Checkpoint.FILENAME).exists()
+  files = outputs(tmp_path / 'full')
+  assert outputs(tmp_path / 'resumed') == files
+  for name in files:
+    assert (tmp_path / 'resumed' / name).read_bytes() == (tmp_path / 'full' / name).read_bytes()
+
+@pytest.mark.parametrize('option', ['--debug', '--incremental'])
+def test_resume_without_checkpoints(tmp_path, option):
+  run(tmp_path)
+  with pytest.raises(Exception, match = f'--resume cannot be combined with {option}'):
+    run(tmp_path, '--resume', option)
+
+@pytest.mark.parametrize('options', [[], ['--min-maf', '0.42', '--max-missing-individual', '0.05']])
+def test_verify(tmp_path, options):
+  run(tmp_path, *options)
+  run(tmp_path, '--verify', *options)
+  # Change a call of the third individual, and drop the last row of another
+  # chromosome
+  rows = (tmp_path / 'chr1_test.012').read_text().splitlines()
+  calls = rows[2].split('\t')
+  calls[0] = '2' if calls[0] != '2' else '0'
+  rows[2] = '\t'.join(calls)
+  (tmp_path / 'chr1_test.012').write_text('\n'.join(rows) + '\n')
+  rows = (tmp_path / 'chr2_test.012').read_text().splitlines()
+  (tmp_path / 'chr2_test.012').write_text('\n'.join(rows[:-1]) + '\n')
+  with pytest.raises(Exception, match = r'2 mismatches') as error:
+    run(tmp_path, '--verify', *options)
+  assert 'chr1_test.012 (row ' in str(error.value)
+  assert 'chr2_test.012 (row ' in str(error.value)
+
+@pytest.mark.parametrize('keep', [False, True])
+def test_shards(tmp_path, keep):
+  options = ['-g', './data/dummy.012', '-p', './data/dummy.012.pos', '-i', './data/dummy.012.indv', '-n', 'test']
+  if keep:
+    (tmp_path / 'keep').write_text('B_B_B_B\nE_E_E_E\nJ_J_J_J\n')
+    options += ['--keep-individuals', str(tmp_path / 'keep')]
+  cut.process(cut.parseOptions(options + ['-o', str(tmp_path / 'full')]))
+  sharded = options + ['-o', str(tmp_path / 'sharded')]
+  cut.process(cut.parseOptions(sharded + ['--plan', '3']))
+  # Every shard runs in a process of its own, as it would on another node
+  shards = [ subprocess.Popen([sys.executable, '-m', 'modules.transformer.cut'] + sharded + ['--run-shard', str(k)],
+                              stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL) for k in range(3) ]
+  assert [ shard.wait() for shard in shards ] == [0, 0, 0]
+  cut.process(cut.parseOptions(sharded + ['--merge-shards']))
+  files = outputs(tmp_path / 'full')
+  assert outputs(tmp_path / 'sharded') == files
+  for name in files:
+    assert (tmp_path / 'sharded' / name).read_bytes() == (tmp_path / 'full' / name).read_bytes()
+
+def test_merge_shards_incomplete(tmp_path):
+  options = ['-g', './data/dummy.012', '-p', './data/dummy.012.pos', '-i', './data/dummy.012.indv', '-n', 'test', '-o', str(tmp_path)]
+  cut.process(cut.parseOptions(options + ['--plan', '2']))
+  cut.process(cut.parseOptions(options + ['--run-shard', '1']))
+  with pytest.raises(Exception, match = r'Shards \[0\]'):
+    cut.process(cut.parseOptions(options + ['--merge-shards']))
+  with pytest.raises(Exception, match = 'other options'):
+    cut.process(cut.parseOptions(options + ['--run-shard', '0', '-n', 'other']))
+
+def dosage_panel(tmp_path):
+  # Imputed dosages: the dummy calls, nudged off the integers where called
+  calls = pd.read_table('./data/dummy.012', header = None, index_col = 0)
+  rng = np.random.default_rng(0)
+  dosages = np.where(calls < 0, -1, np.clip(calls + rng.choice([-0.25, 0, 0.13], size = calls.shape), 0, 2))
+  lines = [ '\t'.join([ str(i) ] + [ '-1' if x < 0 else f'{x:g}' for x in row ]) for i, row in enumerate(dosages) ]
+  (tmp_path / 'dosage.012').write_text('\n'.join(lines) + '\n')
+  return np.where(dosages < 0, np.nan, dosages)
+
+@pytest.mark.parametrize('storage', ['float16', 'uint8'])
+def test_dosage(tmp_path, storage):
+  dosages = dosage_panel(tmp_path)
+  options = ['-g', str(tmp_path / 'dosage.012'), '-p', './data/dummy.012.pos', '-i', './data/dummy.012.indv', '-n', 'test', '--dosage', storage]
+  cut.process(cut.parseOptions(options + ['-o', str(tmp_path / 'rows'), '--qc']))
+  cut.process(cut.parseOptions(options + ['-o', str(tmp_path / 'binary'), '--transpose', 'binary']))
+  # Chromosome 3 is columns 6 to 9
+  expected = dosages[:, 5:9]
+  # Written with two decimals
+  assert all(x == 'NA' or len(x.split('.')[1]) == 2 for x in (tmp_path / 'rows' / 'chr3_test.012').read_text().split())
+  written = pd.read_table(tmp_path / 'rows' / 'chr3_test.012', header = None, na_values = 'NA')
+  np.testing.assert_allclose(written.astype(float).values, expected, atol = 0.005)
+  stored = np.fromfile(tmp_path / 'binary' / 'chr3_test.012.snp.bin', dtype = storage).reshape(4, -1).T
+  decoded = genotype.Dosages(storage).decode(stored)
+  np.testing.assert_allclose(decoded, expected, atol = 0.005)
+
+  snps = pd.read_table(tmp_path / 'rows' / 'chr3_test.012.pos.qc')
+  frequency = np.nansum(expected, axis = 0) / (2 * (~np.isnan(expected)).sum(axis = 0))
+  np.testing.assert_allclose(snps['maf'], np.minimum(frequency, 1 - frequency), atol = 1e-3)
+  assert list(snps['called']) == list((~np.isnan(expected)).sum(axis = 0))
+
+def test_dedup(tmp_path):
+  rng = np.random.default_rng(1)
+  calls = rng.integers(-1, 3, size = (6, 6))
+  # SNPs 3 and 4 repeat SNP 1 of the same chromosome; SNP 5 repeats it on
+  # another chromosome, and SNP 6 only differs from SNP 5 by a missing call
+  calls[:, 2] = calls[:, 3] = calls[:, 4] = calls[:, 0]
+  calls[:, 5] = calls[:, 4]
+  calls[0, 5] = -1 if calls[0, 4] != -1 else 0
+  (tmp_path / 'in.012').write_text(''.join('\t'.join(map(str, [i] + list(row))) + '\n' for i, row in enumerate(calls)))
+  (tmp_path / 'in.012.pos').write_text('Chr_01\t10\nChr_01\t20\nChr_01\t30\nChr_01\t40\nChr_02\t10\nChr_02\t20\n')
+  (tmp_path / 'in.012.indv').write_text(''.join(f'L{i}\n' for i in range(6)))
+  cut.process(cut.parseOptions(['-g', str(tmp_path / 'in.012'), '-p', str(tmp_path / 'in.012.pos'), '-i', str(tmp_path / 'in.012.indv'),
+                                '-o', str(tmp_path / 'out'), '-n', 'test', '--dedup']))
+  out = tmp_path / 'out'
+  assert (out / 'chr1_test.012.pos').read_text() == '1\t10\n1\t20\n'
+  assert (out / 'chr1_test.012.pos.dup').read_text() == '1\t30\t10\n1\t40\t10\n'
+  assert (out / 'chr2_test.012.pos').read_text() == '2\t10\n2\t20\n'
+  assert (out / 'chr2_test.012.pos.dup').read_text() == ''
+  written = pd.read_table(out / 'chr1_test.012', header = None, na_values = 'NA').fillna(-1).astype(int)
+  np.testing.assert_array_equal(written.values, calls[:, :2])
+
+@pytest.mark.parametrize('options', [[], ['--transpose', 'text']])
+def test_dedup_collision(tmp_path, monkeypatch, options):
+  # Two SNPs whose calls differ but whose hashes would match
+  def representatives(self, ranges, mask = None):
+    found = np.full(self.snps, -1, dtype = np.int64)
+    found[1] = 0
+    return found
+  monkeypatch.setattr(genotype.ColumnHashes, 'representatives', representatives)
+  with pytest.raises(Exception, match = 'SNP 2 was dropped as identical to SNP 1, but their calls differ'):
+    run(tmp_path, '--dedup', *options)
+
+@pytest.mark.parametrize('blocksize', [7, 1 << 24])
+def test_inspect(tmp_path, capsys, blocksize):
+  positions = pd.read_table('./data/dummy.012.pos', header = None)
+  expected = positions.groupby(0, sort = False).size().to_dict()
+  assert dict(genotype.count_positions('./data/dummy.012.pos', blocksize = blocksize)) == expected
+  run(tmp_path / 'out', '--inspect')
+  info = json.loads(capsys.readouterr().out)
+  assert info['individuals'] == 10
+  assert info['snps'] == len(positions)
+  assert info['chromosomes'] == expected
+  assert info['outputs']['Chr_08'] == 'chr8_test.012'
+  assert not (tmp_path / 'out').exists()
@@ -0,0 +1,48 @@
+"""
+Unit tester module for verifying service mode
+"""
+import os
+import threading
+import time
+import pytest
+from main import process, parseOptions
+from modules import daemon, helpers
+
+@pytest.fixture
+def server(tmp_path):
+  path = str(tmp_path / 'transform.sock')
+  helpers.enable_input_cache(2)
+  thread = threading.Thread(target = daemon.serve, args = (path, process, parseOptions))
+  thread.start()
+  while not os.path.exists(path):
+    time.sleep(0.01)
+  yield path
+  daemon.submit(path, { 'command': 'shutdown' })
+  thread.join()
+
+def test_daemon(server, tmp_path):
+  assert daemon.submit(server, { 'command': 'ping' })['status'] == 'ok'
+
+  for i in range(2):
+    outdir = str(tmp_path / f'out{i}')
+    response = daemon.submit(server, { 'argv': ['-t', 'csv', '-o', outdir, './test/data/csv'] })
+    assert response['status'] == 'ok', response
+    assert len(response['files']) == 3
+  # The second job reused the parsed input
+  assert daemon.submit(server, { 'command': 'ping' })['cached_inputs'] == 1
+
+  response = daemon.submit(server, { 'job': { 'transformer': 'csv_a', 'inputs': ['./test/data/csv_a'],
+                                              'outdir': str(tmp_path / 'job') } })
+  assert response['status'] == 'ok', response
+
+  response = daemon.submit(server, { 'argv': ['-t', 'not_a_transformer'] })
+  assert response['status'] == 'failed'
+
+def test_input_cache_eviction():
+  import pandas as pd
+  cache = helpers.InputCache(max_entries = 2)
+  for key in ['a', 'b', 'c']:
+    cache.put(key, pd.DataFrame({ 'x': [1.0, 2.0] }))
+  assert len(cache) == 2
+  assert cache.get('a') is None
+  assert cache.get('c') is not None
@@ -0,0 +1,85 @@
+"""
+Unit tester module for verifying incremental reruns
+"""
+import os
+import shutil
+import subprocess
+import sys
+from main import process, parseOptions
+from modules import manifest
+from modules.transformer import cut
+
+def mtimes(directory):
+  return { f: os.stat(os.path.join(directory, f)).st_mtime_ns for f in os.listdir(directory) }
+
+def test_incremental_csv(tmp_path):
+  src = tmp_path / 'input.csv'
+  shutil.copyfile('./test/data/csv', src)
+  outdir = str(tmp_path / 'out')
+  argv = ['-t', 'csv', '-o', outdir, '--incremental', str(src)]
+
+  assert len(process(parseOptions(argv))) == 3
+  before = mtimes(outdir)
+
+  # Nothing changed
+  assert process(parseOptions(argv)) == []
+  assert mtimes(outdir) == before
+
+  # Change a value that only belongs to one location-year
+  text = src.read_text().replace('0.125', '0.25')
+  src.write_text(text)
+  written = process(parseOptions(argv))
+  assert [ os.path.basename(f) for f in written ] == ['MO_2010.csv']
+  after = mtimes(outdir)
+  assert after['FL_2006.csv'] == before['FL_2006.csv']
+  assert after['PU_1998.csv'] == before['PU_1998.csv']
+
+  # A different output format rewrites everything
+  assert len(process(parseOptions(argv + ['--format', 'csv.gz']))) == 3
+  assert 'FL_2006.csv' not in os.listdir(outdir)
+
+def test_incremental_cut(tmp_path, monkeypatch):
+  inputs = {}
+  for suffix in ['', '.pos', '.indv']:
+    inputs[suffix] = str(tmp_path / f'dummy.012{suffix}')
+    shutil.copyfile(f'./data/dummy.012{suffix}', inputs[suffix])
+  outdir = str(tmp_path / 'out')
+  argv = ['-g', inputs[''], '-p', inputs['.pos'], '-i', inputs['.indv'], '-o', outdir, '-n', 'dummy', '--incremental']
+
+  cut.process(cut.parseOptions(argv))
+  before = mtimes(outdir)
+
+  # Change a genotype call on chromosome 2 (column 4 of the first row)
+  with open(inputs[''], 'r') as ifp:
+    rows = ifp.readlines()
+  cells = rows[0].split('\t')
+  cells[4] = '2'
+  rows[0] = '\t'.join(cells)
+  with open(inputs[''], 'w') as ofp:
+    ofp.writelines(rows)
+
+  # The input is split once, and hashed as it is written
+  passes = []
+  split = cut.split
+  monkeypatch.setattr(cut, 'split', lambda *args, **kwargs: passes.append(1) or split(*args, **kwargs))
+  cut.process(cut.parseOptions(argv))
+  assert len(passes) == 1
+  after = mtimes(outdir)
+  assert sorted(after) == sorted(before)
+  assert after['chr2_dummy.012'] != before['chr2_dummy.012']
+  assert after['chr1_dummy.012'] == before['chr1_dummy.012']
+  with open(os.path.join(outdir, 'chr2_dummy.012')) as ifp:
+    assert ifp.readline().startswith('2\t')
+
+def test_cut_script(tmp_path):
+  # cut also runs as a script, from any directory
+  subprocess.run([sys.executable, os.path.abspath('modules/transformer/cut.py'), '-g', os.path.abspath('./data/dummy.012'),
+                  '-p', os.path.abspath('./data/dummy.012.pos'), '-i', os.path.abspath('./data/dummy.012.indv'),
+                  '-o', str(tmp_path / 'out'), '-n', 'test'], cwd = tmp_path, check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+  assert (tmp_path / 'out' / 'chr8_test.012').exists()
+
+def test_input_files_skip_hidden(tmp_path):
+  (tmp_path / 'FL_2006.csv').write_text('Pedigree,weight\n')
+  (tmp_path / '.manifest.json').write_text('{}')
+  (tmp_path / 'nested').mkdir()
+  assert manifest.input_files([str(tmp_path)]) == [str(tmp_path / 'FL_2006.csv')]
@@ -0,0 +1,81 @@
+"""
+Unit tester module for verifying memory-budgeted runs
+"""
+import gc
+import os
+import warnings
+import pytest
+import pandas as pd
+import main
+from main import parseOptions
+from modules.memory import SpillStore, SpilledOutput, parse_size
+from modules.transformer import csv, csv_a, cut
+
+def test_parse_size():
+  assert parse_size('512M') == 512 * 2**20
+  assert parse_size('1.5G') == int(1.5 * 2**30)
+  assert parse_size('100') == 100
+  with pytest.raises(ValueError):
+    parse_size('lots')
+
+@pytest.mark.parametrize('transformer,path,budget', [(csv, './test/data/csv', '550'), (csv_a, './test/data/csv_a', '450')])
+def test_chunked_matches_in_memory(transformer, path, budget):
+  expected = transformer.process(parseOptions(['-t', 'x', path]))
+  # A budget this small reads the input one row at a time
+  result = transformer.process(parseOptions(['-t', 'x', '--max-memory', budget, path]))
+  assert list(result) == list(expected)
+  for key in expected:
+    assert isinstance(result[key], SpilledOutput)
+    assert result[key]['filename'] == expected[key]['filename']
+    pd.testing.assert_frame_equal(result[key]['data'], expected[key]['data'])
+
+def test_spill_store():
+  store = SpillStore(budget = 64)
+  parts = [ pd.DataFrame({ 'x': [float(i)] * 4 }, index = list('abcd')) for i in range(3) ]
+  for part in parts:
+    store.append('key', part)
+  assert store.spilled > 0
+  pd.testing.assert_frame_equal(store.load('key'), pd.concat(parts))
+  store.cleanup()
+
+def test_fails_early():
+  with pytest.raises(Exception, match = 'max-memory'):
+    csv.process(parseOptions(['-t', 'csv', '--max-memory', '100', './test/data/csv']))
+
+def test_cut_fails_early(tmp_path):
+  with pytest.raises(Exception, match = 'max-memory'):
+    cut.process(cut.parseOptions(['-g', './data/dummy.012', '-p', './data/dummy.012.pos', '-i', './data/dummy.012.indv',
+                                  '-o', str(tmp_path / 'out'), '--max-memory', '100']))
+
+@pytest.mark.parametrize('options', [[], ['--pipeline']])
+def test_spilled_partitions_are_removed(tmp_path, monkeypatch, options):
+  spill = tmp_path / 'spill'
+  spill.mkdir()
+  removed = []
+  cleanup = SpillStore.cleanup
+  monkeypatch.setattr(SpillStore, 'cleanup', lambda store: removed.append(os.listdir(spill)) or cleanup(store))
+  written = main.process(parseOptions(['-t', 'csv', '--max-memory', '550', '--spill-dir', str(spill),
+                                       '-o', str(tmp_path / 'out'), './test/data/csv'] + options))
+  assert len(written) == 3
+  # Removed once the outputs were written, rather than whenever the store is
+  # garbage collected
+  assert len(removed) == 1 and len(removed[0]) == 1
+  assert list(spill.iterdir()) == []
+
+@pytest.mark.parametrize('transformer,path,budget', [(csv, './test/data/csv', '550'), (csv_a, './test/data/csv_a', '450')])
+def test_spilled_partitions_outlive_process(tmp_path, transformer, path, budget):
+  spill = tmp_path / 'spill'
+  spill.mkdir()
+  results = transformer.process(parseOptions(['-t', transformer.__name__.split('.')[-1], '--max-memory', budget,
+                                              '--spill-dir', str(spill), path]))
+  # Kept for as long as the outputs may be read
+  assert len(list(spill.iterdir())) == 1
+  assert all(len(output['data']) > 0 for output in results.values())
+  # Removed along with the store, rather than left to the temporary directory
+  # to clean up after itself
+  with warnings.catch_warnings(record = True) as caught:
+    warnings.simplefilter('always')
+    del results
+    gc.collect()
+  assert [ w for w in caught if issubclass(w.category, ResourceWarning) ] == []
+  assert list(spill.iterdir()) == []
@@ -0,0 +1,29 @@
+"""
+Unit tester module for verifying the merge transformer
+"""
+import pytest
+from modules.transformer import cut, merge
+
+def split(outdir, *options):
+  cut.process(cut.parseOptions(['-g', './data/dummy.012', '-p', './data/dummy.012.pos', '-i', './data/dummy.012.indv',
+                                '-o', str(outdir), '-n', 'test'] + list(options)))
+
+def columns(path):
+  # The first column is the row index
+  return [ line.split('\t', 1)[1] for line in open(path) ]
+
+def test_round_trip(tmp_path):
+  split(tmp_path / 'cut')
+  # Chromosomes are put back in order no matter the order they are given in
+  files = sorted((tmp_path / 'cut').glob('*.012'), reverse = True)
+  merge.process(merge.parseOptions(['-o', str(tmp_path / 'merged.012')] + [ str(f) for f in files ]))
+  assert columns(tmp_path / 'merged.012') == columns('./data/dummy.012')
+  assert (tmp_path / 'merged.012.pos').read_text() == open('./data/dummy.012.pos').read()
+  assert (tmp_path / 'merged.012.indv').read_text() == open('./data/dummy.012.indv').read()
+
+def test_individuals_must_agree(tmp_path):
+  split(tmp_path / 'cut')
+  (tmp_path / 'cut' / 'chr2_test.012.indv').write_text('someone\n')
+  files = [ str(f) for f in (tmp_path / 'cut').glob('*.012') ]
+  with pytest.raises(Exception, match = 'same individuals'):
+    merge.process(merge.parseOptions(['-o', str(tmp_path / 'merged.012')] + files))
@@ -0,0 +1,47 @@
+"""
+Unit tester module for verifying parallel splitting
+"""
+import os
+import shutil
+import pytest
+import pandas as pd
+from main import parseOptions, process
+from modules import parallel
+
+@pytest.mark.parametrize('transformer,path', [('csv', './test/data/csv'), ('csv_a', './test/data/csv_a')])
+def test_parallel_matches_sequential(tmp_path, transformer, path):
+  sequential = process(parseOptions(['-t', transformer, '-o', str(tmp_path / 'a'), path]))
+  parallel = process(parseOptions(['-t', transformer, '--split-workers', '2', '-o', str(tmp_path / 'b'), path]))
+  assert sorted(map(os.path.basename, parallel)) == sorted(map(os.path.basename, sequential))
+  for name in map(os.path.basename, sequential):
+    assert (tmp_path / 'a' / name).read_bytes() == (tmp_path / 'b' / name).read_bytes()
+
+def test_parallel_incremental(tmp_path):
+  src = tmp_path / 'input.csv'
+  shutil.copyfile('./test/data/csv', src)
+  argv = ['-t', 'csv', '--split-workers', '2', '--incremental', '-o', str(tmp_path / 'out'), str(src)]
+  assert len(process(parseOptions(argv))) == 3
+  # Only the output whose content changed is written again
+  src.write_text(src.read_text().replace('0.125', '0.25'))
+  assert [ os.path.basename(f) for f in process(parseOptions(argv)) ] == ['MO_2010.csv']
+
+@pytest.mark.parametrize('transformer,text', [('csv', 'Pedigree,weight_FL06,note_FL06,height_PU98\nA,1.5,tall,2\nB,2.5,short,\nC,,,3\n'),
+                                              ('csv_a', 'Pedigree,loc,weight,note\nA,FL06,1.5,tall\nB,FL06,2.5,short\nC,PU98,3.0,\n')])
+def test_parallel_text_columns(tmp_path, transformer, text):
+  # Text columns cannot be shared, and the outputs are split sequentially
+  path = tmp_path / 'input.csv'
+  path.write_text(text)
+  sequential = process(parseOptions(['-t', transformer, '-o', str(tmp_path / 'a'), str(path)]))
+  parallel = process(parseOptions(['-t', transformer, '--split-workers', '2', '-o', str(tmp_path / 'b'), str(path)]))
+  assert sorted(map(os.path.basename, parallel)) == sorted(map(os.path.basename, sequential)) == ['FL_2006.csv', 'PU_1998.csv']
+  for name in map(os.path.basename, sequential):
+    assert (tmp_path / 'a' / name).read_bytes() == (tmp_path / 'b' / name).read_bytes()
+
+def test_split_lets_go_of_the_table(tmp_path):
+  values = pd.DataFrame({ 'a': [1.0, 2.0], 'b': [3, 4], 'c': [5.0, 6.0] }, index = pd.Index(['x', 'y'], name = 'Pedigree'))
+  tasks = [ parallel.Task('first.csv', None, [2, 0], ['c', 'a'], False), parallel.Task('second.csv', (1, 2), [1], ['b'], False) ]
+  shared = [values, tasks]
+  parallel.split(shared, str(tmp_path), 'csv', 1)
+  assert shared == []
+  assert (tmp_path / 'first.csv').read_text() == 'Pedigree,c,a\nx,5.0,1.0\ny,6.0,2.0\n'
+  assert (tmp_path / 'second.csv').read_text() == 'Pedigree,b\ny,4\n'
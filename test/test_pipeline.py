@@ -0,0 +1,50 @@
+"""
+Unit tester module for verifying pipelined runs
+"""
+import os
+import pytest
+import pandas as pd
+from main import parseOptions, process
+from modules import pipeline
+from modules.transformer import csv, csv_a
+
+@pytest.mark.parametrize('transformer,path', [('csv', './test/data/csv'), ('csv_a', './test/data/csv_a')])
+def test_pipeline_matches_sequential(tmp_path, transformer, path):
+  sequential = process(parseOptions(['-t', transformer, '-o', str(tmp_path / 'a'), path]))
+  pipelined = process(parseOptions(['-t', transformer, '--pipeline', '--writers', '3', '--queue-size', '1',
+                                    '-o', str(tmp_path / 'b'), path]))
+  assert sorted(map(os.path.basename, pipelined)) == sorted(map(os.path.basename, sequential))
+  for name in map(os.path.basename, sequential):
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'a' / name), pd.read_csv(tmp_path / 'b' / name))
+
+@pytest.mark.parametrize('transformer,path', [(csv, './test/data/csv'), (csv_a, './test/data/csv_a')])
+def test_read_ahead_matches_whole(monkeypatch, transformer, path):
+  # Chunks this small split every input over several of them
+  monkeypatch.setattr(pipeline, 'CHUNK_ROWS', 2)
+  whole = transformer.process(parseOptions(['-t', 'x', path, path]))
+  chunked = transformer.process(parseOptions(['-t', 'x', '--pipeline', path, path]))
+  assert list(chunked) == list(whole)
+  for key in whole:
+    pd.testing.assert_frame_equal(chunked[key]['data'], whole[key]['data'])
+
+def test_prefetch():
+  assert list(pipeline.prefetch(iter(range(10)), ahead = 1)) == list(range(10))
+  def failing():
+    yield 1
+    raise ValueError('bad chunk')
+  with pytest.raises(ValueError, match = 'bad chunk'):
+    list(pipeline.prefetch(failing()))
+  # Stopping early does not leave the producer blocked
+  for item in pipeline.prefetch(iter(range(100)), ahead = 1):
+    break
+
+def test_run_propagates_errors():
+  def consume(item):
+    if item == 3:
+      raise ValueError('bad item')
+    return item
+  with pytest.raises(ValueError, match = 'bad item'):
+    pipeline.run(iter(range(100)), consume, workers = 2, maxsize = 1)
+
+def test_ordered_map():
+  assert list(pipeline.ordered_map(lambda x: x * x, range(10), workers = 3)) == [ x * x for x in range(10) ]
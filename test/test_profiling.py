@@ -0,0 +1,54 @@
+"""
+Unit tester module for verifying per-stage profiling
+"""
+import json
+import pstats
+import pytest
+from main import process, parseOptions
+from modules import profiling
+from modules.transformer import cut
+
+@pytest.fixture
+def profiler():
+  yield profiling.enable(cprofile = True)
+  profiling.disable()
+
+def test_profile_csv(tmp_path, profiler):
+  process(parseOptions(['-t', 'csv', '-o', str(tmp_path / 'out'), './test/data/csv']))
+  report = profiler.save(str(tmp_path / 'profile.json'), str(tmp_path / 'hot.prof'))
+
+  assert set(['read', 'split', 'write']) <= set(report['stages'])
+  assert report['stages']['read']['rows'] == 5
+  assert report['stages']['write']['calls'] == 3
+  assert report['stages']['write']['bytes'] > 0
+  assert report['hot_stage'] in report['stages']
+  with open(tmp_path / 'profile.json') as ifp:
+    assert json.load(ifp)['stages']['split']['seconds'] >= 0
+  pstats.Stats(str(tmp_path / 'hot.prof'))
+
+def test_profile_cut(tmp_path, profiler):
+  cut.process(cut.parseOptions(['-g', './data/dummy.012', '-p', './data/dummy.012.pos',
+                                '-i', './data/dummy.012.indv', '-o', str(tmp_path / 'out')]))
+  report = profiler.report()
+  assert report['stages']['parse']['rows'] == 12
+  assert report['stages']['split']['rows'] == 10
+  assert report['stages']['split']['columns'] == 12
+  assert report['stages']['split']['rows_per_second'] > 0
+
+def test_profile_disabled():
+  with profiling.stage('read') as stage:
+    stage.rows = 1
+
+@pytest.mark.skipif(profiling.peak_rss() is None, reason = "peak memory is not available on this platform")
+def test_profile_peak_rss(profiler):
+  # Go past whatever peak the tests before this one reached
+  with profiling.stage('allocate'):
+    data = b'x' * (profiling.peak_rss() + (64 << 20))
+  del data
+  # The peak set by an earlier stage is not attributed to later ones
+  with profiling.stage('idle'):
+    pass
+  report = profiler.report()
+  assert report['stages']['allocate']['peak_rss_increase'] >= 32 << 20
+  assert report['stages']['idle']['peak_rss_increase'] < 32 << 20
+  assert report['peak_rss'] >= report['stages']['allocate']['peak_rss_increase']
@@ -0,0 +1,52 @@
+"""
+Unit tester module for verifying the transformer registry
+"""
+import os
+import subprocess
+import sys
+import pytest
+from modules import transformer as transformers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_available():
+  names = transformers.available()
+  for name in ['csv', 'csv_a', 'cut', 'vcf_a']:
+    assert name in names
+
+def test_load():
+  module = transformers.load('csv')
+  assert callable(module.process)
+  with pytest.raises(Exception):
+    transformers.load('not_a_transformer')
+
+def test_help_does_not_import_pandas(tmp_path):
+  # Run from another directory to make sure that lookups do not depend on cwd
+  code = ("import sys; sys.argv = ['main.py', '--help']; import main\n"
+          "try:\n  main.parseOptions()\nexcept SystemExit:\n  pass\n"
+          "assert 'pandas' not in sys.modules")
+  env = dict(os.environ, PYTHONPATH = ROOT)
+  result = subprocess.run([sys.executable, '-c', code], cwd = tmp_path, env = env, capture_output = True)
+  assert result.returncode == 0, result.stderr.decode()
+
+def test_outputs_protocols():
+  import types
+  import pandas as pd
+  from main import parseOptions
+  args = parseOptions(['-t', 'csv', './test/data/csv'])
+  frame = pd.DataFrame({ 'x': [1] })
+  # Transformers that return a dict of entries are handed over one at a time
+  legacy = types.SimpleNamespace(process = lambda args: { 'a': { 'filename': 'a.csv', 'data': frame } })
+  assert [ f for f, _ in transformers.outputs(legacy, args) ] == ['a.csv']
+  # Generators are passed through as they are
+  lazy = types.SimpleNamespace(process = lambda args: (pair for pair in [('b.csv', frame)]))
+  assert [ f for f, _ in transformers.outputs(lazy, args) ] == ['b.csv']
+  # Transformers that write their own output
+  assert transformers.outputs(types.SimpleNamespace(process = lambda args: None), args) is None
+  # Streamed outputs match the dict form
+  csv = transformers.load('csv')
+  expected = { output['filename']: output['data'] for output in csv.process(args).values() }
+  streamed = dict(transformers.outputs(csv, args))
+  assert list(streamed) == list(expected)
+  for filename in expected:
+    pd.testing.assert_frame_equal(streamed[filename], expected[filename])
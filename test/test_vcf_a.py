@@ -0,0 +1,14 @@
+"""
+Unit tester module for verifying the vcf_a transformer
+"""
+from main import parseOptions
+from modules.transformer import vcf_a
+
+def test_positions_outnumber_genotypes(tmp_path, monkeypatch):
+  (tmp_path / 'in.012.pos').write_text('Chr_01\t10\nChr_01\t20\nChr_02\t10\nChr_02\t20\n')
+  (tmp_path / 'in.012').write_text('0\t1\t2\n1\t0\t1\n')
+  # The interleaved lines are written to the working directory
+  monkeypatch.chdir(tmp_path)
+  vcf_a.process(parseOptions(['-t', 'vcf_a', '--vcf_input', 'in.012', 'in.012.pos']))
+  # Positions without a genotype line are kept, with nothing next to them
+  assert (tmp_path / '.tmpdf').read_text() == 'Chr_01\t10\t0\t1\t2' + 'Chr_01\t20\t1\t0\t1' + 'Chr_02\t10\t' + 'Chr_02\t20\t'
@@ -0,0 +1,42 @@
+"""
+Unit tester module for verifying the output writers
+"""
+import pytest
+import pandas as pd
+from modules import writers
+
+
+@pytest.fixture(scope='module')
+def data_split():
+  df = pd.DataFrame({ 'Pedigree': ['A', 'B', 'C'],
+                      'weight': [1.5, float('nan'), 3.25],
+                      'height': [10.0, 20.0, float('nan')] })
+  return df.set_index('Pedigree')
+
+def test_output_filename():
+  assert writers.output_filename('FL_2006.csv', 'csv') == 'FL_2006.csv'
+  assert writers.output_filename('FL_2006.csv', 'csv.gz') == 'FL_2006.csv.gz'
+  assert writers.output_filename('FL_2006.csv', 'parquet') == 'FL_2006.parquet'
+  assert writers.output_filename('FL_2006.csv', 'feather') == 'FL_2006.feather'
+
+def test_unknown_format():
+  with pytest.raises(Exception):
+    writers.check_format('xlsx')
+
+@pytest.mark.parametrize('fmt', ['csv', 'csv.gz', 'csv.zst'])
+def test_write_csv(tmp_path, data_split, fmt):
+  if fmt == 'csv.zst':
+    pytest.importorskip('zstandard')
+  path = writers.write(data_split, tmp_path, 'FL_2006.csv', fmt)
+  result = pd.read_csv(path, index_col = 'Pedigree', float_precision = 'round_trip')
+  pd.testing.assert_frame_equal(result, data_split)
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+def test_write_columnar(tmp_path, data_split, fmt):
+  pytest.importorskip('pyarrow')
+  path = writers.write(data_split, tmp_path, 'FL_2006.csv', fmt)
+  if fmt == 'parquet':
+    result = pd.read_parquet(path)
+  else:
+    result = pd.read_feather(path).set_index('Pedigree')
+  pd.testing.assert_frame_equal(result, data_split, check_index_type = False)